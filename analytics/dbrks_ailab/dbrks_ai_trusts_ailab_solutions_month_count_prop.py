@@ -20,9 +20,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -57,8 +55,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_ailab_solutions_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
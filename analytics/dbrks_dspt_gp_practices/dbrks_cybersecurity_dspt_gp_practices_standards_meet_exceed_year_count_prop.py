@@ -22,9 +22,7 @@ VERSION:        0.0.2
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -58,8 +56,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_dspt_gp_practices_historical_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -69,16 +67,15 @@ source_path = config_JSON['pipeline']['project']['source_path']
 source_file = config_JSON['pipeline']['project']['source_file']
 reference_source_path = config_JSON['pipeline']['project']['reference_source_path']
 reference_source_file = config_JSON['pipeline']['project']['reference_source_file']
-sink_path = config_JSON['pipeline']['project']['databricks'][0]['sink_path']
-sink_file = config_JSON['pipeline']['project']['databricks'][0]['sink_file']
+sink_path = pipeline_config.notebook("dbrks_cybersecurity_dspt_gp_practices_standards_meet_exceed_year_count_prop").sink_path
+sink_file = pipeline_config.notebook("dbrks_cybersecurity_dspt_gp_practices_standards_meet_exceed_year_count_prop").sink_file
 
 # COMMAND ----------
 
 # Ingestion and processing of numerator (DSPT status of GP practices)
 # -------------------------------------------------------------------------
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
-file = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
-df = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
 df["Snapshot_Date"] = pd.to_datetime(df["Snapshot_Date"])
 
 # COMMAND ----------
@@ -86,8 +83,7 @@ df["Snapshot_Date"] = pd.to_datetime(df["Snapshot_Date"])
 # Ingestion and joining to reference deomintator data (NHS Digital: Number of registered GP Practices)
 # ---------------------------------------------------------------------------------------------------
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, reference_source_path)
-file = datalake_download(CONNECTION_STRING, file_system, reference_source_path+latestFolder, reference_source_file)
-df_ref = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df_ref = datalake_read_parquet(CONNECTION_STRING, file_system, reference_source_path+latestFolder, reference_source_file)
 
 # Processing - merge denominator ("ground-truth for practices") and numerator ("DSPT status"). Left join (anything not found in denominator dropped.)
 # ---------------------------------------------------------------------------------------------------------------------------------------------------
@@ -21,9 +21,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -57,8 +55,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_dspt_gp_practices_snapshot_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -68,8 +66,8 @@ source_path = config_JSON['pipeline']['project']['source_path']
 source_file = config_JSON['pipeline']['project']['source_file']
 reference_source_path = config_JSON['pipeline']['project']['reference_source_path']
 reference_source_file = config_JSON['pipeline']['project']['reference_source_file']
-sink_path = config_JSON['pipeline']['project']['databricks'][2]['sink_path']
-sink_file = config_JSON['pipeline']['project']['databricks'][2]['sink_file']
+sink_path = pipeline_config.notebook("dbrks_cybersecurity_dspt_gp_practices_standards_nosubmission_month_count_prop").sink_path
+sink_file = pipeline_config.notebook("dbrks_cybersecurity_dspt_gp_practices_standards_nosubmission_month_count_prop").sink_file
 
 # COMMAND ----------
 
@@ -86,8 +84,7 @@ df_1 = df_1.rename(columns = {'Status': 'Latest Status'})
 # Ingestion and joining to reference deomintator data (NHS Digital: Number of registered GP Practices)
 # ---------------------------------------------------------------------------------------------------
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, reference_source_path)
-file = datalake_download(CONNECTION_STRING, file_system, reference_source_path+latestFolder, reference_source_file)
-df_ref = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df_ref = datalake_read_parquet(CONNECTION_STRING, file_system, reference_source_path+latestFolder, reference_source_file)
 df_ref["EXTRACT_DATE"] = pd.to_datetime(df_ref["EXTRACT_DATE"])
 df_ref_2 = df_ref.loc[df_ref['EXTRACT_DATE'] == df_ref['EXTRACT_DATE'].max()].reset_index(drop = True)
 
@@ -21,9 +21,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -57,8 +55,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_dspt_nhs_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -68,8 +66,8 @@ source_file = config_JSON['pipeline']['project']['source_file']
 reference_path = config_JSON['pipeline']['project']['reference_path']
 reference_file = config_JSON['pipeline']['project']['reference_file']
 file_system = config_JSON['pipeline']['adl_file_system']
-sink_path = config_JSON['pipeline']['project']['databricks'][1]['sink_path']
-sink_file = config_JSON['pipeline']['project']['databricks'][1]['sink_file']
+sink_path = pipeline_config.notebook("dbrks_cybersecurity_dspt_nhs_csu_ccg_standards_month_count_prop").sink_path
+sink_file = pipeline_config.notebook("dbrks_cybersecurity_dspt_nhs_csu_ccg_standards_month_count_prop").sink_file
 
 # COMMAND ----------
 
@@ -78,9 +76,8 @@ sink_file = config_JSON['pipeline']['project']['databricks'][1]['sink_file']
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
 reference_latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, reference_path)
 file = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
-reference_file = datalake_download(CONNECTION_STRING, file_system, reference_path+reference_latestFolder, reference_file)
 DSPT_df = pd.read_csv(io.BytesIO(file))
-ODS_code_df = pd.read_parquet(io.BytesIO(reference_file), engine="pyarrow")
+ODS_code_df = datalake_read_parquet(CONNECTION_STRING, file_system, reference_path+reference_latestFolder, reference_file)
 
 # Make all ODS codes in DSPT dataframe capital
 # -------------------------------------------------------------------------
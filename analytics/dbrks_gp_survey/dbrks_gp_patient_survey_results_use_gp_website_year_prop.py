@@ -21,9 +21,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -58,8 +56,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_gp_patient_survey_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -68,17 +66,16 @@ config_JSON = json.loads(io.BytesIO(config_JSON).read())
 source_path = config_JSON['pipeline']['project']['source_path']
 source_file = config_JSON['pipeline']['project']['source_file']
 file_system = config_JSON['pipeline']['adl_file_system']
-sink_path = config_JSON['pipeline']['project']['databricks'][2]['sink_path']
-sink_file = config_JSON['pipeline']['project']['databricks'][2]['sink_file']  
+sink_path = pipeline_config.notebook("dbrks_gp_patient_survey_results_use_gp_website_year_prop").sink_path
+sink_file = pipeline_config.notebook("dbrks_gp_patient_survey_results_use_gp_website_year_prop").sink_file  
 
 # COMMAND ----------
 
 # Processing
 # -------------------------------------------------------------------------
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
-file = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
 fields = ['Date', 'Practice code', 'M092_denominator', 'M092_numerator_M093_denominator']
-df = pd.read_parquet(io.BytesIO(file), engine="pyarrow", columns=fields)
+df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file, columns=fields)
 df1 = df.rename(columns = {'M092_denominator': 'Total number of responses', 'M092_numerator_M093_denominator': 'Number of patients reporting having tried to use their GP practices website'})
 df1['Number of patients reporting having tried to use their GP practices website'].loc[df1['Number of patients reporting having tried to use their GP practices website'] < 0] = np.nan 
 df1['Percent of patients reporting having tried to use their GP practices website'] = df1['Number of patients reporting having tried to use their GP practices website']/df1['Total number of responses']
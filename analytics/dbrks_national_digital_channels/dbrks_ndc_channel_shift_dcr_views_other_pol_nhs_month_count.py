@@ -21,9 +21,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -57,8 +55,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_national_digital_channels_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -68,22 +66,20 @@ source_path = config_JSON['pipeline']['project']['source_path']
 source_file = config_JSON['pipeline']['project']["source_file_daily"]
 reference_source_path = config_JSON['pipeline']['project']["reference_source_path_pomi"]
 reference_source_file = config_JSON['pipeline']['project']["reference_source_file_pomi"]
-sink_path = config_JSON['pipeline']['project']['databricks'][39]['sink_path']
-sink_file = config_JSON['pipeline']['project']['databricks'][39]['sink_file']  
+sink_path = pipeline_config.notebook("dbrks_ndc_channel_shift_dcr_views_other_pol_nhs_month_count").sink_path
+sink_file = pipeline_config.notebook("dbrks_ndc_channel_shift_dcr_views_other_pol_nhs_month_count").sink_file  
 
 # COMMAND ----------
 
 # Ingestion of numerator data (NHS app performance data)
 # ---------------------------------------------------------------------------------------------------
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
-file = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
-df = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file, columns=["Daily", "RecordViewsDCR"])
 
 # Ingestion of reference deomintator data (POMI)
 # ---------------------------------------------------------------------------------------------------
 ref_latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, reference_source_path)
-file = datalake_download(CONNECTION_STRING, file_system, reference_source_path+ref_latestFolder, reference_source_file)
-df_ref = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df_ref = datalake_read_parquet(CONNECTION_STRING, file_system, reference_source_path+ref_latestFolder, reference_source_file, columns=["Report_Period_End", "Field", "Value"], filters=[("Field", "==", "Pat_DetCodeRec_Use")])
 
 # COMMAND ----------
 
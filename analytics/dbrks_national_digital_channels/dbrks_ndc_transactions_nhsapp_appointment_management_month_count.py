@@ -21,9 +21,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -57,8 +55,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_national_digital_channels_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -67,19 +65,17 @@ file_system = config_JSON['pipeline']['adl_file_system']
 source_path = config_JSON['pipeline']['project']['source_path']
 source_file = config_JSON['pipeline']['project']["source_file_monthly"]
 source_file_1 = config_JSON['pipeline']['project']["source_file_daily"]
-sink_path = config_JSON['pipeline']['project']['databricks'][27]['sink_path']
-sink_file = config_JSON['pipeline']['project']['databricks'][27]['sink_file']  
+sink_path = pipeline_config.notebook("dbrks_ndc_transactions_nhsapp_appointment_management_month_count").sink_path
+sink_file = pipeline_config.notebook("dbrks_ndc_transactions_nhsapp_appointment_management_month_count").sink_file  
 
 # COMMAND ----------
 
 # Ingestion of numerator data (Monthly)
 # ---------------------------------------------------------------------------------------------------
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
-file = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
-df = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file, columns=["Monthly", "PKB_appointments", "manageYourReferral"])
 
-file_1 = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file_1)
-df_daily = pd.read_parquet(io.BytesIO(file_1), engine="pyarrow")
+df_daily = datalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file_1)
 
 # COMMAND ----------
 
@@ -22,9 +22,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.* geopandas shapely geopandas shapely 
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -43,15 +41,8 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from azure.storage.filedatalake import DataLakeServiceClient
-import requests
 from urllib.request import urlopen
 from urllib import request as urlreq
-from bs4 import BeautifulSoup
-import geojson
-import geopandas as gpd
-from shapely.geometry import Point, Polygon, shape
-from shapely import wkb, wkt
-import shapely.speedups
 shapely.speedups.enable()
 # Connect to Azure datalake
 # -------------------------------------------------------------------------
@@ -69,8 +60,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/reference_tables/"
 file_name_config = "config_shapefiles.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -21,9 +21,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -58,8 +56,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_digitalrecords_socialcare_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -78,8 +76,7 @@ sink_file = config_JSON['pipeline']['project']['sink_file']
 # Numerator Processing
 # -------------------------------------------------------------------------
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
-file = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
-df = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
 df_1 = df[["Location ID", "Location Status", "PIR submission date", "Use a Digital Social Care Record system?"]]
 df_1['PIR submission date'] = pd.to_datetime(df_1['PIR submission date']).dt.strftime('%Y-%m')
 df_2 = df_1[~df_1.duplicated(['Location ID', 'Use a Digital Social Care Record system?'])].reset_index(drop = True)
@@ -92,8 +89,7 @@ df_4 = df_4.rename(columns = {'PIR submission date': 'Date', 'sum': 'Cummulative
 # Denom Processing
 # -------------------------------------------------------------------------
 latestFolder_denom = datalake_latestFolder(CONNECTION_STRING, file_system, denom_source_path)
-file = datalake_download(CONNECTION_STRING, file_system, denom_source_path+latestFolder_denom, denom_source_file)
-df_ref = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df_ref = datalake_read_parquet(CONNECTION_STRING, file_system, denom_source_path+latestFolder_denom, denom_source_file)
 df_ref_1 = df_ref[['Location CQC ID ', 'Dormant (Y/N)','Date']]
 df_ref_2= df_ref_1[df_ref_1['Dormant (Y/N)'] == 'N'].reset_index(drop = True)
 df_ref_3=df_ref_2.groupby('Date').count().reset_index().drop(columns = 'Dormant (Y/N)')
@@ -22,9 +22,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.* xlsxwriter
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -39,7 +37,6 @@ import json
 
 # 3rd party:
 import pandas as pd
-import xlsxwriter
 import numpy as np
 from pathlib import Path
 from azure.storage.filedatalake import DataLakeServiceClient
@@ -60,8 +57,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_toc_messages_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -71,15 +68,14 @@ source_path = config_JSON['pipeline']['project']['source_path']
 source_file = config_JSON['pipeline']['project']['source_file']
 denominator_source_path = config_JSON['pipeline']['project']['M30B_denominator_source_path']
 denominator_source_file = config_JSON['pipeline']['project']['M30B_denominator_source_file']
-sink_path = config_JSON['pipeline']['project']['databricks'][6]['sink_path']
-sink_file = config_JSON['pipeline']['project']['databricks'][6]['sink_file']
+sink_path = pipeline_config.notebook("dbrks_toc_messages_data_to_send").sink_path
+sink_file = pipeline_config.notebook("dbrks_toc_messages_data_to_send").sink_file
 
 # COMMAND ----------
 
 #Processing No. transfer of care digital messages sent to GPs (all use cases) (M030A)
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
-file = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
-df = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file, columns=['_time', 'workflow', 'senderOdsCode', 'recipientOdsCode'])
 df1 = df[['_time', 'workflow', 'senderOdsCode', 'recipientOdsCode']]
 df1 = df1[df1['workflow'].str.contains('ACK')].reset_index(drop = True)
 df1['Count'] = 1
@@ -105,8 +101,7 @@ df_M030A = df4.copy()
 
 #Denominator data ingestion and processing
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, denominator_source_path)
-file = datalake_download(CONNECTION_STRING, file_system, denominator_source_path+latestFolder, denominator_source_file)
-df_denom = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df_denom = datalake_read_parquet(CONNECTION_STRING, file_system, denominator_source_path+latestFolder, denominator_source_file, columns=['Discharge_Date', 'APC_Distcharges'])
 df_denom_1 = df_denom.groupby(df_denom['Discharge_Date'].dt.strftime('%Y-%m'))['APC_Distcharges'].sum().reset_index()
 
 #Numerator data ingestion and processing
@@ -20,9 +20,7 @@ VERSION:        0.0.2
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -57,8 +55,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_toc_messages_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -68,8 +66,8 @@ source_path = config_JSON['pipeline']['project']['source_path']
 source_file = config_JSON['pipeline']['project']['source_file']
 denominator_source_path = config_JSON['pipeline']['project']['M30B_denominator_source_path']
 denominator_source_file = config_JSON['pipeline']['project']['M30B_denominator_source_file']
-sink_path = config_JSON['pipeline']['project']['databricks'][3]['sink_path']
-sink_file = config_JSON['pipeline']['project']['databricks'][3]['sink_file']  
+sink_path = pipeline_config.notebook("dbrks_toc_messages_provider_sent_admitted_patient_month_prop").sink_path
+sink_file = pipeline_config.notebook("dbrks_toc_messages_provider_sent_admitted_patient_month_prop").sink_file  
 
 # COMMAND ----------
 
@@ -77,15 +75,13 @@ sink_file = config_JSON['pipeline']['project']['databricks'][3]['sink_file']
 #------------------------------------------
 #Denominator data ingestion and processing
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, denominator_source_path)
-file = datalake_download(CONNECTION_STRING, file_system, denominator_source_path+latestFolder, denominator_source_file)
-df_denom = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df_denom = datalake_read_parquet(CONNECTION_STRING, file_system, denominator_source_path+latestFolder, denominator_source_file)
 df_denom['Provider_Code'] = df_denom['Provider_Code'].str[:3]  #------ Only retain the first three characters of the NHS Trust Site ODS code, to equate it to the NHS Trust ODS code
 df_denom_1 = df_denom.groupby([df_denom['Discharge_Date'].dt.strftime('%Y-%m'), 'Provider_Code'])['APC_Distcharges'].sum().reset_index()
 
 #Numerator data ingestion and processing
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
-file = datalake_download(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
-df = pd.read_parquet(io.BytesIO(file), engine="pyarrow")
+df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file)
 df1 = df[['_time', 'workflow','recipientOdsCode']]
 df1 = df1[df1['workflow'].str.contains('TOC_FHIR_IP_DISCH_ACK')].reset_index(drop = True)
 df1['Count'] = 1
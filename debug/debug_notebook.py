@@ -22,9 +22,7 @@ VERSION:        0.0.2
 
 # COMMAND ----------
 
-# Install libs
-# -----------------------------------------------------
-%pip install pandas pathlib azure-storage-file-datalake
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -0,0 +1,192 @@
+# Databricks notebook source
+#!/usr/bin python3
+
+# -------------------------------------------------------------------------
+# Copyright (c) 2022 NHS England and NHS Improvement. All rights reserved.
+# Licensed under the MIT License. See license.txt in the project root for
+# license information.
+# -------------------------------------------------------------------------
+
+"""
+FILE:           dbrks_bootstrap.py
+DESCRIPTION:
+                Sets up the Python environment for pipeline notebooks: checks the pinned
+                libraries once per cluster and provides the heavier libraries as lazy imports
+USAGE:
+                # MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
+CONTRIBUTORS:   Craig Shenton, Mattia Ficarelli
+CONTACT:        data@nhsx.nhs.uk
+CREATED:        18 Oct. 2022
+VERSION:        0.0.1
+"""
+
+# COMMAND ----------
+
+# Imports
+# -------------------------------------------------------------------------
+# Python:
+import os
+import sys
+import time
+import types
+import fcntl
+import fnmatch
+import hashlib
+import tempfile
+import importlib
+import subprocess
+import importlib.metadata
+
+# COMMAND ----------
+
+# Environment
+# -------------------------------------------------------------------------
+# Checked once per cluster. Missing libraries are pip installed; a pinned
+# library installed at another version has the pinned version installed into a
+# cluster-wide directory that goes ahead of site-packages on sys.path.
+BOOTSTRAP_REQUIREMENTS = [
+    "aiohttp",
+    "azure-storage-file-datalake",
+    "beautifulsoup4",
+    "dateparser",
+    "geojson==2.5.*",
+    "geopandas",
+    "lxml",
+    "numpy",
+    "openpyxl",
+    "pandas",
+    "pyarrow==5.0.*",
+    "python-dateutil",
+    "regex",
+    "requests",
+    "shapely",
+    "tabulate",
+    "urllib3",
+    "xlrd",
+    "xlsxwriter",
+]
+
+# Timings live in a module in sys.modules so they survive repeated %run
+_bootstrap_state = sys.modules.get("dbrks_bootstrap_state")
+if _bootstrap_state is None:
+    _bootstrap_state = types.ModuleType("dbrks_bootstrap_state")
+    _bootstrap_state.import_times = {}
+    sys.modules["dbrks_bootstrap_state"] = _bootstrap_state
+
+def _bootstrap_dir():
+    # /local_disk0 is the driver's local SSD on Databricks clusters
+    root = "/local_disk0/tmp" if os.path.isdir("/local_disk0") else tempfile.gettempdir()
+    return os.path.join(root, "dbrks_bootstrap")
+
+def _installed_version(requirement):
+    try:
+        return importlib.metadata.version(requirement.partition("==")[0])
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+def _version_mismatches(requirements):
+    mismatches = []
+    for requirement in requirements:
+        version = requirement.partition("==")[2]
+        installed = _installed_version(requirement)
+        if installed is not None and version and not fnmatch.fnmatch(installed, version):
+            mismatches.append((requirement, installed))
+    return mismatches
+
+def _module_name(requirement):
+    return requirement.partition("==")[0].replace("-", "_")
+
+def _stale_modules(requirements, pinned_dir):
+    # pinned libraries this process imported before their pinned version was on sys.path
+    stale = []
+    for requirement in requirements:
+        module = sys.modules.get(_module_name(requirement))
+        if module is None or not os.path.isdir(os.path.join(pinned_dir, _module_name(requirement))):
+            continue
+        if not os.path.abspath(getattr(module, "__file__", None) or "").startswith(pinned_dir + os.sep):
+            stale.append(requirement)
+    return stale
+
+def bootstrap_environment(requirements=BOOTSTRAP_REQUIREMENTS):
+    start = time.perf_counter()
+    directory = _bootstrap_dir()
+    os.makedirs(directory, exist_ok=True)
+    key = hashlib.sha256("\n".join(sorted(requirements)).encode("utf-8")).hexdigest()
+    marker = os.path.join(directory, key + ".ok")
+    pinned_dir = os.path.join(directory, key)
+    if not os.path.exists(marker):
+        with open(os.path.join(directory, "install.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(marker):
+                mismatches = [requirement for requirement, installed in _version_mismatches(requirements)]
+                if mismatches:
+                    # the cluster's own dependencies stay as they are
+                    print("Installing {} for this cluster".format(" ".join(mismatches)))
+                    subprocess.check_call([sys.executable, "-m", "pip", "install", "--quiet", "--no-deps", "--target", pinned_dir] + mismatches)
+                missing = [requirement for requirement in requirements if _installed_version(requirement) is None]
+                if missing:
+                    print("Installing {}".format(" ".join(missing)))
+                    subprocess.check_call([sys.executable, "-m", "pip", "install", "--quiet"] + missing)
+                    importlib.invalidate_caches()
+                open(marker, "w").close()
+    if os.path.isdir(pinned_dir):
+        if pinned_dir not in sys.path:
+            sys.path.insert(0, pinned_dir)
+            importlib.invalidate_caches()
+        stale = _stale_modules(requirements, pinned_dir)
+        if stale:
+            raise ImportError("{} was imported before the bootstrap, run dbutils.library.restartPython() and %run the bootstrap first".format(
+                ", ".join(requirement.partition("==")[0] for requirement in stale)))
+    _bootstrap_state.import_times["(environment check)"] = time.perf_counter() - start
+
+# COMMAND ----------
+
+# Lazy imports
+# -------------------------------------------------------------------------
+# Heavy modules are imported on first use; names from inside a module, such as
+# BeautifulSoup, are imported by the notebooks that need them.
+def _timed_import(module_name):
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _bootstrap_state.import_times[module_name] = time.perf_counter() - start
+    return module
+
+class LazyModule(types.ModuleType):
+    def __init__(self, module_name):
+        super().__init__(module_name)
+        self.__dict__["_lazy_module_name"] = module_name
+
+    def __getattr__(self, name):
+        module = _timed_import(self._lazy_module_name)
+        # later lookups find the real attributes without coming through here
+        self.__dict__.update(module.__dict__)
+        try:
+            return getattr(module, name)
+        except AttributeError:
+            # submodules such as shapely.speedups
+            return _timed_import(self._lazy_module_name + "." + name)
+
+    def __dir__(self):
+        return dir(_timed_import(self._lazy_module_name))
+
+def bootstrap_importTimes():
+    """Seconds spent on the environment check and each lazy import, slowest first."""
+    return dict(sorted(_bootstrap_state.import_times.items(), key=lambda item: item[1], reverse=True))
+
+# COMMAND ----------
+
+# Bootstrap
+# -------------------------------------------------------------------------
+bootstrap_environment()
+
+requests = LazyModule("requests")
+geojson = LazyModule("geojson")
+gpd = LazyModule("geopandas")
+shapely = LazyModule("shapely")
+openpyxl = LazyModule("openpyxl")
+xlsxwriter = LazyModule("xlsxwriter")
+wkb = LazyModule("shapely.wkb")
+wkt = LazyModule("shapely.wkt")
@@ -0,0 +1,911 @@
+# Databricks notebook source
+#!/usr/bin python3
+
+# -------------------------------------------------------------------------
+# Copyright (c) 2021 NHS England and NHS Improvement. All rights reserved.
+# Licensed under the MIT License. See license.txt in the project root for
+# license information.
+# -------------------------------------------------------------------------
+
+"""
+FILE:           dbrks_datalake_io.py
+DESCRIPTION:
+                Datalake reads and writes, latest folders, batch transfers and input prefetch
+USAGE:
+                Run by dbrks_helper_functions; notebooks %run that instead
+CONTRIBUTORS:   Craig Shenton, Mattia Ficarelli
+CONTACT:        data@nhsx.nhs.uk
+CREATED:        18 Oct. 2022
+VERSION:        0.0.1
+"""
+
+
+# COMMAND ----------
+
+# Imports
+# -------------------------------------------------------------------------
+# Python:
+import io
+import os
+import re
+import time
+import asyncio
+import weakref
+import functools
+import contextvars
+import threading
+import collections
+import concurrent.futures
+from datetime import datetime
+
+# 3rd party:
+import pandas as pd
+import pyarrow as pa
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+# COMMAND ----------
+
+# Helper functions
+# -------------------------------------------------------------------------
+def datalake_download(CONNECTION_STRING, file_system, source_path, source_file):
+    backend = datalake_backend()
+    cache = datalake_cache()
+    path = source_path + "/" + source_file
+    record = _io_new("download", file_system, path)
+    with _io_track(record):
+        try:
+            if cache is None:
+                downloaded_bytes, etag = backend.download(CONNECTION_STRING, file_system, path)
+            else:
+                downloaded_bytes, record["cache"] = cache.fetch(CONNECTION_STRING, backend, file_system, path)
+        except FileNotFoundError:
+            _raise_if_store(CONNECTION_STRING, file_system, path)
+            raise
+    record["bytes"] = len(downloaded_bytes)
+    return downloaded_bytes
+
+def _raise_if_store(CONNECTION_STRING, file_system, path):
+    # an append store publishes a manifest of its partitions in place of the file
+    if _store_manifest(CONNECTION_STRING, file_system, _normalize_path(path)) is not None:
+        raise FileNotFoundError("{} is an append store, read it with datalake_read_parquet".format(path))
+
+class _MemoryviewWriter:
+    # Writable stream over a preallocated buffer
+    def __init__(self, view):
+        self.view = view
+        self.position = 0
+
+    def write(self, data):
+        n = len(data)
+        self.view[self.position:self.position + n] = data
+        self.position += n
+        return n
+
+class DatalakeFileReader(io.RawIOBase):
+    """
+    Seekable, read-only file object over a datalake file.
+    Each readinto() issues a ranged read for exactly the bytes requested and
+    writes them into the caller's buffer, so pandas and pyarrow can read from
+    it directly without the whole file being held as bytes first. Reads are
+    pinned to the ETag seen at open, so a file replaced mid-read raises
+    instead of returning a mix of two versions.
+    """
+    def __init__(self, CONNECTION_STRING, file_system, path, backend=None, record=None, timed=True):
+        super().__init__()
+        self._backend = backend or datalake_backend()
+        self._CONNECTION_STRING = CONNECTION_STRING
+        self._file_system = file_system
+        self._path = path
+        # reads add their bytes (and time, if timed) to the caller's I/O record
+        self._record = record if record is not None else _io_new("open", file_system, path)
+        self._timed = timed
+        with _io_track(self._record, timed=timed):
+            properties = self._backend.properties(CONNECTION_STRING, file_system, path)
+        self.size = properties.size
+        self.etag = properties.etag
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("invalid whence ({}, should be 0, 1 or 2)".format(whence))
+        if position < 0:
+            raise ValueError("negative seek position {}".format(position))
+        self._position = position
+        return self._position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        length = min(len(view), self.size - self._position)
+        if length <= 0:
+            return 0
+        with _io_track(self._record, timed=self._timed):
+            n = self._backend.read_into(
+                self._CONNECTION_STRING, self._file_system, self._path, self._position, view[:length], etag=self.etag
+            )
+        self._record["bytes"] += n
+        self._position += n
+        return n
+
+    def readall(self):
+        # fetch the remainder in one ranged request
+        buffer = bytearray(max(self.size - self._position, 0))
+        n = self.readinto(buffer)
+        del buffer[n:]
+        return bytes(buffer)
+
+def datalake_open(CONNECTION_STRING, file_system, source_path, source_file, buffer_size=4 * 1024 * 1024):
+    """
+    Open a datalake file for streaming reads, e.g.
+    pd.read_parquet(datalake_open(...)) or pd.read_csv(datalake_open(...)).
+    Small reads are served from a buffer of buffer_size bytes; large reads go
+    straight from storage into the caller's buffer.
+    """
+    try:
+        reader = DatalakeFileReader(CONNECTION_STRING, file_system, source_path + "/" + source_file)
+    except FileNotFoundError:
+        _raise_if_store(CONNECTION_STRING, file_system, source_path + "/" + source_file)
+        raise
+    return io.BufferedReader(reader, buffer_size=buffer_size)
+
+class DatalakeFileSystemHandler(pafs.FileSystemHandler):
+    """
+    Read-only pyarrow filesystem over one datalake file system. Files are
+    opened as DatalakeFileReader objects, so pyarrow fetches only the byte
+    ranges it asks for (parquet footer, selected column chunks, matching row
+    groups) rather than the whole file. Directories are listed through the
+    backend, so pyarrow datasets can read a folder of files. Every write or
+    delete raises PermissionError; write with datalake_upload or
+    datalake_openWriter instead.
+    """
+    def __init__(self, CONNECTION_STRING, file_system, record=None):
+        self.CONNECTION_STRING = CONNECTION_STRING
+        self.file_system = file_system
+        self.record = record
+
+    def get_type_name(self):
+        return "datalake"
+
+    def normalize_path(self, path):
+        return _normalize_path(path)
+
+    def _file_info(self, path):
+        try:
+            properties = datalake_backend().properties(self.CONNECTION_STRING, self.file_system, path)
+            return pafs.FileInfo(path, pafs.FileType.File, size=properties.size, mtime=properties.last_modified)
+        except FileNotFoundError:
+            pass
+        try:
+            datalake_backend().list_paths(self.CONNECTION_STRING, self.file_system, path, recursive=False)
+            return pafs.FileInfo(path, pafs.FileType.Directory)
+        except FileNotFoundError:
+            return pafs.FileInfo(path, pafs.FileType.NotFound)
+
+    def get_file_info(self, paths):
+        return [self._file_info(path) for path in paths]
+
+    def get_file_info_selector(self, selector):
+        try:
+            paths = datalake_backend().list_paths(self.CONNECTION_STRING, self.file_system, _normalize_path(selector.base_dir), recursive=selector.recursive)
+        except FileNotFoundError:
+            if selector.allow_not_found:
+                return []
+            raise
+        # files need their sizes, so their properties are fetched concurrently
+        files = [name for name, is_directory in paths if not is_directory]
+        infos = {info.path: info for info in _bounded_map(self._file_info, files, max_workers=8, ordered=False)}
+        return [infos[name] if not is_directory else pafs.FileInfo(name, pafs.FileType.Directory) for name, is_directory in paths]
+
+    def open_input_file(self, path):
+        reader = DatalakeFileReader(self.CONNECTION_STRING, self.file_system, path, record=self.record, timed=self.record is None)
+        return pa.PythonFile(reader, mode="r")
+
+    def open_input_stream(self, path):
+        return self.open_input_file(path)
+
+    def _read_only(self, *args):
+        raise PermissionError("DatalakeFileSystemHandler is read-only, write with datalake_upload or datalake_openWriter")
+
+    create_dir = delete_dir = delete_dir_contents = delete_root_dir_contents = _read_only
+    delete_file = move = copy_file = open_output_stream = open_append_stream = _read_only
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, DatalakeFileSystemHandler)
+            and other.CONNECTION_STRING == self.CONNECTION_STRING
+            and other.file_system == self.file_system
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+def datalake_read_parquet(CONNECTION_STRING, file_system, source_path, source_file, columns=None, filters=None):
+    """
+    Read a parquet file from the datalake into a pandas dataframe, fetching
+    only the footer, the requested columns and the row groups whose
+    statistics can match filters (pyarrow DNF, e.g. [("Field", "==", "Pat_Presc_Use")]).
+    An append store's published manifest is read as its partitions.
+    """
+    path = _normalize_path(source_path + "/" + source_file)
+    record = _io_new("read_parquet", file_system, path)
+    with _io_track(record):
+        # inputs prefetched by an orchestrator are already in memory
+        prefetched = _dbrks_state.prefetched.get((file_system, path))
+        if prefetched is not None:
+            record["cache"] = "prefetch"
+            table = _select_table(prefetched, columns, filters)
+            record["rows"] = table.num_rows
+            return table.to_pandas()
+        # a blob already in the driver cache at its current ETag is read locally
+        cache = datalake_cache()
+        cached_path = None
+        if cache is not None:
+            cached_path = cache.lookup(CONNECTION_STRING, datalake_backend(), file_system, path)
+        if cached_path is not None:
+            record["cache"] = "hit"
+            record["bytes"] = os.path.getsize(cached_path)
+            table = pq.read_table(cached_path, columns=columns, filters=filters, use_pandas_metadata=True)
+        else:
+            filesystem = pafs.PyFileSystem(DatalakeFileSystemHandler(CONNECTION_STRING, file_system, record))
+            try:
+                table = pq.read_table(path, filesystem=filesystem, columns=columns, filters=filters, use_pandas_metadata=True)
+            except FileNotFoundError:
+                manifest = _store_manifest(CONNECTION_STRING, file_system, path)
+                if manifest is None:
+                    raise
+                record["cache"] = "store"
+                df = _store_read(CONNECTION_STRING, file_system, manifest, columns, filters)
+                record["rows"] = len(df)
+                return df
+        record["rows"] = table.num_rows
+    return table.to_pandas()
+
+def datalake_parquetStatistics(CONNECTION_STRING, file_system, source_path, source_file, columns=None):
+    """
+    {column: {"min", "max", "null_count", "rows"}} over a parquet file's row
+    groups, read from its footer alone. min and max are None unless every
+    row group has statistics for the column.
+    """
+    path = _normalize_path(source_path + "/" + source_file)
+    record = _io_new("statistics", file_system, path)
+    with _io_track(record):
+        reader = DatalakeFileReader(CONNECTION_STRING, file_system, path, record=record, timed=False)
+        metadata = pq.ParquetFile(pa.PythonFile(reader, mode="r")).metadata
+    record["rows"] = metadata.num_rows
+    statistics = {}
+    for index in range(metadata.num_row_groups):
+        row_group = metadata.row_group(index)
+        for position in range(row_group.num_columns):
+            chunk = row_group.column(position)
+            if columns is not None and chunk.path_in_schema not in columns:
+                continue
+            entry = statistics.setdefault(chunk.path_in_schema, {"min": None, "max": None, "null_count": 0, "rows": 0, "complete": True})
+            entry["rows"] += row_group.num_rows
+            chunk_statistics = chunk.statistics
+            if chunk_statistics is None or not chunk_statistics.has_min_max:
+                entry["complete"] = False
+                continue
+            entry["null_count"] += chunk_statistics.null_count
+            entry["min"] = chunk_statistics.min if entry["min"] is None else min(entry["min"], chunk_statistics.min)
+            entry["max"] = chunk_statistics.max if entry["max"] is None else max(entry["max"], chunk_statistics.max)
+    for entry in statistics.values():
+        if not entry.pop("complete"):
+            entry["min"] = entry["max"] = None
+    return statistics
+
+def _statistics_range(value, statistics, logical_type=None):
+    # True/False if the footer's min and max settle whether value is present, else None
+    if statistics is None or statistics["min"] is None:
+        return None
+    try:
+        if _period_values([value], logical_type)[0] in _period_values([statistics["min"], statistics["max"]], logical_type):
+            return True
+    except (TypeError, ValueError):
+        pass
+    # only numbers and times keep their order in the statistics
+    def comparable(item):
+        if pd.api.types.is_bool(item) or isinstance(item, str):
+            return None
+        if pd.api.types.is_number(item):
+            return float(item)
+        try:
+            return pd.Timestamp(item)
+        except (TypeError, ValueError):
+            return None
+    low, high, key = comparable(statistics["min"]), comparable(statistics["max"]), comparable(value)
+    if None not in (low, high, key) and type(low) == type(key) and not low <= key <= high:
+        return False
+    return None
+
+def datalake_containsValue(CONNECTION_STRING, file_system, source_path, source_file, column, value):
+    """
+    Whether a parquet file's column holds value, settled from the footer's
+    statistics where they can: value equal to the column's min or max is
+    present, and a number or time outside that range is absent. Otherwise
+    only the column is read. For an append store's manifest, its periods
+    answer for the period column.
+    """
+    try:
+        statistics = datalake_parquetStatistics(CONNECTION_STRING, file_system, source_path, source_file, columns=[column])
+    except FileNotFoundError:
+        manifest = _store_manifest(CONNECTION_STRING, file_system, _normalize_path(source_path + "/" + source_file))
+        if manifest is None:
+            raise
+        if column == manifest["period_column"]:
+            logical_type = (manifest.get("schema") or {}).get(column)
+            return _period_values([value], logical_type)[0] in {period for partition in manifest["partitions"] for period in partition["periods"]}
+        statistics = {}
+    settled = _statistics_range(value, statistics.get(column))
+    if settled is not None:
+        return settled
+    df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path, source_file, columns=[column])
+    return bool(df[column].isin([value]).any()) or _period_values([value])[0] in set(_period_values(df[column]))
+
+def _count_rows(data):
+    # rows in an uploaded parquet file (from its footer) or CSV (less the header)
+    try:
+        if data[:4] == b"PAR1":
+            return pq.read_metadata(pa.BufferReader(data)).num_rows
+        return max(data.count(b"\n") - 1, 0)
+    except Exception:
+        return None
+
+def datalake_upload(file, CONNECTION_STRING, file_system, sink_path, sink_file):
+    data = file.getvalue()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    record = _io_new("upload", file_system, sink_path + "/" + sink_file)
+    _dbrks_state.prefetched.pop((file_system, _normalize_path(sink_path + "/" + sink_file)), None)
+    with _io_track(record):
+        datalake_backend().upload(CONNECTION_STRING, file_system, sink_path + "/" + sink_file, data)
+        datalake_updateLatest(CONNECTION_STRING, file_system, sink_path)
+    record["bytes"] = len(data)
+    record["rows"] = _count_rows(data)
+    return '200 OK'
+
+class DatalakeFileWriter(io.RawIOBase):
+    """
+    Writable file object that uploads to the datalake in fixed-size blocks.
+    Full blocks are sent concurrently while the caller keeps writing, with at
+    most max_concurrency blocks in flight, so memory stays at a few block
+    sizes however large the output. The file is committed on close() only;
+    leaving a with-block on an exception, or dropping the writer without
+    closing it, discards the staged blocks instead.
+    """
+    def __init__(self, CONNECTION_STRING, file_system, sink_path, sink_file, block_size=8 * 1024 * 1024, max_concurrency=4):
+        super().__init__()
+        self._CONNECTION_STRING = CONNECTION_STRING
+        self._file_system = file_system
+        self._sink_path = sink_path
+        self._backend = datalake_backend()
+        self._record = _io_new("upload", file_system, sink_path + "/" + sink_file)
+        _dbrks_state.prefetched.pop((file_system, _normalize_path(sink_path + "/" + sink_file)), None)
+        self._started = time.perf_counter()
+        with _io_track(self._record, timed=False):
+            self._upload = self._backend.start_upload(CONNECTION_STRING, file_system, sink_path + "/" + sink_file)
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._offset = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._futures = []
+        self.etag = None
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._offset + len(self._buffer)
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            self._send(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+        return len(data)
+
+    def _send(self, block):
+        self._slots.acquire()
+        future = self._executor.submit(self._append_block, self._offset, block)
+        future.add_done_callback(lambda f: self._slots.release())
+        self._futures.append(future)
+        self._offset += len(block)
+
+    def _append_block(self, offset, block):
+        with _io_track(self._record, timed=False):
+            self._backend.append_block(self._upload, offset, block)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._send(bytes(self._buffer))
+                self._buffer = bytearray()
+            with _io_track(self._record, timed=False):
+                for future in self._futures:
+                    future.result()
+                _io_check_cancelled()
+                self.etag = self._backend.commit_upload(self._upload, self._offset)
+                datalake_updateLatest(self._CONNECTION_STRING, self._file_system, self._sink_path)
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+            self._record["bytes"] = self._offset
+            self._record["seconds"] = time.perf_counter() - self._started
+            super().close()
+
+    def abort(self):
+        if self.closed:
+            return
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self._backend.abort_upload(self._upload)
+        super().close()
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        try:
+            self.abort()
+        except Exception as e:
+            # the caller's exception is the one to raise
+            print("could not discard {}: {}".format(self._record["path"], e))
+
+    def __del__(self):
+        # IOBase would close(), committing whatever was written so far
+        try:
+            self.abort()
+        except Exception:
+            pass
+
+def datalake_openWriter(CONNECTION_STRING, file_system, sink_path, sink_file, block_size=8 * 1024 * 1024, max_concurrency=4):
+    """
+    Open a datalake file for streaming writes, e.g.
+    with datalake_openWriter(...) as file_contents:
+        df.to_parquet(file_contents, engine="pyarrow")
+    """
+    return DatalakeFileWriter(CONNECTION_STRING, file_system, sink_path, sink_file, block_size, max_concurrency)
+
+# Latest folder manifest
+# -------------------------------------------------------------------------
+# Uploads into a dated folder record its name in a _LATEST object under the
+# prefix, and lookups trust it. Prefixes only written by other tools (e.g. ADF)
+# have no _LATEST and are listed instead.
+LATEST_MANIFEST = "_LATEST"
+LATEST_FOLDER_FORMAT = "%Y-%m-%d"
+
+if getattr(_dbrks_state, "latest_published", None) is None:
+    _dbrks_state.latest_published = {}
+
+def _parse_folder_date(folder):
+    try:
+        return datetime.strptime(folder, LATEST_FOLDER_FORMAT)
+    except ValueError:
+        return None
+
+def _split_dated_path(path):
+    # "proc/project/2022-06-01/" -> ("proc/project/", "2022-06-01")
+    parts = _normalize_path(path).rsplit("/", 1)
+    if len(parts) == 1:
+        return "", parts[0]
+    return parts[0] + "/", parts[1]
+
+def datalake_updateLatest(CONNECTION_STRING, file_system, sink_path, retries=10):
+    prefix, folder = _split_dated_path(sink_path)
+    if _parse_folder_date(folder) is None:
+        return None
+    key = (CONNECTION_STRING, file_system, prefix)
+    published = _dbrks_state.latest_published.get(key)
+    if published is not None and published >= folder:
+        return published + "/"
+    backend = datalake_backend()
+    manifest_path = prefix + LATEST_MANIFEST
+    # only replace the manifest we read, so racing uploads never move it backwards
+    for attempt in range(retries):
+        try:
+            manifest, etag = backend.download(CONNECTION_STRING, file_system, manifest_path)
+            current = manifest.decode("utf-8").strip().strip("/")
+            if _parse_folder_date(current) is not None and current >= folder:
+                _dbrks_state.latest_published[key] = current
+                return current + "/"
+            conditions = {"etag": etag}
+        except FileNotFoundError:
+            conditions = {"if_missing": True}
+        try:
+            backend.upload(CONNECTION_STRING, file_system, manifest_path, folder.encode("utf-8"), **conditions)
+            _dbrks_state.latest_published[key] = folder
+            return folder + "/"
+        except DatalakeConditionFailed:
+            continue
+    print("could not update {} for {}".format(LATEST_MANIFEST, sink_path))
+    return None
+
+def _listed_latestFolder(CONNECTION_STRING, file_system, source_path):
+    folders = []
+    for name, is_directory in datalake_backend().list_paths(CONNECTION_STRING, file_system, source_path, recursive=False):
+        folder = name.replace(source_path.strip("/"), "").lstrip("/").rsplit("/", 1)[0]
+        if is_directory and _parse_folder_date(folder) is not None:
+            folders.append(folder)
+    return max(folders) if folders else None
+
+def datalake_latestFolder(CONNECTION_STRING, file_system, source_path, use_manifest=True):
+    """
+    Returns the latest dated folder under source_path, e.g. "2022-06-01/",
+    from its _LATEST manifest, listing the folders only when the manifest is
+    missing or does not name one. Raises FileNotFoundError if there is none.
+    """
+    record = _io_new("latest_folder", file_system, source_path)
+    with _io_track(record):
+        if use_manifest:
+            try:
+                manifest, etag = datalake_backend().download(CONNECTION_STRING, file_system, source_path + "/" + LATEST_MANIFEST)
+                latest = manifest.decode("utf-8").strip().strip("/")
+                if _parse_folder_date(latest) is not None:
+                    record["cache"] = "manifest"
+                    return latest + "/"
+            except FileNotFoundError:
+                pass
+        record["cache"] = "listing"
+        latest = _listed_latestFolder(CONNECTION_STRING, file_system, source_path)
+        if latest is None:
+            raise FileNotFoundError("no dated folder under {}".format(source_path))
+        return latest + "/"
+
+# COMMAND ----------
+
+# Batch transfers
+# -------------------------------------------------------------------------
+# Downloads or uploads on a bounded thread pool, with at most 2 x max_workers
+# results in flight.
+def _bounded_map(function, items, max_workers, ordered):
+    items = iter(items)
+    window = max_workers * 2
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(contextvars.copy_context().run, function, item))
+                if len(pending) < window:
+                    continue
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, not_done = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                        yield future.result()
+            if ordered:
+                while pending:
+                    yield pending.popleft().result()
+            else:
+                for future in concurrent.futures.as_completed(list(pending)):
+                    pending.remove(future)
+                    yield future.result()
+        finally:
+            # caller stopped early or a transfer failed: drop what has not started
+            for future in pending:
+                future.cancel()
+
+def datalake_download_many(CONNECTION_STRING, file_system, source_path, source_files, max_workers=8, ordered=False):
+    """
+    Download source_files from source_path concurrently, yielding
+    (source_file, bytes) as each finishes, or in input order if ordered=True.
+    """
+    def download(source_file):
+        return source_file, datalake_download(CONNECTION_STRING, file_system, source_path, source_file)
+    return _bounded_map(download, source_files, max_workers, ordered)
+
+def datalake_upload_many(files, CONNECTION_STRING, file_system, sink_path, max_workers=8, ordered=False):
+    """
+    Upload (file_contents, sink_file) pairs to sink_path concurrently, yielding
+    (sink_file, status) as each finishes, or in input order if ordered=True.
+    """
+    def upload(item):
+        file_contents, sink_file = item
+        return sink_file, datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path, sink_file)
+    return _bounded_map(upload, files, max_workers, ordered)
+
+# COMMAND ----------
+
+# Asyncio helpers
+# -------------------------------------------------------------------------
+# Coroutine counterparts of the datalake helpers, so a notebook can overlap
+# its input fetches instead of waiting on each in turn. On Azure with aiohttp
+# installed they use the aio clients, one service client per connection string
+# and event loop; otherwise blocking methods run on the loop's thread pool.
+# From ordinary notebook code use datalake_gather(), e.g.
+#   df, df_ref = datalake_gather(
+#       adatalake_read_parquet(CONNECTION_STRING, file_system, source_path+latestFolder, source_file),
+#       adatalake_read_parquet(CONNECTION_STRING, file_system, reference_source_path+ref_latestFolder, reference_source_file),
+#   )
+if getattr(_dbrks_state, "async_clients", None) is None:
+    _dbrks_state.async_clients = weakref.WeakKeyDictionary()
+
+def _async_fileSystemClient(CONNECTION_STRING, file_system):
+    service_clients = _dbrks_state.async_clients.setdefault(asyncio.get_running_loop(), {})
+    service_client = service_clients.get(CONNECTION_STRING)
+    if service_client is None:
+        service_client = AsyncDataLakeServiceClient.from_connection_string(CONNECTION_STRING, raw_response_hook=_io_response_hook)
+        service_clients[CONNECTION_STRING] = service_client
+    return service_client.get_file_system_client(file_system=file_system)
+
+async def adatalake_closeClients():
+    # Close the aio clients opened on the running loop
+    service_clients = _dbrks_state.async_clients.pop(asyncio.get_running_loop(), {})
+    for service_client in service_clients.values():
+        try:
+            await service_client.close()
+        except Exception as e:
+            print(e)
+
+async def _arun(function, *args, **kwargs):
+    # blocking call on the loop's thread pool, keeping the caller's I/O record
+    call = functools.partial(contextvars.copy_context().run, function, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(None, call)
+
+async def _abackend(backend, method, *args, **kwargs):
+    if getattr(backend, "has_async", False):
+        return await getattr(backend, "a" + method)(*args, **kwargs)
+    return await _arun(getattr(backend, method), *args, **kwargs)
+
+async def adatalake_download(CONNECTION_STRING, file_system, source_path, source_file):
+    backend = datalake_backend()
+    cache = datalake_cache()
+    path = source_path + "/" + source_file
+    record = _io_new("download", file_system, path)
+    with _io_track(record):
+        try:
+            if cache is None:
+                downloaded_bytes, etag = await _abackend(backend, "download", CONNECTION_STRING, file_system, path)
+            else:
+                downloaded_bytes, record["cache"] = await cache.afetch(CONNECTION_STRING, backend, file_system, path)
+        except FileNotFoundError:
+            await _arun(_raise_if_store, CONNECTION_STRING, file_system, path)
+            raise
+    record["bytes"] = len(downloaded_bytes)
+    return downloaded_bytes
+
+async def adatalake_read_parquet(CONNECTION_STRING, file_system, source_path, source_file, columns=None, filters=None):
+    # pyarrow reads are blocking, so the pruned read runs on the thread pool
+    return await _arun(datalake_read_parquet, CONNECTION_STRING, file_system, source_path, source_file, columns, filters)
+
+async def adatalake_upload(file, CONNECTION_STRING, file_system, sink_path, sink_file):
+    data = file.getvalue()
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    record = _io_new("upload", file_system, sink_path + "/" + sink_file)
+    _dbrks_state.prefetched.pop((file_system, _normalize_path(sink_path + "/" + sink_file)), None)
+    with _io_track(record):
+        await _abackend(datalake_backend(), "upload", CONNECTION_STRING, file_system, sink_path + "/" + sink_file, data)
+        await adatalake_updateLatest(CONNECTION_STRING, file_system, sink_path)
+    record["bytes"] = len(data)
+    record["rows"] = _count_rows(data)
+    return '200 OK'
+
+async def adatalake_updateLatest(CONNECTION_STRING, file_system, sink_path, retries=10):
+    prefix, folder = _split_dated_path(sink_path)
+    if _parse_folder_date(folder) is None:
+        return None
+    key = (CONNECTION_STRING, file_system, prefix)
+    published = _dbrks_state.latest_published.get(key)
+    if published is not None and published >= folder:
+        return published + "/"
+    backend = datalake_backend()
+    manifest_path = prefix + LATEST_MANIFEST
+    for attempt in range(retries):
+        try:
+            manifest, etag = await _abackend(backend, "download", CONNECTION_STRING, file_system, manifest_path)
+            current = manifest.decode("utf-8").strip().strip("/")
+            if _parse_folder_date(current) is not None and current >= folder:
+                _dbrks_state.latest_published[key] = current
+                return current + "/"
+            conditions = {"etag": etag}
+        except FileNotFoundError:
+            conditions = {"if_missing": True}
+        try:
+            await _abackend(backend, "upload", CONNECTION_STRING, file_system, manifest_path, folder.encode("utf-8"), **conditions)
+            _dbrks_state.latest_published[key] = folder
+            return folder + "/"
+        except DatalakeConditionFailed:
+            continue
+    print("could not update {} for {}".format(LATEST_MANIFEST, sink_path))
+    return None
+
+async def adatalake_latestFolder(CONNECTION_STRING, file_system, source_path, use_manifest=True):
+    backend = datalake_backend()
+    record = _io_new("latest_folder", file_system, source_path)
+    with _io_track(record):
+        if use_manifest:
+            try:
+                manifest, etag = await _abackend(backend, "download", CONNECTION_STRING, file_system, source_path + "/" + LATEST_MANIFEST)
+                latest = manifest.decode("utf-8").strip().strip("/")
+                if _parse_folder_date(latest) is not None:
+                    record["cache"] = "manifest"
+                    return latest + "/"
+            except FileNotFoundError:
+                pass
+        record["cache"] = "listing"
+        folders = []
+        for name, is_directory in await _abackend(backend, "list_paths", CONNECTION_STRING, file_system, source_path, recursive=False):
+            folder = name.replace(source_path.strip("/"), "").lstrip("/").rsplit("/", 1)[0]
+            if is_directory and _parse_folder_date(folder) is not None:
+                folders.append(folder)
+        if not folders:
+            raise FileNotFoundError("no dated folder under {}".format(source_path))
+        return max(folders) + "/"
+
+async def adatalake_listContents(CONNECTION_STRING, file_system, source_path):
+    record = _io_new("list", file_system, source_path)
+    try:
+        with _io_track(record):
+            paths = await _abackend(datalake_backend(), "list_paths", CONNECTION_STRING, file_system, source_path)
+        return [name.replace(source_path.strip("/"), "").lstrip("/").rsplit("/", 1)[0] for name, is_directory in paths
+                if name.rsplit("/", 1)[-1] != LATEST_MANIFEST]
+    except Exception as e:
+        print(e)
+
+def datalake_gather(*awaitables, max_concurrency=16):
+    """
+    Run coroutines concurrently from synchronous notebook code and return
+    their results in order; the first failure is raised. At most
+    max_concurrency run at once. Uses a fresh event loop, on a separate thread
+    if one is already running here, and closes its aio clients when done.
+    """
+    async def gather():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        async def bounded(awaitable):
+            async with semaphore:
+                return await awaitable
+        tasks = [asyncio.ensure_future(bounded(awaitable)) for awaitable in awaitables]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            await adatalake_closeClients()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(gather())
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(contextvars.copy_context().run, asyncio.run, gather()).result()
+
+# COMMAND ----------
+
+# Shared input prefetch
+# -------------------------------------------------------------------------
+# orchestrator_prefetchInputs loads each input file named in a project config
+# once into the blob cache, and holds parquet inputs as Arrow tables when a
+# notebook reading them runs in process. Call datalake_clearPrefetched() after.
+if getattr(_dbrks_state, "prefetched", None) is None:
+    _dbrks_state.prefetched = {}
+
+def _select_table(table, columns=None, filters=None):
+    # the projection and filtering pq.read_table applies to a file
+    if columns is not None:
+        index_columns = (table.schema.pandas_metadata or {}).get("index_columns", [])
+        columns = list(columns) + [c for c in index_columns if isinstance(c, str) and c not in columns]
+    if filters is not None:
+        filters_to_expression = getattr(pq, "filters_to_expression", None) or pq._filters_to_expression
+        filters = filters_to_expression(filters)
+    if columns is None and filters is None:
+        return table
+    import pyarrow.dataset as pads
+    return pads.dataset(table).to_table(columns=columns, filter=filters)
+
+def _config_inputs(project):
+    # (path key, file key) pairs, e.g. ("source_path", "source_file_daily")
+    inputs = []
+    for key, source_path in project.items():
+        match = re.fullmatch(r"((?:reference_)?source)_path(_\w+)?", key)
+        if match is None or not isinstance(source_path, str):
+            continue
+        base, suffix = match.group(1), match.group(2) or ""
+        for file_key, source_file in project.items():
+            if not isinstance(source_file, str):
+                continue
+            if file_key == base + "_file" + suffix:
+                inputs.append((key, file_key))
+            elif not suffix and file_key.startswith(base + "_file_") and base + "_path_" + file_key[len(base + "_file_"):] not in project:
+                inputs.append((key, file_key))
+    return inputs
+
+def datalake_prefetch(CONNECTION_STRING, file_system, inputs, max_workers=8, tables=True):
+    """
+    Load (source_path, source_file) pairs once each into the blob cache and,
+    with tables=True, parquet files into memory for datalake_read_parquet.
+    Returns the paths that were loaded.
+    """
+    if not tables and datalake_cache() is None:
+        return []
+    def fetch(item):
+        source_path, source_file = item
+        path = _normalize_path(source_path + "/" + source_file)
+        record = _io_new("prefetch", file_system, path)
+        try:
+            with _io_track(record):
+                data = datalake_download(CONNECTION_STRING, file_system, source_path, source_file)
+                if tables and path.endswith(".parquet"):
+                    _dbrks_state.prefetched[(file_system, path)] = pq.read_table(pa.BufferReader(data))
+        except FileNotFoundError:
+            return None
+        return path
+    paths = _bounded_map(fetch, list(dict.fromkeys(inputs)), max_workers, ordered=True)
+    return [path for path in paths if path is not None]
+
+def orchestrator_prefetchInputs(CONNECTION_STRING, config_JSON, max_workers=8, state=None, resume=False, in_process=False):
+    """
+    Prefetch the project inputs, see above. With the OrchestratorState (and
+    resume flag) of the coming run, only the inputs read by notebooks that
+    would not be skipped are loaded. in_process is the default for entries
+    without "in_process", as in orchestrator_runNotebooks.
+    """
+    pipeline = config_JSON['pipeline']
+    file_system = pipeline['adl_file_system']
+    project = pipeline['project']
+    notebooks = project['databricks']
+    pairs = _config_inputs(project)
+    running = notebooks
+    if state is not None:
+        order, will_run = _planned_runs(notebooks, orchestrator_buildGraph(notebooks), state, resume)
+        running = [notebooks[index] for index in order if will_run[index]]
+        keys = set()
+        for item in running:
+            source = _read_source(item['databricks_notebook'])
+            if source is None:
+                # cannot tell what it reads
+                keys = None
+                break
+            keys |= _source_keys(source)
+        if keys is not None:
+            pairs = [(path_key, file_key) for path_key, file_key in pairs if path_key in keys and file_key in keys]
+    tables = any(item.get('in_process', in_process) for item in running)
+    latest_folders = {}
+    inputs = []
+    for path_key, file_key in pairs:
+        source_path, source_file = project[path_key], project[file_key]
+        if source_path not in latest_folders:
+            # the state's lookups are reused by its fingerprints
+            if state is not None:
+                latest_folders[source_path] = state._latest_folder(source_path)
+            else:
+                try:
+                    latest_folders[source_path] = datalake_latestFolder(CONNECTION_STRING, file_system, source_path)
+                except FileNotFoundError:
+                    latest_folders[source_path] = None
+        if latest_folders[source_path] is not None:
+            inputs.append((source_path + latest_folders[source_path], source_file))
+    return datalake_prefetch(CONNECTION_STRING, file_system, inputs, max_workers, tables)
+
+def datalake_clearPrefetched(file_system=None, paths=None):
+    # everything, or only the paths one orchestration prefetched
+    if paths is None:
+        _dbrks_state.prefetched.clear()
+        return
+    for path in paths:
+        _dbrks_state.prefetched.pop((file_system, _normalize_path(path)), None)
@@ -0,0 +1,733 @@
+# Databricks notebook source
+#!/usr/bin python3
+
+# -------------------------------------------------------------------------
+# Copyright (c) 2021 NHS England and NHS Improvement. All rights reserved.
+# Licensed under the MIT License. See license.txt in the project root for
+# license information.
+# -------------------------------------------------------------------------
+
+"""
+FILE:           dbrks_datalake_storage.py
+DESCRIPTION:
+                Datalake clients, I/O instrumentation, storage backends and the driver blob cache
+USAGE:
+                Run by dbrks_helper_functions; notebooks %run that instead
+CONTRIBUTORS:   Craig Shenton, Mattia Ficarelli
+CONTACT:        data@nhsx.nhs.uk
+CREATED:        18 Oct. 2022
+VERSION:        0.0.1
+"""
+
+
+# COMMAND ----------
+
+# Imports
+# -------------------------------------------------------------------------
+# Python:
+import io
+import os
+import re
+import sys
+import time
+import base64
+import hashlib
+import uuid
+import types
+import contextvars
+import tempfile
+import threading
+import collections
+from datetime import datetime
+
+# 3rd party:
+import pandas as pd
+try:
+    from azure.core import MatchConditions
+    from azure.core.exceptions import ResourceNotFoundError, ResourceModifiedError, ResourceExistsError, ResourceNotModifiedError
+    from azure.storage.filedatalake import DataLakeServiceClient
+except ImportError:
+    # only the azure backend needs the SDK; local and memory run without it
+    DataLakeServiceClient = None
+try:
+    # the aio clients also need aiohttp; without them the async helpers use a thread pool
+    import aiohttp
+    from azure.storage.filedatalake.aio import DataLakeServiceClient as AsyncDataLakeServiceClient
+except ImportError:
+    AsyncDataLakeServiceClient = None
+
+# COMMAND ----------
+
+# Datalake client registry
+# -------------------------------------------------------------------------
+# State lives in a sys.modules entry so repeated %runs reuse the same clients.
+_dbrks_state = sys.modules.get("dbrks_datalake_state")
+if _dbrks_state is None:
+    _dbrks_state = types.ModuleType("dbrks_datalake_state")
+    sys.modules["dbrks_datalake_state"] = _dbrks_state
+
+class DatalakeClientRegistry:
+    """
+    Pool of DataLake clients keyed by connection string and file system.
+    One DataLakeServiceClient is built per connection string and all of its
+    file system clients share its HTTP pipeline, so keep-alive connections are
+    reused instead of paying a new session and TLS handshake on every call.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._service_clients = {}
+        self._file_system_clients = {}
+        self.hits = 0
+        self.misses = 0
+
+    def service_client(self, CONNECTION_STRING):
+        with self._lock:
+            return self._get_service_client(CONNECTION_STRING)
+
+    def file_system_client(self, CONNECTION_STRING, file_system):
+        key = (CONNECTION_STRING, file_system)
+        with self._lock:
+            file_system_client = self._file_system_clients.get(key)
+            if file_system_client is not None:
+                self.hits += 1
+                return file_system_client
+            self.misses += 1
+            service_client = self._get_service_client(CONNECTION_STRING)
+            file_system_client = service_client.get_file_system_client(file_system=file_system)
+            self._file_system_clients[key] = file_system_client
+            return file_system_client
+
+    def _get_service_client(self, CONNECTION_STRING):
+        service_client = self._service_clients.get(CONNECTION_STRING)
+        if service_client is None:
+            if DataLakeServiceClient is None:
+                raise ImportError("the azure backend needs azure-storage-file-datalake installed")
+            service_client = DataLakeServiceClient.from_connection_string(CONNECTION_STRING, raw_response_hook=_io_response_hook)
+            self._service_clients[CONNECTION_STRING] = service_client
+        return service_client
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "service_clients": len(self._service_clients),
+                "file_system_clients": len(self._file_system_clients),
+            }
+
+    def clear(self):
+        with self._lock:
+            for service_client in self._service_clients.values():
+                try:
+                    service_client.close()
+                except Exception as e:
+                    print(e)
+            self._service_clients = {}
+            self._file_system_clients = {}
+            self.hits = 0
+            self.misses = 0
+
+if getattr(_dbrks_state, "client_registry", None) is None:
+    _dbrks_state.client_registry = DatalakeClientRegistry()
+
+def datalake_fileSystemClient(CONNECTION_STRING, file_system):
+    return _dbrks_state.client_registry.file_system_client(CONNECTION_STRING, file_system)
+
+def datalake_clientStats():
+    return _dbrks_state.client_registry.stats()
+
+def datalake_clearClients():
+    _dbrks_state.client_registry.clear()
+
+# COMMAND ----------
+
+# I/O instrumentation
+# -------------------------------------------------------------------------
+# Every datalake call appends a record to a process-wide log, summarised by
+# datalake_ioSummary() and datalake_ioSlowest(). A run given a cancel event
+# (e.g. an in-process notebook past its timeout) fails its next datalake call.
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+_io_record = contextvars.ContextVar("dbrks_io_record", default=None)
+_io_notebook = contextvars.ContextVar("dbrks_io_notebook", default=None)
+_io_cancel = contextvars.ContextVar("dbrks_io_cancel", default=None)
+
+class DatalakeCancelled(RuntimeError):
+    """Raised by a datalake call made from a run that has been cancelled."""
+
+def _io_check_cancelled():
+    cancel = _io_cancel.get()
+    if cancel is not None and cancel.is_set():
+        raise DatalakeCancelled("{} was cancelled".format(_io_notebook.get() or "this run"))
+
+if getattr(_dbrks_state, "io_log", None) is None:
+    _dbrks_state.io_log = collections.deque(maxlen=100000)
+    _dbrks_state.io_lock = threading.Lock()
+
+def _io_new(op, file_system, path):
+    _io_check_cancelled()
+    record = {
+        "started": datetime.now(),
+        "op": op,
+        "file_system": file_system,
+        "path": _normalize_path(path),
+        "notebook": _io_notebook.get(),
+        "bytes": 0,
+        "rows": None,
+        "seconds": 0.0,
+        "retries": 0,
+        "cache": None,
+        "error": None,
+    }
+    with _dbrks_state.io_lock:
+        _dbrks_state.io_log.append(record)
+    return record
+
+class _io_track:
+    # Attach a record to the current thread for the duration of a call
+    def __init__(self, record, timed=True):
+        self.record = record
+        self.timed = timed
+
+    def __enter__(self):
+        self.token = _io_record.set(self.record)
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.timed:
+            self.record["seconds"] += time.perf_counter() - self.start
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            self.record["error"] = "{}: {}".format(exc_type.__name__, exc)
+        _io_record.reset(self.token)
+        return False
+
+def _io_response_hook(response):
+    record = _io_record.get()
+    if record is not None and response.http_response.status_code in RETRYABLE_STATUS_CODES:
+        record["retries"] += 1
+
+def datalake_ioLog():
+    with _dbrks_state.io_lock:
+        records = list(_dbrks_state.io_log)
+    columns = ["started", "op", "file_system", "path", "notebook", "bytes", "rows", "seconds", "retries", "cache", "error"]
+    return pd.DataFrame(records, columns=columns)
+
+def datalake_ioSummary():
+    log = datalake_ioLog()
+    if log.empty:
+        return pd.DataFrame()
+    summary = log.groupby("op").agg(
+        calls=("seconds", "size"),
+        bytes=("bytes", "sum"),
+        seconds=("seconds", "sum"),
+        p50_seconds=("seconds", lambda x: x.quantile(0.50)),
+        p95_seconds=("seconds", lambda x: x.quantile(0.95)),
+        p99_seconds=("seconds", lambda x: x.quantile(0.99)),
+        max_seconds=("seconds", "max"),
+        retries=("retries", "sum"),
+        cache_hits=("cache", lambda x: (x == "hit").sum()),
+        errors=("error", "count"),
+    )
+    summary.loc["total"] = [
+        len(log), log["bytes"].sum(), log["seconds"].sum(),
+        log["seconds"].quantile(0.50), log["seconds"].quantile(0.95), log["seconds"].quantile(0.99),
+        log["seconds"].max(), log["retries"].sum(), (log["cache"] == "hit").sum(), log["error"].count(),
+    ]
+    return summary
+
+def datalake_ioSlowest(n=10):
+    return datalake_ioLog().sort_values("seconds", ascending=False).head(n).reset_index(drop=True)
+
+def datalake_ioReset():
+    with _dbrks_state.io_lock:
+        _dbrks_state.io_log.clear()
+
+def datalake_ioUpload(CONNECTION_STRING, file_system, sink_path, sink_file):
+    # Write the current log as parquet, e.g. to a run-ledger folder per run
+    log = datalake_ioLog()
+    file_contents = io.BytesIO()
+    log.to_parquet(file_contents, engine="pyarrow")
+    return datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path, sink_file)
+
+# COMMAND ----------
+
+# Storage backends
+# -------------------------------------------------------------------------
+# Azure, local directory or in-memory storage, chosen with DATALAKE_BACKEND or
+# datalake_setBackend(). Missing files raise FileNotFoundError on every backend.
+# A backend with has_async set also provides coroutine versions (aproperties,
+# adownload, aupload, alist_paths) for the async helpers; otherwise the
+# blocking method runs on the event loop's default thread pool.
+class DatalakeConditionFailed(Exception):
+    """Raised when a conditional read or write finds a different ETag."""
+
+DatalakeFileProperties = collections.namedtuple("DatalakeFileProperties", ["size", "etag", "last_modified"])
+
+def _normalize_path(path):
+    return "/".join(part for part in path.split("/") if part)
+
+class AzureDatalakeBackend:
+    name = "azure"
+    has_async = AsyncDataLakeServiceClient is not None
+
+    def _file_client(self, CONNECTION_STRING, file_system, path):
+        return datalake_fileSystemClient(CONNECTION_STRING, file_system).get_file_client(_normalize_path(path))
+
+    def properties(self, CONNECTION_STRING, file_system, path):
+        try:
+            properties = self._file_client(CONNECTION_STRING, file_system, path).get_file_properties()
+        except ResourceNotFoundError:
+            raise FileNotFoundError(path)
+        return DatalakeFileProperties(properties.size, properties.etag, properties.last_modified)
+
+    def download(self, CONNECTION_STRING, file_system, path, if_none_match=None):
+        conditions = {}
+        if if_none_match is not None:
+            conditions = {"etag": if_none_match, "match_condition": MatchConditions.IfModified}
+        try:
+            download = self._file_client(CONNECTION_STRING, file_system, path).download_file(**conditions)
+        except ResourceNotFoundError:
+            raise FileNotFoundError(path)
+        except ResourceNotModifiedError:
+            return None, if_none_match
+        return download.readall(), download.properties.etag
+
+    def read_into(self, CONNECTION_STRING, file_system, path, offset, view, etag=None, max_concurrency=4):
+        conditions = {}
+        if etag is not None:
+            conditions = {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+        try:
+            download = self._file_client(CONNECTION_STRING, file_system, path).download_file(
+                offset=offset, length=len(view), max_concurrency=max_concurrency, **conditions
+            )
+        except ResourceNotFoundError:
+            raise FileNotFoundError(path)
+        except ResourceModifiedError:
+            raise DatalakeConditionFailed(path)
+        download.readinto(_MemoryviewWriter(view))
+        return len(view)
+
+    def upload(self, CONNECTION_STRING, file_system, path, data, etag=None, if_missing=False):
+        conditions = {}
+        if if_missing:
+            conditions = {"etag": "*", "match_condition": MatchConditions.IfMissing}
+        elif etag is not None:
+            conditions = {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+        file_client = self._file_client(CONNECTION_STRING, file_system, path)
+        try:
+            response = file_client.upload_data(data, length=len(data), overwrite=True, max_concurrency=4, **conditions)
+        except (ResourceModifiedError, ResourceExistsError):
+            raise DatalakeConditionFailed(path)
+        return response.get("etag")
+
+    def start_upload(self, CONNECTION_STRING, file_system, path):
+        # Blocks are staged and renamed over the destination on commit
+        directory, name = ("/" + _normalize_path(path)).rsplit("/", 1)
+        staging_path = "{}/.{}.{}.uploading".format(directory, name, uuid.uuid4().hex)
+        staging_client = self._file_client(CONNECTION_STRING, file_system, staging_path)
+        staging_client.create_file()
+        return {"client": staging_client, "file_system": file_system, "path": _normalize_path(path)}
+
+    def append_block(self, upload, offset, data):
+        upload["client"].append_data(data, offset=offset, length=len(data))
+
+    def commit_upload(self, upload, length):
+        upload["client"].flush_data(length)
+        renamed = upload["client"].rename_file(upload["file_system"] + "/" + upload["path"])
+        return renamed.get_file_properties().etag
+
+    def abort_upload(self, upload):
+        try:
+            upload["client"].delete_file()
+        except ResourceNotFoundError:
+            pass
+
+    def list_paths(self, CONNECTION_STRING, file_system, path, recursive=True):
+        file_system_client = datalake_fileSystemClient(CONNECTION_STRING, file_system)
+        try:
+            return [(p.name, p.is_directory) for p in file_system_client.get_paths(path=path, recursive=recursive)]
+        except ResourceNotFoundError:
+            raise FileNotFoundError(path)
+
+    def _async_file_client(self, CONNECTION_STRING, file_system, path):
+        return _async_fileSystemClient(CONNECTION_STRING, file_system).get_file_client(_normalize_path(path))
+
+    async def aproperties(self, CONNECTION_STRING, file_system, path):
+        try:
+            properties = await self._async_file_client(CONNECTION_STRING, file_system, path).get_file_properties()
+        except ResourceNotFoundError:
+            raise FileNotFoundError(path)
+        return DatalakeFileProperties(properties.size, properties.etag, properties.last_modified)
+
+    async def adownload(self, CONNECTION_STRING, file_system, path, if_none_match=None):
+        conditions = {}
+        if if_none_match is not None:
+            conditions = {"etag": if_none_match, "match_condition": MatchConditions.IfModified}
+        try:
+            download = await self._async_file_client(CONNECTION_STRING, file_system, path).download_file(**conditions)
+        except ResourceNotFoundError:
+            raise FileNotFoundError(path)
+        except ResourceNotModifiedError:
+            return None, if_none_match
+        return await download.readall(), download.properties.etag
+
+    async def aupload(self, CONNECTION_STRING, file_system, path, data, etag=None, if_missing=False):
+        conditions = {}
+        if if_missing:
+            conditions = {"etag": "*", "match_condition": MatchConditions.IfMissing}
+        elif etag is not None:
+            conditions = {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+        file_client = self._async_file_client(CONNECTION_STRING, file_system, path)
+        try:
+            response = await file_client.upload_data(data, length=len(data), overwrite=True, max_concurrency=4, **conditions)
+        except (ResourceModifiedError, ResourceExistsError):
+            raise DatalakeConditionFailed(path)
+        return response.get("etag")
+
+    async def alist_paths(self, CONNECTION_STRING, file_system, path, recursive=True):
+        file_system_client = _async_fileSystemClient(CONNECTION_STRING, file_system)
+        try:
+            return [(p.name, p.is_directory) async for p in file_system_client.get_paths(path=path, recursive=recursive)]
+        except ResourceNotFoundError:
+            raise FileNotFoundError(path)
+
+class LocalDatalakeBackend:
+    """Backend over a local directory laid out as <root>/<file_system>/<path>."""
+    name = "local"
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._lock = threading.Lock()
+
+    def _local_path(self, file_system, path):
+        return os.path.join(self.root, file_system, *_normalize_path(path).split("/"))
+
+    def _etag(self, stat):
+        return '"{}-{}"'.format(stat.st_mtime_ns, stat.st_size)
+
+    def properties(self, CONNECTION_STRING, file_system, path):
+        local_path = self._local_path(file_system, path)
+        if not os.path.isfile(local_path):
+            raise FileNotFoundError(path)
+        stat = os.stat(local_path)
+        return DatalakeFileProperties(stat.st_size, self._etag(stat), datetime.fromtimestamp(stat.st_mtime))
+
+    def download(self, CONNECTION_STRING, file_system, path, if_none_match=None):
+        local_path = self._local_path(file_system, path)
+        if not os.path.isfile(local_path):
+            raise FileNotFoundError(path)
+        with open(local_path, "rb") as f:
+            etag = self._etag(os.fstat(f.fileno()))
+            if etag == if_none_match:
+                return None, etag
+            return f.read(), etag
+
+    def read_into(self, CONNECTION_STRING, file_system, path, offset, view, etag=None, max_concurrency=4):
+        local_path = self._local_path(file_system, path)
+        if not os.path.isfile(local_path):
+            raise FileNotFoundError(path)
+        with open(local_path, "rb") as f:
+            if etag is not None and self._etag(os.fstat(f.fileno())) != etag:
+                raise DatalakeConditionFailed(path)
+            f.seek(offset)
+            return f.readinto(view)
+
+    def upload(self, CONNECTION_STRING, file_system, path, data, etag=None, if_missing=False):
+        local_path = self._local_path(file_system, path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with self._lock:
+            exists = os.path.isfile(local_path)
+            if if_missing and exists:
+                raise DatalakeConditionFailed(path)
+            if etag is not None and (not exists or self._etag(os.stat(local_path)) != etag):
+                raise DatalakeConditionFailed(path)
+            # write then rename so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), prefix=".upload-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, local_path)
+            return self._etag(os.stat(local_path))
+
+    def start_upload(self, CONNECTION_STRING, file_system, path):
+        local_path = self._local_path(file_system, path)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), prefix=".upload-")
+        return {"fd": fd, "temp_path": temp_path, "local_path": local_path}
+
+    def append_block(self, upload, offset, data):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(upload["fd"], view, offset)
+            view = view[written:]
+            offset += written
+
+    def commit_upload(self, upload, length):
+        os.ftruncate(upload["fd"], length)
+        os.close(upload["fd"])
+        os.replace(upload["temp_path"], upload["local_path"])
+        return self._etag(os.stat(upload["local_path"]))
+
+    def abort_upload(self, upload):
+        os.close(upload["fd"])
+        os.remove(upload["temp_path"])
+        try:
+            os.rmdir(os.path.dirname(upload["local_path"]))
+        except OSError:
+            pass
+
+    def list_paths(self, CONNECTION_STRING, file_system, path, recursive=True):
+        base = self._local_path(file_system, path)
+        if not os.path.isdir(base):
+            raise FileNotFoundError(path)
+        prefix = _normalize_path(path)
+        prefix = prefix + "/" if prefix else ""
+        paths = []
+        for directory, dirnames, filenames in os.walk(base):
+            relative = os.path.relpath(directory, base).replace(os.sep, "/")
+            relative = "" if relative == "." else relative + "/"
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(".upload-"))
+            paths.extend((prefix + relative + d, True) for d in dirnames)
+            paths.extend((prefix + relative + f, False) for f in sorted(filenames) if not f.startswith(".upload-"))
+            if not recursive:
+                break
+        return sorted(paths)
+
+class MemoryDatalakeBackend:
+    """Backend holding files in a dict, for tests and benchmarks without any I/O."""
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+        self._version = 0
+
+    def _get(self, file_system, path):
+        try:
+            return self._files[(file_system, _normalize_path(path))]
+        except KeyError:
+            raise FileNotFoundError(path)
+
+    def properties(self, CONNECTION_STRING, file_system, path):
+        data, etag, last_modified = self._get(file_system, path)
+        return DatalakeFileProperties(len(data), etag, last_modified)
+
+    def download(self, CONNECTION_STRING, file_system, path, if_none_match=None):
+        data, etag, last_modified = self._get(file_system, path)
+        if etag == if_none_match:
+            return None, etag
+        return data, etag
+
+    def read_into(self, CONNECTION_STRING, file_system, path, offset, view, etag=None, max_concurrency=4):
+        data, current_etag, last_modified = self._get(file_system, path)
+        if etag is not None and current_etag != etag:
+            raise DatalakeConditionFailed(path)
+        chunk = memoryview(data)[offset:offset + len(view)]
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+    def upload(self, CONNECTION_STRING, file_system, path, data, etag=None, if_missing=False):
+        key = (file_system, _normalize_path(path))
+        with self._lock:
+            current = self._files.get(key)
+            if if_missing and current is not None:
+                raise DatalakeConditionFailed(path)
+            if etag is not None and (current is None or current[1] != etag):
+                raise DatalakeConditionFailed(path)
+            self._version += 1
+            new_etag = '"{}"'.format(self._version)
+            self._files[key] = (bytes(data), new_etag, datetime.now())
+            return new_etag
+
+    def start_upload(self, CONNECTION_STRING, file_system, path):
+        return {"file_system": file_system, "path": path, "blocks": {}}
+
+    def append_block(self, upload, offset, data):
+        upload["blocks"][offset] = bytes(data)
+
+    def commit_upload(self, upload, length):
+        data = bytearray(length)
+        for offset, block in upload["blocks"].items():
+            data[offset:offset + len(block)] = block
+        return self.upload(None, upload["file_system"], upload["path"], data)
+
+    def abort_upload(self, upload):
+        upload["blocks"].clear()
+
+    def list_paths(self, CONNECTION_STRING, file_system, path, recursive=True):
+        prefix = _normalize_path(path)
+        prefix = prefix + "/" if prefix else ""
+        paths = set()
+        with self._lock:
+            keys = [name for fs, name in self._files if fs == file_system and name.startswith(prefix)]
+        if not keys and prefix:
+            raise FileNotFoundError(path)
+        for name in keys:
+            parts = name[len(prefix):].split("/")
+            depth = len(parts) if recursive else 1
+            for i in range(1, depth + 1):
+                paths.add((prefix + "/".join(parts[:i]), i < len(parts)))
+        return sorted(paths)
+
+def _backend_from_environment():
+    backend = os.environ.get("DATALAKE_BACKEND", "azure").lower()
+    if backend == "azure":
+        return AzureDatalakeBackend()
+    if backend == "local":
+        return LocalDatalakeBackend(os.environ.get("DATALAKE_LOCAL_ROOT", "datalake"))
+    if backend == "memory":
+        return MemoryDatalakeBackend()
+    raise ValueError("unknown DATALAKE_BACKEND '{}', expected azure, local or memory".format(backend))
+
+def datalake_backend():
+    if getattr(_dbrks_state, "backend", None) is None:
+        _dbrks_state.backend = _backend_from_environment()
+    return _dbrks_state.backend
+
+def datalake_setBackend(backend):
+    _dbrks_state.backend = backend
+    _dbrks_state.latest_published = {}
+    return backend
+
+# COMMAND ----------
+
+# Driver-local blob cache
+# -------------------------------------------------------------------------
+# Read-through cache for datalake_download keyed by path and ETag, revalidated
+# with a conditional GET and evicted least recently used by file mtime.
+class DatalakeBlobCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry_dir(self, CONNECTION_STRING, backend, file_system, path):
+        account = re.search(r"AccountName=([^;]+)", CONNECTION_STRING or "")
+        account = account.group(1) if account else ""
+        key = "|".join([backend.name, account, file_system, _normalize_path(path)])
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def _etag_name(self, etag):
+        return base64.urlsafe_b64encode(etag.encode("utf-8")).decode("ascii")
+
+    def _cached(self, entry_dir):
+        try:
+            names = [name for name in os.listdir(entry_dir) if not name.startswith(".")]
+        except FileNotFoundError:
+            return None, None
+        if not names:
+            return None, None
+        name = names[0]
+        return base64.urlsafe_b64decode(name.encode("ascii")).decode("utf-8"), os.path.join(entry_dir, name)
+
+    def lookup(self, CONNECTION_STRING, backend, file_system, path):
+        # Local copy of the blob if it is cached at its current ETag, else None
+        entry_dir = self._entry_dir(CONNECTION_STRING, backend, file_system, path)
+        cached_etag, cached_path = self._cached(entry_dir)
+        if cached_etag is None:
+            return None
+        if backend.properties(CONNECTION_STRING, file_system, path).etag != cached_etag:
+            return None
+        self._touch(cached_path)
+        return cached_path
+
+    def fetch(self, CONNECTION_STRING, backend, file_system, path):
+        """Returns (bytes, status) where status is "hit" or "miss"."""
+        entry_dir = self._entry_dir(CONNECTION_STRING, backend, file_system, path)
+        cached_etag, cached_path = self._cached(entry_dir)
+        data, etag = backend.download(CONNECTION_STRING, file_system, path, if_none_match=cached_etag)
+        if data is None:
+            data = self._read(cached_path)
+            if data is not None:
+                return data, "hit"
+            data, etag = backend.download(CONNECTION_STRING, file_system, path)
+        self._store(entry_dir, etag, data)
+        return data, "miss"
+
+    async def afetch(self, CONNECTION_STRING, backend, file_system, path):
+        entry_dir = self._entry_dir(CONNECTION_STRING, backend, file_system, path)
+        cached_etag, cached_path = self._cached(entry_dir)
+        data, etag = await _abackend(backend, "download", CONNECTION_STRING, file_system, path, if_none_match=cached_etag)
+        if data is None:
+            data = self._read(cached_path)
+            if data is not None:
+                return data, "hit"
+            data, etag = await _abackend(backend, "download", CONNECTION_STRING, file_system, path)
+        self._store(entry_dir, etag, data)
+        return data, "miss"
+
+    def _read(self, cached_path):
+        try:
+            with open(cached_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # evicted by another process between the check and the read
+            return None
+        self._touch(cached_path)
+        return data
+
+    def _touch(self, cached_path):
+        try:
+            os.utime(cached_path)
+        except FileNotFoundError:
+            pass
+
+    def _store(self, entry_dir, etag, data):
+        if etag is None or len(data) > self.max_bytes:
+            return
+        os.makedirs(entry_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=entry_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, os.path.join(entry_dir, self._etag_name(etag)))
+        for name in os.listdir(entry_dir):
+            if not name.startswith(".") and name != self._etag_name(etag):
+                self._remove(os.path.join(entry_dir, name))
+        self.evict()
+
+    def _remove(self, file_path):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        entries = []
+        for entry_dir in os.scandir(self.directory):
+            if not entry_dir.is_dir():
+                continue
+            for entry in os.scandir(entry_dir.path):
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for mtime, size, file_path in entries)
+            for mtime, size, file_path in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(file_path)
+                total -= size
+
+    def clear(self):
+        for mtime, size, file_path in self.entries():
+            self._remove(file_path)
+
+def _default_cache_dir():
+    # /local_disk0 is the driver's local SSD on Databricks clusters
+    root = "/local_disk0/tmp" if os.path.isdir("/local_disk0") else tempfile.gettempdir()
+    return os.path.join(root, "datalake_cache")
+
+def datalake_cache():
+    if not hasattr(_dbrks_state, "cache"):
+        max_bytes = int(os.environ.get("DATALAKE_CACHE_MAX_BYTES", 4 * 1024 ** 3))
+        directory = os.environ.get("DATALAKE_CACHE_DIR", _default_cache_dir())
+        _dbrks_state.cache = DatalakeBlobCache(directory, max_bytes) if max_bytes > 0 else None
+    return _dbrks_state.cache
+
+def datalake_setCache(cache):
+    _dbrks_state.cache = cache
+    return cache
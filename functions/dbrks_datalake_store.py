@@ -0,0 +1,507 @@
+# Databricks notebook source
+#!/usr/bin python3
+
+# -------------------------------------------------------------------------
+# Copyright (c) 2021 NHS England and NHS Improvement. All rights reserved.
+# Licensed under the MIT License. See license.txt in the project root for
+# license information.
+# -------------------------------------------------------------------------
+
+"""
+FILE:           dbrks_datalake_store.py
+DESCRIPTION:
+                Dataset schemas, the append store for historical datasets and the table log
+USAGE:
+                Run by dbrks_helper_functions; notebooks %run that instead
+CONTRIBUTORS:   Craig Shenton, Mattia Ficarelli
+CONTACT:        data@nhsx.nhs.uk
+CREATED:        18 Oct. 2022
+VERSION:        0.0.1
+"""
+
+
+# COMMAND ----------
+
+# Imports
+# -------------------------------------------------------------------------
+# Python:
+import io
+import json
+import re
+import uuid
+import shutil
+from datetime import datetime
+
+# 3rd party:
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# COMMAND ----------
+
+# Dataset schemas
+# -------------------------------------------------------------------------
+# A schema maps column names to logical types, e.g.
+#   {"Date": "date:%d/%m/%Y", "OdsCode": "category", "Logins": "int64"}
+# Append stores apply it on append and on read; other columns are strings.
+SCHEMA_TYPES = ("string", "category", "int64", "float64", "date", "datetime")
+SCHEMA_MISSING_VALUES = ["", "nan", "NaN", "None", "NaT", "<NA>"]
+
+class DatalakeSchemaError(ValueError):
+    pass
+
+def _schema_type(logical_type):
+    # "date:%d/%m/%Y" -> ("date", "%d/%m/%Y")
+    base, _, date_format = (logical_type or "").partition(":")
+    return base, date_format or None
+
+def _schema_check(schema):
+    def known(logical_type):
+        base, date_format = _schema_type(logical_type)
+        return base in SCHEMA_TYPES and (date_format is None or base in ("date", "datetime"))
+    unknown = {column: logical_type for column, logical_type in schema.items() if not known(logical_type)}
+    if unknown:
+        raise DatalakeSchemaError("unknown types {}, expected one of {}".format(unknown, ", ".join(SCHEMA_TYPES)))
+
+def _schema_strings(series):
+    series = series.astype(object)
+    missing = series.isna() | series.isin(SCHEMA_MISSING_VALUES)
+    return series.where(~missing, None).map(lambda value: None if value is None else str(value))
+
+def _schema_convert(series, logical_type):
+    logical_type, date_format = _schema_type(logical_type)
+    if logical_type == "string":
+        return _schema_strings(series)
+    if logical_type == "category":
+        return _schema_strings(series).astype("category")
+    if logical_type in ("int64", "float64"):
+        values = series if pd.api.types.is_numeric_dtype(series) else pd.to_numeric(_schema_strings(series))
+        if logical_type == "float64":
+            return values.astype("float64")
+        if (values.dropna() % 1 != 0).any():
+            raise ValueError("values are not whole numbers")
+        return values.astype("Int64")
+    values = series if pd.api.types.is_datetime64_any_dtype(series) else pd.to_datetime(_schema_strings(series), format=date_format)
+    if logical_type == "date" and (values.dropna() != values.dropna().dt.normalize()).any():
+        raise ValueError("values have a time of day")
+    return values
+
+def _schema_apply(df, schema, append=False):
+    # on append every schema column must be present and the rest become strings
+    if append:
+        missing = [column for column in schema if column not in df.columns]
+        if missing:
+            raise DatalakeSchemaError("{} not in the data".format(", ".join(missing)))
+    df = df.copy()
+    for column in df.columns:
+        if column in schema:
+            try:
+                df[column] = _schema_convert(df[column], schema[column])
+            except (ValueError, TypeError) as error:
+                raise DatalakeSchemaError("column {!r} is not {}: {}".format(column, schema[column], error))
+        elif append:
+            df[column] = df[column].astype(str)
+    return df
+
+# COMMAND ----------
+
+# Append store
+# -------------------------------------------------------------------------
+# Each append is committed to a table log as one partition under
+#   <appended_path>/_partitions/<appended_file>/period=<period>/<run id>.parquet
+# and a manifest of the partitions is published to the dated folder as
+# <appended_file>.manifest.json, which datalake_read_parquet reads in its place.
+STORE_PARTITIONS_PATH = "_partitions"
+STORE_BASE_PATH = "base"
+STORE_MANIFEST_SUFFIX = ".manifest.json"
+STORE_COMPACT_PARTITIONS = 20
+STORE_COMPACT_BYTES = 256 * 1024 * 1024
+
+def _period_values(values, logical_type=None):
+    # periods as strings, e.g. "2022-06-01" or "2022-06-01T09:00:00"
+    series = pd.Series(values)
+    logical_type, date_format = _schema_type(logical_type)
+    if logical_type == "date":
+        if not pd.api.types.is_datetime64_any_dtype(series):
+            series = pd.to_datetime(series, format=date_format)
+        return series.dt.strftime("%Y-%m-%d").tolist()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime("%Y-%m-%dT%H:%M:%S").tolist()
+    return series.astype(str).tolist()
+
+def _store_manifest(CONNECTION_STRING, file_system, path):
+    # the manifest published beside path, or None
+    try:
+        manifest, etag = datalake_backend().download(CONNECTION_STRING, file_system, path + STORE_MANIFEST_SUFFIX)
+    except FileNotFoundError:
+        return None
+    return json.loads(manifest)
+
+def _store_read(CONNECTION_STRING, file_system, manifest, columns=None, filters=None, max_workers=8):
+    schema = manifest.get("schema") or {}
+    def read(partition):
+        source_path, source_file = partition["path"].rsplit("/", 1)
+        df = datalake_read_parquet(CONNECTION_STRING, file_system, source_path, source_file, columns=columns, filters=filters)
+        # per partition, as older partitions may hold strings
+        return _schema_apply(df, schema) if schema else df
+    frames = list(_bounded_map(read, manifest["partitions"], max_workers, ordered=True))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    # concat gives object columns where partitions' categories differ
+    for column, logical_type in schema.items():
+        if logical_type == "category" and column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+def _store_stream(CONNECTION_STRING, file_system, manifest, sink_path, sink_file):
+    writer = None
+    with datalake_openWriter(CONNECTION_STRING, file_system, sink_path, sink_file) as file_contents:
+        try:
+            for partition in manifest["partitions"]:
+                df = _store_read(CONNECTION_STRING, file_system, {"schema": manifest.get("schema"), "partitions": [partition]})
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(file_contents, table.schema)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        size = file_contents.tell()
+    return file_contents.etag, size
+
+def _store_write(CONNECTION_STRING, file_system, manifest, sink_path, sink_file):
+    """
+    Write the manifest's partitions as one parquet file, holding a partition
+    at a time in memory, for compaction. Returns the file's (etag, size).
+    """
+    try:
+        return _store_stream(CONNECTION_STRING, file_system, manifest, sink_path, sink_file)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # partitions with no schema whose inferred types differ; concat reconciles them
+        with datalake_openWriter(CONNECTION_STRING, file_system, sink_path, sink_file) as file_contents:
+            _store_read(CONNECTION_STRING, file_system, manifest).to_parquet(file_contents, engine="pyarrow", index=False)
+            size = file_contents.tell()
+        return file_contents.etag, size
+
+class DatalakeAppendStore:
+    def __init__(self, CONNECTION_STRING, file_system, path, file_name, period_column, schema=None):
+        self.CONNECTION_STRING = CONNECTION_STRING
+        self.file_system = file_system
+        self.path = path
+        self.file_name = file_name
+        self.period_column = period_column
+        self.table = DatalakeTable(CONNECTION_STRING, file_system, "{}/{}/{}".format(path.rstrip("/"), STORE_PARTITIONS_PATH, file_name))
+        snapshot = self.table.snapshot()
+        registered = snapshot["schema"] if snapshot is not None else None
+        self.schema = schema if schema is not None else registered
+        if self.schema is not None:
+            _schema_check(self.schema)
+        # a declared schema that differs from the log's is committed with the next append
+        self._schema_changed = self.schema != registered
+        # the single file written before the table log existed, copied by the first commit
+        self._adopted = [] if snapshot is not None else self._legacy_partitions()
+        self.manifest = self._manifest(snapshot, self._adopted)
+
+    def _manifest(self, snapshot, partitions):
+        if snapshot is not None:
+            partitions = list(snapshot["files"].values())
+        return {
+            "version": snapshot["version"] if snapshot is not None else None,
+            "period_column": self.period_column,
+            "schema": self.schema,
+            "partitions": sorted(partitions, key=lambda partition: (partition["periods"] or [])[:1]),
+        }
+
+    def _legacy_partitions(self):
+        # its periods are read only if the footer's statistics cannot answer contains()
+        try:
+            latest_folder = datalake_latestFolder(self.CONNECTION_STRING, self.file_system, self.path)
+            statistics = datalake_parquetStatistics(self.CONNECTION_STRING, self.file_system, self.path + latest_folder, self.file_name, columns=[self.period_column])
+        except FileNotFoundError:
+            return []
+        statistics = statistics.get(self.period_column)
+        return [{
+            "path": _normalize_path(self.path + latest_folder + self.file_name),
+            "periods": None,
+            "rows": statistics["rows"] if statistics is not None else None,
+            "statistics": statistics,
+        }]
+
+    def _base_file(self):
+        return "{}/{}".format(self.table.path, STORE_BASE_PATH), uuid.uuid4().hex + ".parquet"
+
+    def _copy_to_base(self, partition):
+        source_path, source_file = partition["path"].rsplit("/", 1)
+        base_path, base_file = self._base_file()
+        with datalake_open(self.CONNECTION_STRING, self.file_system, source_path, source_file) as source:
+            with datalake_openWriter(self.CONNECTION_STRING, self.file_system, base_path, base_file) as sink:
+                shutil.copyfileobj(source, sink, 8 * 1024 * 1024)
+                size = sink.tell()
+        return dict(partition, path=_normalize_path(base_path + "/" + base_file), bytes=size)
+
+    def _period_type(self):
+        return (self.schema or {}).get(self.period_column)
+
+    def _partition_periods(self, partition):
+        if partition["periods"] is None:
+            source_path, source_file = partition["path"].rsplit("/", 1)
+            base = datalake_read_parquet(self.CONNECTION_STRING, self.file_system, source_path, source_file, columns=[self.period_column])
+            partition["periods"] = sorted(set(_period_values(base[self.period_column], self._period_type())))
+            partition["rows"] = len(base)
+            partition.pop("statistics", None)
+        return partition["periods"]
+
+    def periods(self):
+        return sorted({period for partition in self.manifest["partitions"] for period in self._partition_periods(partition)})
+
+    def contains(self, period):
+        """Whether period is stored, from the table log or, before the first commit, parquet footer statistics."""
+        value = _period_values([period], self._period_type())[0]
+        for partition in self.manifest["partitions"]:
+            if partition["periods"] is None:
+                settled = _statistics_range(period, partition.get("statistics"), self._period_type())
+                if settled is not None:
+                    if settled:
+                        return True
+                    continue
+            if value in self._partition_periods(partition):
+                return True
+        return False
+
+    def read(self, columns=None, filters=None, version=None, as_of=None):
+        """The dataset now, or at a table version or datetime (as_of)."""
+        if version is None and as_of is None:
+            return _store_read(self.CONNECTION_STRING, self.file_system, self.manifest, columns, filters)
+        return self.table.read(columns, filters, version, as_of)
+
+    def _write_partition(self, df):
+        periods = sorted(set(_period_values(df[self.period_column], self._period_type())))
+        partition_path = "{}/period={}".format(self.table.path, re.sub(r"[^\w.-]", "-", periods[0]))
+        partition_file = uuid.uuid4().hex + ".parquet"
+        file_contents = io.BytesIO()
+        df.to_parquet(file_contents, engine="pyarrow", index=False)
+        datalake_upload(file_contents, self.CONNECTION_STRING, self.file_system, partition_path, partition_file)
+        return {"path": _normalize_path(partition_path + "/" + partition_file), "periods": periods, "rows": len(df), "bytes": file_contents.getbuffer().nbytes}
+
+    def _added(self):
+        # partitions written since the last compaction
+        base_path = self.table.path + "/" + STORE_BASE_PATH + "/"
+        return [partition for partition in self.manifest["partitions"] if not partition["path"].startswith(base_path)]
+
+    def _compaction_due(self):
+        added = self._added()
+        return len(added) > 1 and (
+            len(added) >= STORE_COMPACT_PARTITIONS or sum(partition.get("bytes") or 0 for partition in added) >= STORE_COMPACT_BYTES
+        )
+
+    def _publish(self):
+        current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
+        datalake_upload(io.StringIO(json.dumps(self.manifest, indent=2)), self.CONNECTION_STRING, self.file_system, self.path + current_date_path, self.file_name + STORE_MANIFEST_SUFFIX)
+
+    def _commit(self, add, remove=(), operation="append"):
+        # the legacy file goes into the first commit unless that commit replaces it
+        removed = set(remove)
+        adopted_paths = {partition["path"] for partition in self._adopted}
+        adopted = [self._copy_to_base(partition) for partition in self._adopted if partition["path"] not in removed]
+        for partition in adopted:
+            self._partition_periods(partition)
+        version = self.table.commit(
+            add=adopted + add,
+            remove=[path for path in remove if path not in adopted_paths],
+            operation=operation,
+            schema=self.schema if self._schema_changed else None,
+        )
+        self._adopted = []
+        self._schema_changed = False
+        self.manifest = self._manifest(self.table.snapshot(version=version), [])
+        if operation != "compact" and self._compaction_due():
+            return self.compact()
+        self._publish()
+        return self.manifest
+
+    def compact(self, full=False):
+        """
+        Rewrite the partitions added since the last compaction, or with
+        full=True every partition, as one base partition, in one commit.
+        """
+        partitions = self.manifest["partitions"] if full else self._added()
+        if len(partitions) < 2:
+            return self.manifest
+        base_path, base_file = self._base_file()
+        etag, size = _store_write(self.CONNECTION_STRING, self.file_system, dict(self.manifest, partitions=partitions), base_path, base_file)
+        base = {
+            "path": _normalize_path(base_path + "/" + base_file),
+            "periods": sorted({period for partition in partitions for period in self._partition_periods(partition)}),
+            "rows": sum(partition["rows"] or 0 for partition in partitions),
+            "bytes": size,
+        }
+        return self._commit([base], [partition["path"] for partition in partitions], operation="compact")
+
+    def append(self, df):
+        """Write df as a new partition, commit it and publish a manifest including it."""
+        if df.empty:
+            raise ValueError("nothing to append to {}".format(self.file_name))
+        if self.schema is not None:
+            df = _schema_apply(df, self.schema, append=True)
+        return self._commit([self._write_partition(df)])
+
+    def upsert(self, df, keys, values=None):
+        """
+        Merge df into the dataset on keys, which must include the period
+        column: matching rows take df's values columns (default: all of df's
+        other columns) and rows with new keys are added. Only the partitions
+        holding df's periods are read and rewritten, in one commit.
+        """
+        if self.period_column not in keys:
+            raise ValueError("upsert keys must include the period column {}".format(self.period_column))
+        if df.empty:
+            raise ValueError("nothing to upsert into {}".format(self.file_name))
+        if self.schema is not None:
+            df = _schema_apply(df, self.schema, append=True)
+        periods = set(_period_values(df[self.period_column], self._period_type()))
+        touched = [partition for partition in self.manifest["partitions"] if periods.intersection(self._partition_periods(partition))]
+        if not touched:
+            return self._commit([self._write_partition(df)], operation="upsert")
+        existing = _store_read(self.CONNECTION_STRING, self.file_system, {"schema": self.schema, "partitions": touched})
+        in_periods = pd.Series(_period_values(existing[self.period_column], self._period_type()), index=existing.index).isin(periods)
+        # the touched partitions' other periods are rewritten unchanged
+        add = [self._write_partition(existing[~in_periods])] if not in_periods.all() else []
+        add.append(self._write_partition(datalake_upsertFrame(existing[in_periods], df, keys, values)))
+        return self._commit(add, [partition["path"] for partition in touched], operation="upsert")
+
+def datalake_appendStore(CONNECTION_STRING, file_system, path, file_name, period_column, schema=None):
+    return DatalakeAppendStore(CONNECTION_STRING, file_system, path, file_name, period_column, schema)
+
+def datalake_upsertFrame(existing, new, keys, values=None):
+    """
+    existing with the values columns (default: all of new's other columns) of
+    rows matching new on keys replaced by new's, and new's rows with unseen
+    keys added, as one vectorised merge. The last of new's duplicate keys wins.
+    """
+    if values is None:
+        values = [column for column in new.columns if column not in keys]
+    new = new.drop_duplicates(keys, keep="last")
+    existing_keys = pd.MultiIndex.from_frame(existing[keys])
+    new_keys = pd.MultiIndex.from_frame(new[keys])
+    matched = existing_keys.isin(new_keys)
+    positions = new_keys.get_indexer(existing_keys[matched])
+    result = existing.copy()
+    for column in values:
+        result.loc[matched, column] = new[column].values[positions]
+    return pd.concat([result, new[~new_keys.isin(existing_keys)]], ignore_index=True)
+
+# COMMAND ----------
+
+# Table log
+# -------------------------------------------------------------------------
+# A folder of parquet files with an append-only log of JSON commits in
+# <path>/_log/, checkpointed every TABLE_CHECKPOINT_INTERVAL commits. Commits
+# are created with if_missing, so racing writers retry on the next version.
+TABLE_LOG_PATH = "_log"
+TABLE_CHECKPOINT_INTERVAL = 10
+
+class DatalakeTable:
+    def __init__(self, CONNECTION_STRING, file_system, path):
+        self.CONNECTION_STRING = CONNECTION_STRING
+        self.file_system = file_system
+        self.path = _normalize_path(path)
+        self.log_path = self.path + "/" + TABLE_LOG_PATH
+
+    def _log_file(self, version, suffix=".json"):
+        return "{}/{:020d}{}".format(self.log_path, version, suffix)
+
+    def _read_json(self, path):
+        try:
+            data, etag = datalake_backend().download(self.CONNECTION_STRING, self.file_system, path)
+        except FileNotFoundError:
+            return None
+        return json.loads(data)
+
+    def _checkpoints(self):
+        try:
+            paths = datalake_backend().list_paths(self.CONNECTION_STRING, self.file_system, self.log_path, recursive=False)
+        except FileNotFoundError:
+            return []
+        names = [name.rsplit("/", 1)[-1] for name, is_directory in paths if name.endswith(".checkpoint.json")]
+        return sorted(int(name.split(".", 1)[0]) for name in names)
+
+    def snapshot(self, version=None, as_of=None):
+        """{"version", "timestamp", "schema", "files": {path: file entry}}, or None before the first commit."""
+        state = {"version": -1, "timestamp": None, "schema": None, "files": {}}
+        if version is None and as_of is None:
+            last_checkpoint = self._read_json(self.log_path + "/_last_checkpoint")
+            checkpoints = [last_checkpoint["version"]] if last_checkpoint is not None else []
+        else:
+            checkpoints = [checkpoint for checkpoint in self._checkpoints() if version is None or checkpoint <= version]
+        for checkpoint in reversed(checkpoints):
+            checkpoint = self._read_json(self._log_file(checkpoint, ".checkpoint.json"))
+            if checkpoint is not None and (as_of is None or datetime.fromisoformat(checkpoint["timestamp"]) <= as_of):
+                state = {"version": checkpoint["version"], "timestamp": checkpoint["timestamp"], "schema": checkpoint.get("schema"), "files": {entry["path"]: entry for entry in checkpoint["files"]}}
+                break
+        while version is None or state["version"] < version:
+            commit = self._read_json(self._log_file(state["version"] + 1))
+            if commit is None or (as_of is not None and datetime.fromisoformat(commit["timestamp"]) > as_of):
+                break
+            for path in commit["remove"]:
+                state["files"].pop(path, None)
+            for entry in commit["add"]:
+                state["files"][entry["path"]] = entry
+            if commit.get("schema") is not None:
+                state["schema"] = commit["schema"]
+            state["version"], state["timestamp"] = commit["version"], commit["timestamp"]
+        if version is not None and state["version"] != version:
+            raise ValueError("{} has no version {}".format(self.path, version))
+        return state if state["version"] >= 0 else None
+
+    def commit(self, add=(), remove=(), operation="write", schema=None, retries=10):
+        """Commit added file entries and removed paths, and any new schema; returns the new version."""
+        for attempt in range(retries):
+            snapshot = self.snapshot()
+            files = snapshot["files"] if snapshot is not None else {}
+            missing = [path for path in remove if path not in files]
+            if missing:
+                raise DatalakeConditionFailed("{} not in {}".format(", ".join(missing), self.path))
+            version = snapshot["version"] + 1 if snapshot is not None else 0
+            commit = {"version": version, "timestamp": datetime.now().isoformat(), "operation": operation, "add": list(add), "remove": list(remove), "schema": schema}
+            try:
+                datalake_backend().upload(self.CONNECTION_STRING, self.file_system, self._log_file(version), json.dumps(commit, indent=2).encode("utf-8"), if_missing=True)
+            except DatalakeConditionFailed:
+                # another writer took this version
+                continue
+            if version > 0 and version % TABLE_CHECKPOINT_INTERVAL == 0:
+                self.checkpoint(version)
+            return version
+        raise DatalakeConditionFailed("could not commit to {} after {} attempts".format(self.path, retries))
+
+    def checkpoint(self, version=None):
+        snapshot = self.snapshot(version=version)
+        checkpoint = {"version": snapshot["version"], "timestamp": snapshot["timestamp"], "schema": snapshot["schema"], "files": list(snapshot["files"].values())}
+        backend = datalake_backend()
+        backend.upload(self.CONNECTION_STRING, self.file_system, self._log_file(snapshot["version"], ".checkpoint.json"), json.dumps(checkpoint).encode("utf-8"))
+        last_checkpoint = self._read_json(self.log_path + "/_last_checkpoint")
+        if last_checkpoint is None or last_checkpoint["version"] < snapshot["version"]:
+            backend.upload(self.CONNECTION_STRING, self.file_system, self.log_path + "/_last_checkpoint", json.dumps({"version": snapshot["version"]}).encode("utf-8"))
+
+    def history(self):
+        """One row per commit: version, timestamp, operation and files added and removed."""
+        rows = []
+        version = 0
+        while True:
+            commit = self._read_json(self._log_file(version))
+            if commit is None:
+                break
+            rows.append({"version": version, "timestamp": commit["timestamp"], "operation": commit["operation"],
+                         "files_added": len(commit["add"]), "files_removed": len(commit["remove"]),
+                         "rows_added": sum(entry.get("rows") or 0 for entry in commit["add"])})
+            version += 1
+        return pd.DataFrame(rows, columns=["version", "timestamp", "operation", "files_added", "files_removed", "rows_added"])
+
+    def read(self, columns=None, filters=None, version=None, as_of=None):
+        snapshot = self.snapshot(version=version, as_of=as_of)
+        files = list(snapshot["files"].values()) if snapshot is not None else []
+        manifest = {"schema": snapshot["schema"] if snapshot is not None else None, "partitions": sorted(files, key=lambda entry: entry.get("periods", [])[:1])}
+        return _store_read(self.CONNECTION_STRING, self.file_system, manifest, columns, filters)
+
+def datalake_openTable(CONNECTION_STRING, file_system, path):
+    return DatalakeTable(CONNECTION_STRING, file_system, path)
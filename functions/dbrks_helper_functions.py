@@ -22,46 +22,35 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Helper functions
-# -------------------------------------------------------------------------
-def datalake_download(CONNECTION_STRING, file_system, source_path, source_file):
-    service_client = DataLakeServiceClient.from_connection_string(CONNECTION_STRING)
-    file_system_client = service_client.get_file_system_client(file_system=file_system)
-    directory_client = file_system_client.get_directory_client(source_path)
-    file_client = directory_client.get_file_client(source_file)
-    download = file_client.download_file()
-    downloaded_bytes = download.readall()
-    return downloaded_bytes
-  
-def datalake_upload(file, CONNECTION_STRING, file_system, sink_path, sink_file):
-    service_client = DataLakeServiceClient.from_connection_string(CONNECTION_STRING)
-    file_system_client = service_client.get_file_system_client(file_system=file_system)
-    directory_client = file_system_client.get_directory_client(sink_path)
-    file_client = directory_client.create_file(sink_file)
-    file_length = file_contents.tell()
-    file_client.upload_data(file_contents.getvalue(), length=file_length, overwrite=True)
-    return '200 OK'
-  
-def datalake_latestFolder(CONNECTION_STRING, file_system, source_path):
-  try:
-      service_client = DataLakeServiceClient.from_connection_string(CONNECTION_STRING)
-      file_system_client = service_client.get_file_system_client(file_system=file_system)
-      pathlist = list(file_system_client.get_paths(source_path))
-      folders = []
-      # remove file_path and source_file from list
-      for path in pathlist:
-        folders.append(path.name.replace(source_path.strip("/"), "").lstrip("/").rsplit("/", 1)[0])
-        folders.sort(key=lambda date: datetime.strptime(date, "%Y-%m-%d"), reverse=True)
-      latestFolder = folders[0]+"/"
-      return latestFolder
-  except Exception as e:
-      print(e)
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_datalake_storage
+
+# COMMAND ----------
+
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_datalake_io
+
+# COMMAND ----------
+
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_datalake_store
+
+# COMMAND ----------
+
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_pipeline_config
+
+# COMMAND ----------
+
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_orchestration
 
 # COMMAND ----------
 
 # Ingestion and analytical functions
 # -------------------------------------------------------------------------
 def ons_geoportal_file_download(search_url, url_start, string_filter):
+  import re
+  import json
+  import requests
+  import urllib.request as urlreq
+  from urllib.request import urlopen
+  from bs4 import BeautifulSoup
   url_2 = '/0/query?where=1%3D1&outFields=*&outSR=4326&f=json'
   page = requests.get(search_url)
   response = urlreq.urlopen(search_url)
@@ -73,17 +62,19 @@ def ons_geoportal_file_download(search_url, url_start, string_filter):
   return json_file
 
 def datalake_listContents(CONNECTION_STRING, file_system, source_path):
-  try:
-    service_client = DataLakeServiceClient.from_connection_string(CONNECTION_STRING)
-    file_system_client = service_client.get_file_system_client(file_system=file_system)
-    folder_path = file_system_client.get_paths(path=source_path)
-    file_list = []
-    for path in folder_path:
-      file_list.append(path.name.replace(source_path.strip("/"), "").lstrip("/").rsplit("/", 1)[0])
-    return file_list
-  except Exception as e:
-    print(e)
-    
+    record = _io_new("list", file_system, source_path)
+    try:
+        with _io_track(record):
+            folder_path = datalake_backend().list_paths(CONNECTION_STRING, file_system, source_path)
+        file_list = []
+        for name, is_directory in folder_path:
+            if name.rsplit("/", 1)[-1] == LATEST_MANIFEST:
+                continue
+            file_list.append(name.replace(source_path.strip("/"), "").lstrip("/").rsplit("/", 1)[0])
+        return file_list
+    except Exception as e:
+        print(e)
+
 #Renaming columns for the DSPT GP dataframe
 def rename_dspt_gp_cols(df):
   column_list = []
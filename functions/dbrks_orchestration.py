@@ -0,0 +1,842 @@
+# Databricks notebook source
+#!/usr/bin python3
+
+# -------------------------------------------------------------------------
+# Copyright (c) 2021 NHS England and NHS Improvement. All rights reserved.
+# Licensed under the MIT License. See license.txt in the project root for
+# license information.
+# -------------------------------------------------------------------------
+
+"""
+FILE:           dbrks_orchestration.py
+DESCRIPTION:
+                Notebook orchestration: dependency graphs, incremental runs, telemetry, dry runs and cross-project scheduling
+USAGE:
+                Run by dbrks_helper_functions; notebooks %run that instead
+CONTRIBUTORS:   Craig Shenton, Mattia Ficarelli
+CONTACT:        data@nhsx.nhs.uk
+CREATED:        18 Oct. 2022
+VERSION:        0.0.1
+"""
+
+
+# COMMAND ----------
+
+# Imports
+# -------------------------------------------------------------------------
+# Python:
+import io
+import json
+import os
+import re
+import time
+import hashlib
+import uuid
+import types
+import contextvars
+import resource
+import threading
+import heapq
+import itertools
+import contextlib
+import collections
+import concurrent.futures
+from datetime import datetime
+
+# 3rd party:
+import pandas as pd
+
+# COMMAND ----------
+
+# Notebook orchestration
+# -------------------------------------------------------------------------
+# orchestrator_runNotebooks() starts each entry of a 'databricks' list once its
+# "depends_on" notebooks have finished, at most max_parallel at a time. Entries
+# with "in_process": true run in this process, with their %pip and %run lines dropped.
+NOTEBOOK_SOURCE_ROOTS = ["/Workspace", ""]
+NOTEBOOK_BUILTINS = ("dbutils", "spark", "sc", "sqlContext", "display", "displayHTML", "getArgument")
+
+def _notebook_source_path(notebook):
+    # Repos notebooks are files under /Workspace on the cluster
+    for root in NOTEBOOK_SOURCE_ROOTS:
+        for suffix in ["", ".py"]:
+            path = root + notebook + suffix
+            if os.path.isfile(path):
+                return path
+    raise FileNotFoundError(notebook)
+
+def _notebook_code(path):
+    # magic lines are blanked so tracebacks keep the notebook's line numbers
+    if getattr(_dbrks_state, "notebook_code", None) is None:
+        _dbrks_state.notebook_code = {}
+    mtime = os.stat(path).st_mtime_ns
+    cached = _dbrks_state.notebook_code.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path) as f:
+        lines = ["" if line.startswith(("%", "# MAGIC %")) else line for line in f.read().split("\n")]
+    code = compile("\n".join(lines), path, "exec")
+    _dbrks_state.notebook_code[path] = (mtime, code)
+    return code
+
+def _notebook_definitions(namespace):
+    # what %run of the helper notebooks provides, without the caller's data
+    return {
+        name: value for name, value in namespace.items()
+        if name in NOTEBOOK_BUILTINS or re.fullmatch(r"[A-Z][A-Z0-9_]*", name)
+        or isinstance(value, (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType))
+    }
+
+def notebook_load(notebook, namespace=None):
+    """
+    Load a notebook as a function. Calling it runs the notebook as a new
+    module, seeded with the definitions in namespace (default: the caller's
+    notebook globals) and any keyword arguments, and returns the module, e.g.
+        run_metric = notebook_load("/Repos/prod/au-azure-databricks/analytics/.../metric")
+        df_processed = run_metric().df_processed
+    """
+    path = _notebook_source_path(notebook)
+    base = _notebook_definitions(globals() if namespace is None else namespace)
+    def run(**variables):
+        module = types.ModuleType("__notebook__")
+        module.__dict__.update(base)
+        module.__dict__.update(variables)
+        module.__dict__.update(__name__="__notebook__", __file__=path)
+        exec(_notebook_code(path), module.__dict__)
+        return module
+    return run
+
+def notebook_runInProcess(notebook, timeout_seconds=None):
+    """
+    Run a notebook's source in this process. A thread cannot be killed, so a
+    notebook past timeout_seconds is cancelled: TimeoutError is raised here at
+    once, and the notebook's next datalake call raises DatalakeCancelled, so it
+    cannot read or write anything through the helpers after its timeout.
+    """
+    run = notebook_load(notebook)
+    if not timeout_seconds:
+        run()
+        return None
+    cancel = threading.Event()
+    context = contextvars.copy_context()
+    context.run(_io_cancel.set, cancel)
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(context.run, run)
+    try:
+        future.result(timeout=timeout_seconds)
+    except concurrent.futures.TimeoutError:
+        cancel.set()
+        raise TimeoutError("{} did not finish within {}s and was cancelled".format(notebook, timeout_seconds))
+    finally:
+        executor.shutdown(wait=False)
+    return None
+
+def _notebook_found(notebook):
+    try:
+        _notebook_source_path(notebook)
+    except FileNotFoundError:
+        return False
+    return True
+
+def _notebook_name(notebook):
+    return notebook.rstrip("/").rsplit("/", 1)[-1]
+
+def orchestrator_buildGraph(notebooks):
+    """
+    Returns {index: set of indexes it depends on} for a config 'databricks'
+    list, raising ValueError for unknown dependencies or cycles.
+    """
+    by_name = collections.defaultdict(set)
+    for index, item in enumerate(notebooks):
+        by_name[item['databricks_notebook']].add(index)
+        by_name[_notebook_name(item['databricks_notebook'])].add(index)
+    graph = {}
+    for index, item in enumerate(notebooks):
+        depends_on = item.get('depends_on', [])
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        graph[index] = set()
+        for dependency in depends_on:
+            if dependency not in by_name:
+                raise ValueError("{} depends on unknown notebook {}".format(item['databricks_notebook'], dependency))
+            graph[index] |= by_name[dependency] - {index}
+    # Kahn's algorithm, only to reject cycles before anything runs
+    remaining = {index: set(dependencies) for index, dependencies in graph.items()}
+    ready = [index for index, dependencies in remaining.items() if not dependencies]
+    while ready:
+        done = ready.pop()
+        del remaining[done]
+        for index, dependencies in remaining.items():
+            if done in dependencies:
+                dependencies.discard(done)
+                if not dependencies:
+                    ready.append(index)
+    if remaining:
+        cycle = sorted(notebooks[index]['databricks_notebook'] for index in remaining)
+        raise ValueError("dependency cycle between notebooks: {}".format(", ".join(cycle)))
+    return graph
+
+# Incremental and resumable runs
+# -------------------------------------------------------------------------
+# OrchestratorState keeps each notebook's last successful fingerprint, a ledger
+# of the latest run and per-run telemetry under <adl_file_system>/_orchestration/.
+# Unchanged notebooks are skipped, and resume=True only re-runs what did not succeed.
+ORCHESTRATOR_STATE_PATH = "_orchestration"
+
+def _driver_memory_used():
+    try:
+        with open("/proc/meminfo") as f:
+            meminfo = dict(line.split(":", 1) for line in f)
+        # values are in kB
+        return (int(meminfo["MemTotal"].split()[0]) - int(meminfo["MemAvailable"].split()[0])) * 1024
+    except (OSError, KeyError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+if not hasattr(_dbrks_state, "notebooks_running"):
+    _dbrks_state.notebooks_running = set()
+    _dbrks_state.notebooks_running_lock = threading.Lock()
+
+class _MemoryDelta:
+    # peak rise in driver memory in use over a run, sampled every interval, and
+    # the most orchestrated notebooks that ran alongside it
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak = None
+        self.concurrent = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._used = max(self._used, _driver_memory_used())
+
+    def __enter__(self):
+        with _dbrks_state.notebooks_running_lock:
+            _dbrks_state.notebooks_running.add(self)
+            for memory in _dbrks_state.notebooks_running:
+                memory.concurrent = max(memory.concurrent, len(_dbrks_state.notebooks_running) - 1)
+        self._start = self._used = _driver_memory_used()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._stop.set()
+        self._thread.join()
+        self._used = max(self._used, _driver_memory_used())
+        with _dbrks_state.notebooks_running_lock:
+            _dbrks_state.notebooks_running.discard(self)
+        self.peak = self._used - self._start
+        return False
+
+def _source_keys(source, section='project'):
+    # config keys a notebook reads, e.g. ['project']['source_file_daily']
+    return set(re.findall(r"\['{}'\]\[['\"](\w+)['\"]\]".format(section), source))
+
+def _read_source(notebook):
+    try:
+        with open(_notebook_source_path(notebook)) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _run_sources(source):
+    # {notebook: source} for every notebook source %runs, following nested %runs
+    sources = {}
+    pending = re.findall(r"^# MAGIC %run (\S+)", source, re.MULTILINE)
+    while pending:
+        notebook = pending.pop()
+        if notebook not in sources:
+            sources[notebook] = _read_source(notebook)
+            pending.extend(re.findall(r"^# MAGIC %run (\S+)", sources[notebook] or "", re.MULTILINE))
+    return sources
+
+def _notebook_io(notebook, since):
+    with _dbrks_state.io_lock:
+        records = [record for record in _dbrks_state.io_log if record["notebook"] == notebook and record["started"] >= since]
+    reads = [record for record in records if record["op"] in ("download", "open", "read_parquet")]
+    writes = [record for record in records if record["op"] == "upload"]
+    def total_rows(records):
+        rows = [record["rows"] for record in records if record["rows"] is not None]
+        return sum(rows) if rows else None
+    return {
+        "rows_in": total_rows(reads),
+        "rows_out": total_rows(writes),
+        "bytes_read": sum(record["bytes"] for record in reads) if records else None,
+        "bytes_written": sum(record["bytes"] for record in writes) if records else None,
+    }
+
+def _stored_rows_bytes(state, path, size):
+    # (rows, bytes) of a stored file from its parquet footer or append store
+    # manifest, without reading its data; rows is None for other formats
+    if not path.endswith(".parquet"):
+        return None, size
+    source_path, source_file = path.rsplit("/", 1)
+    try:
+        statistics = datalake_parquetStatistics(state.CONNECTION_STRING, state.file_system, source_path, source_file)
+        return next(iter(statistics.values()), {}).get("rows"), size
+    except FileNotFoundError:
+        manifest = _store_manifest(state.CONNECTION_STRING, state.file_system, _normalize_path(path))
+        if manifest is None:
+            return None, size
+        partitions = manifest["partitions"]
+        return sum(partition["rows"] or 0 for partition in partitions), sum(partition.get("bytes") or 0 for partition in partitions)
+    except Exception:
+        return None, size
+
+def _storage_output(state, item):
+    # (path, properties) of the file a config entry writes, or None
+    if not item.get('sink_path') or not item.get('sink_file'):
+        return None
+    try:
+        latest_folder = datalake_latestFolder(state.CONNECTION_STRING, state.file_system, item['sink_path'])
+        path = item['sink_path'] + latest_folder + item['sink_file']
+        return path, datalake_backend().properties(state.CONNECTION_STRING, state.file_system, path)
+    except FileNotFoundError:
+        return None
+
+def _storage_io(state, item, output_before):
+    # a dbutils run happens in another process, so its I/O is taken from
+    # storage metadata: the project inputs it reads and the sink file it wrote
+    inputs = [_stored_rows_bytes(state, path, properties.size) for path, properties in (state.inputs(item) or {}).items()]
+    output = _storage_output(state, item)
+    written = output is not None and (output_before is None or output[1].etag != output_before[1].etag)
+    rows_out, bytes_written = _stored_rows_bytes(state, output[0], output[1].size) if written else (None, None)
+    return {
+        "rows_in": sum(rows for rows, size in inputs) if inputs and all(rows is not None for rows, size in inputs) else None,
+        "rows_out": rows_out,
+        "bytes_read": sum(size for rows, size in inputs) if inputs else None,
+        "bytes_written": bytes_written,
+    }
+
+class OrchestratorState:
+    def __init__(self, CONNECTION_STRING, config_JSON, name, section='project', incremental=True):
+        self.CONNECTION_STRING = CONNECTION_STRING
+        self.file_system = config_JSON['pipeline']['adl_file_system']
+        self.project = config_JSON['pipeline'][section]
+        self.section = section
+        self.incremental = incremental
+        self.name = name
+        self.path = "{}/{}.json".format(ORCHESTRATOR_STATE_PATH, name)
+        self.telemetry_path = "{}/telemetry/{}".format(ORCHESTRATOR_STATE_PATH, name)
+        self.run_path = "{}/{}.run.json".format(ORCHESTRATOR_STATE_PATH, name)
+        self._lock = threading.Lock()
+        self._latest_folders = {}
+        self.skipped = []
+        self.resumed = []
+        self.notebooks = self._load(self.path, {"notebooks": {}})["notebooks"]
+        self.last_run = self._load(self.run_path, None)
+        self.run = None
+
+    def _load(self, path, default):
+        try:
+            state, etag = datalake_backend().download(self.CONNECTION_STRING, self.file_system, path)
+        except FileNotFoundError:
+            return default
+        return json.loads(state)
+
+    def _save(self, path, state):
+        state = json.dumps(state, indent=2, sort_keys=True, default=str).encode("utf-8")
+        datalake_backend().upload(self.CONNECTION_STRING, self.file_system, path, state)
+
+    def _latest_folder(self, source_path):
+        with self._lock:
+            if source_path not in self._latest_folders:
+                try:
+                    self._latest_folders[source_path] = datalake_latestFolder(self.CONNECTION_STRING, self.file_system, source_path)
+                except FileNotFoundError:
+                    self._latest_folders[source_path] = None
+            return self._latest_folders[source_path]
+
+    def _source(self, item):
+        return _read_source(item['databricks_notebook'])
+
+    def inputs(self, item, source=None):
+        """
+        Returns {path: properties} for the project inputs a notebook's source
+        refers to, or None if its source or one of the inputs cannot be found.
+        """
+        source = self._source(item) if source is None else source
+        if source is None:
+            return None
+        keys = _source_keys(source, self.section)
+        inputs = {}
+        for path_key, file_key in _config_inputs(self.project):
+            if path_key not in keys or file_key not in keys:
+                continue
+            source_path, source_file = self.project[path_key], self.project[file_key]
+            latest_folder = self._latest_folder(source_path)
+            if latest_folder is None:
+                return None
+            path = source_path + latest_folder + source_file
+            try:
+                inputs[path] = datalake_backend().properties(self.CONNECTION_STRING, self.file_system, path)
+            except FileNotFoundError:
+                # an append store's manifest changes whenever the store does
+                try:
+                    inputs[path] = datalake_backend().properties(self.CONNECTION_STRING, self.file_system, path + STORE_MANIFEST_SUFFIX)
+                except FileNotFoundError:
+                    return None
+        return inputs
+
+    def fingerprint(self, item):
+        """Returns the fingerprint of a config entry, or None if it cannot be taken."""
+        if not self.incremental or not item.get('incremental', True):
+            return None
+        source = self._source(item)
+        inputs = self.inputs(item, source) if source is not None else None
+        if not inputs:
+            return None
+        project = {key: value for key, value in self.project.items() if key != 'databricks'}
+        helpers = _run_sources(source)
+        parts = {
+            "code": hashlib.sha256(source.encode("utf-8")).hexdigest(),
+            "helpers": {notebook: hashlib.sha256((helper or "").encode("utf-8")).hexdigest() for notebook, helper in helpers.items()},
+            "config": json.dumps({"item": item, "project": project}, sort_keys=True, default=str),
+            "inputs": {path: "{}:{}".format(properties.etag, properties.size) for path, properties in inputs.items()},
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def unchanged(self, item, fingerprint):
+        last = self.notebooks.get(item['databricks_notebook'])
+        return fingerprint is not None and last is not None and last["fingerprint"] == fingerprint
+
+    def resumable(self, item):
+        # succeeded (or was skipped) in the last run, which did not finish,
+        # with the same config entry
+        if self.last_run is None or self.last_run["status"] == "succeeded":
+            return False
+        last = self.last_run["notebooks"].get(item['databricks_notebook'])
+        return last is not None and last["status"] in ("succeeded", "skipped") and last["config"] == json.dumps(item, sort_keys=True, default=str)
+
+    def start_run(self):
+        self.run = {"run_id": uuid.uuid4().hex, "started": datetime.now(), "finished": None, "status": "running", "notebooks": {}}
+        self.telemetry = []
+        self._save(self.run_path, self.run)
+
+    def finish_notebook(self, item, status, seconds=None, result=None, error=None, fingerprint=None, telemetry=None):
+        notebook = item['databricks_notebook']
+        if telemetry is not None:
+            self.telemetry.append(dict(telemetry, run_id=self.run["run_id"], orchestrator=self.name, notebook=notebook, status=status))
+        if status == "resumed":
+            entry = dict(self.last_run["notebooks"][notebook], resumed_from=self.last_run["run_id"])
+        else:
+            entry = {
+                "status": status,
+                "seconds": seconds,
+                "finished": datetime.now(),
+                "result": result,
+                "error": error,
+                "config": json.dumps(item, sort_keys=True, default=str),
+            }
+        self.run["notebooks"][notebook] = entry
+        self._save(self.run_path, self.run)
+        if status == "succeeded" and self.incremental:
+            if fingerprint is None:
+                self.notebooks.pop(notebook, None)
+            else:
+                self.notebooks[notebook] = {"fingerprint": fingerprint, "finished": datetime.now().isoformat()}
+            self._save(self.path, {"notebooks": self.notebooks})
+
+    def finish_run(self, status):
+        self.run["status"] = status
+        self.run["finished"] = datetime.now()
+        self._save(self.run_path, self.run)
+        self.last_run = json.loads(json.dumps(self.run, default=str))
+        if self.telemetry:
+            try:
+                self._save_telemetry()
+            except Exception as e:
+                print(e)
+
+    def _save_telemetry(self):
+        columns = ["run_id", "orchestrator", "notebook", "started", "status", "seconds", "peak_memory_delta_bytes",
+                   "concurrent_notebooks", "rows_in", "rows_out", "bytes_read", "bytes_written", "in_process"]
+        telemetry = pd.DataFrame(self.telemetry, columns=columns)
+        for column in ["peak_memory_delta_bytes", "concurrent_notebooks", "rows_in", "rows_out", "bytes_read", "bytes_written"]:
+            telemetry[column] = telemetry[column].astype("Int64")
+        file_contents = io.BytesIO()
+        telemetry.to_parquet(file_contents, engine="pyarrow", index=False)
+        sink_file = "{:%Y%m%dT%H%M%S}_{}.parquet".format(self.run["started"], self.run["run_id"])
+        datalake_backend().upload(self.CONNECTION_STRING, self.file_system, self.telemetry_path + "/" + sink_file, file_contents.getvalue())
+
+    def telemetry_history(self):
+        try:
+            paths = datalake_backend().list_paths(self.CONNECTION_STRING, self.file_system, self.telemetry_path)
+        except FileNotFoundError:
+            return pd.DataFrame()
+        files = [name.rsplit("/", 1)[1] for name, is_directory in paths if not is_directory and name.endswith(".parquet")]
+        frames = [pd.read_parquet(io.BytesIO(data)) for name, data in datalake_download_many(self.CONNECTION_STRING, self.file_system, self.telemetry_path, files)]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).sort_values("started", ignore_index=True)
+
+def orchestrator_loadState(CONNECTION_STRING, config_JSON, name, section='project', incremental=True):
+    return OrchestratorState(CONNECTION_STRING, config_JSON, name, section, incremental)
+
+def orchestrator_telemetryReport(state, window=10, threshold=1.5, min_seconds=30):
+    """
+    Compare each notebook's latest successful run with the median of its
+    previous `window` successful runs. A notebook is flagged when its time
+    (if over min_seconds) or its peak memory rise grew by more than
+    `threshold` times. Runs from before memory rises were recorded are left out
+    of the memory comparison.
+    """
+    history = state.telemetry_history()
+    if history.empty:
+        return history
+    history = history[history["status"] == "succeeded"]
+    rows = []
+    for notebook, runs in history.groupby("notebook"):
+        latest, previous = runs.iloc[-1], runs.iloc[:-1].tail(window)
+        row = {"notebook": notebook, "runs": len(previous), "seconds": latest["seconds"],
+               "peak_memory_delta_bytes": latest.get("peak_memory_delta_bytes"), "concurrent_notebooks": latest.get("concurrent_notebooks")}
+        for column in ["seconds", "peak_memory_delta_bytes"]:
+            if column not in runs:
+                row[column + "_median"] = row[column + "_ratio"] = None
+                continue
+            median = previous[column].median() if len(previous) else None
+            recorded = not pd.isna(latest[column]) and median is not None and not pd.isna(median) and median > 0
+            row[column + "_median"] = median
+            row[column + "_ratio"] = latest[column] / median if recorded else None
+        row["regression"] = bool(
+            (row["seconds_ratio"] is not None and row["seconds_ratio"] > threshold and latest["seconds"] > min_seconds)
+            or (row["peak_memory_delta_bytes_ratio"] is not None and row["peak_memory_delta_bytes_ratio"] > threshold)
+        )
+        rows.append(row)
+    report = pd.DataFrame(rows)
+    for notebook in report.loc[report["regression"], "notebook"]:
+        print("Performance regression: {}".format(notebook))
+    return report
+
+# Dry runs
+# -------------------------------------------------------------------------
+# orchestrator_estimateRun() predicts which notebooks a run would execute, their
+# inputs, outputs and expected time, from listings and past telemetry only.
+def _expected_seconds(state, window=10):
+    history = state.telemetry_history()
+    if history.empty:
+        return {}
+    history = history[history["status"] == "succeeded"]
+    return {notebook: runs["seconds"].tail(window).median() for notebook, runs in history.groupby("notebook")}
+
+def _simulate_run(graph, seconds, max_parallel):
+    # list scheduling in index order, as orchestrator_runNotebooks starts them
+    waiting = {index: set(dependencies) for index, dependencies in graph.items()}
+    running = []
+    clock = 0.0
+    while waiting or running:
+        ready = [index for index, dependencies in waiting.items() if not dependencies]
+        for index in ready[:max_parallel - len(running)]:
+            del waiting[index]
+            heapq.heappush(running, (clock + seconds[index], index))
+        if not running:
+            break
+        clock, done = heapq.heappop(running)
+        for dependencies in waiting.values():
+            dependencies.discard(done)
+    return clock
+
+def _planned_runs(notebooks, graph, state, resume=False):
+    """
+    The notebooks in a topological order and {index: whether it would run},
+    skipping those orchestrator_runNotebooks would skip as unchanged or resumed.
+    """
+    order = []
+    remaining = list(range(len(notebooks)))
+    while remaining:
+        index = next(index for index in remaining if graph[index] <= set(order))
+        remaining.remove(index)
+        order.append(index)
+    will_run = {}
+    for index in order:
+        item = notebooks[index]
+        upstream_runs = any(will_run[dependency] for dependency in graph[index])
+        if not upstream_runs and resume and state.resumable(item):
+            will_run[index] = False
+        elif not upstream_runs and state.incremental:
+            will_run[index] = not state.unchanged(item, state.fingerprint(item))
+        else:
+            will_run[index] = True
+    return order, will_run
+
+def orchestrator_estimateRun(notebooks, state, max_parallel=8, resume=False, window=10):
+    """Estimate a run of a config 'databricks' list without running it, see above."""
+    graph = orchestrator_buildGraph(notebooks)
+    history = state.telemetry_history()
+    if not history.empty:
+        history = history[history["status"] == "succeeded"]
+    expected = _expected_seconds(state, window)
+    last_notebooks = state.last_run["notebooks"] if state.last_run is not None else {}
+    rows = []
+    order, will_run = _planned_runs(notebooks, graph, state, resume)
+    for index in order:
+        item = notebooks[index]
+        notebook = item['databricks_notebook']
+        runs = history[history["notebook"] == notebook].tail(window) if not history.empty else history
+        inputs = state.inputs(item) or {}
+        bytes_in = sum(properties.size for properties in inputs.values()) if inputs else None
+        if bytes_in is None and not runs.empty:
+            bytes_in = runs["bytes_read"].median()
+        output = None
+        bytes_out = runs["bytes_written"].median() if not runs.empty else None
+        if item.get('sink_path') and item.get('sink_file'):
+            latest_folder = state._latest_folder(item['sink_path'])
+            if latest_folder is not None:
+                output = item['sink_path'] + latest_folder + item['sink_file']
+                if bytes_out is None or pd.isna(bytes_out):
+                    try:
+                        bytes_out = datalake_backend().properties(state.CONNECTION_STRING, state.file_system, output).size
+                    except FileNotFoundError:
+                        pass
+        seconds = expected.get(notebook)
+        if seconds is None and notebook in last_notebooks:
+            seconds = last_notebooks[notebook].get("seconds")
+        rows.append({
+            "notebook": notebook,
+            "will_run": will_run[index],
+            "inputs": sorted(inputs),
+            "bytes_in": bytes_in,
+            "output": output,
+            "bytes_out": bytes_out,
+            "expected_seconds": seconds,
+        })
+    estimate = pd.DataFrame(rows, columns=["notebook", "will_run", "inputs", "bytes_in", "output", "bytes_out", "expected_seconds"])
+    estimate = estimate.set_index(pd.Index(order)).sort_index()
+    runs = estimate[estimate["will_run"]]
+    seconds = {index: row["expected_seconds"] if row["will_run"] and not pd.isna(row["expected_seconds"]) else 0 for index, row in estimate.iterrows()}
+    print("{} of {} notebooks would run, reading {:.1f} MB and writing {} files ({:.1f} MB), in about {:.0f}s".format(
+        len(runs), len(estimate), (runs["bytes_in"].fillna(0).sum()) / 2**20, int(runs["output"].notna().sum()),
+        (runs["bytes_out"].fillna(0).sum()) / 2**20, _simulate_run(graph, seconds, max_parallel)))
+    return estimate.reset_index(drop=True)
+
+def orchestrator_runNotebooks(notebooks, timeout_seconds=1000, max_parallel=8, run_notebook=None, in_process=False, state=None, resume=False,
+                              slots=None, slot_priority=None):
+    """
+    Run a config 'databricks' list as a DAG and return {notebook: result}.
+    run_notebook(path, timeout_seconds) defaults to dbutils.notebook.run, or
+    notebook_runInProcess for entries with "in_process": true (or all entries,
+    with in_process=True). With an OrchestratorState
+    the run is recorded and unchanged notebooks are skipped (state.skipped);
+    resume=True also keeps what succeeded in an unfinished last run (state.resumed).
+    With OrchestratorSlots each notebook also waits for a slot in that shared
+    pool, queued by slot_priority(item).
+    """
+    if run_notebook is None:
+        run_notebook = lambda notebook, timeout: dbutils.notebook.run(notebook, timeout)
+    graph = orchestrator_buildGraph(notebooks)
+    waiting = {index: set(dependencies) for index, dependencies in graph.items()}
+    ready = collections.deque(index for index in range(len(notebooks)) if not waiting[index])
+    for index in ready:
+        del waiting[index]
+    results = {}
+    failure = None
+    running = {}
+    ran = set()
+    telemetries = {}
+    if state is not None:
+        state.start_run()
+
+    def run(index):
+        item = notebooks[index]
+        # dependencies have all finished by now, so ran is settled for them
+        upstream_ran = graph[index] & ran
+        if state is not None and resume and not upstream_ran and state.resumable(item):
+            return None, 0, None, "resumed"
+        fingerprint = None
+        if state is not None:
+            fingerprint = state.fingerprint(item)
+            if not upstream_ran and state.unchanged(item, fingerprint):
+                return None, 0, fingerprint, "skipped"
+        in_process_run = item.get('in_process', in_process)
+        if in_process_run and not _notebook_found(item['databricks_notebook']):
+            print("{} source not found, running it with dbutils.notebook.run".format(item['databricks_notebook']))
+            in_process_run = False
+        runner = notebook_runInProcess if in_process_run else run_notebook
+        slot = contextlib.nullcontext() if slots is None else slots.slot(slot_priority(item) if slot_priority is not None else ())
+        with slot:
+            telemetry = {"started": datetime.now(), "in_process": bool(in_process_run)}
+            output_before = _storage_output(state, item) if state is not None and not in_process_run else None
+            token = _io_notebook.set(item['databricks_notebook'])
+            start = time.perf_counter()
+            try:
+                with _MemoryDelta() as memory:
+                    result = runner(item['databricks_notebook'], item.get('timeout_seconds', timeout_seconds))
+            finally:
+                _io_notebook.reset(token)
+                telemetry["seconds"] = time.perf_counter() - start
+                telemetry["peak_memory_delta_bytes"] = memory.peak
+                telemetry["concurrent_notebooks"] = memory.concurrent
+                if in_process_run:
+                    telemetry.update(_notebook_io(item['databricks_notebook'], telemetry["started"]))
+                elif state is not None:
+                    try:
+                        telemetry.update(_storage_io(state, item, output_before))
+                    except Exception as e:
+                        print("could not read the I/O of {}: {}".format(item['databricks_notebook'], e))
+                telemetries[index] = telemetry
+        return result, telemetry["seconds"], fingerprint, "succeeded"
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel)
+    try:
+        while ready or running:
+            while ready and failure is None and len(running) < max_parallel:
+                index = ready.popleft()
+                running[executor.submit(run, index)] = index
+            if not running:
+                break
+            done, not_done = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                notebook = notebooks[index]['databricks_notebook']
+                try:
+                    result, seconds, fingerprint, status = future.result()
+                except Exception as e:
+                    print(e)
+                    print("{} failed".format(notebook))
+                    if failure is None:
+                        failure = (notebook, e)
+                    if state is not None:
+                        state.finish_notebook(notebooks[index], "failed", error="{}: {}".format(type(e).__name__, e), telemetry=telemetries.get(index))
+                    continue
+                if status == "skipped":
+                    print("{} skipped, inputs unchanged".format(notebook))
+                    state.skipped.append(notebook)
+                elif status == "resumed":
+                    print("{} succeeded in the last run, not re-run".format(notebook))
+                    state.resumed.append(notebook)
+                else:
+                    print("{} finished in {:.0f}s".format(notebook, seconds))
+                    results[notebook] = result
+                    ran.add(index)
+                if state is not None:
+                    state.finish_notebook(notebooks[index], status, seconds, result, fingerprint=fingerprint, telemetry=telemetries.get(index))
+                for waiting_index, dependencies in list(waiting.items()):
+                    dependencies.discard(index)
+                    if not dependencies:
+                        del waiting[waiting_index]
+                        ready.append(waiting_index)
+    finally:
+        executor.shutdown(wait=False)
+        if state is not None:
+            state.finish_run("failed" if failure is not None or ready or running or waiting else "succeeded")
+    if state is not None and state.skipped:
+        print("Skipped {} unchanged notebooks".format(len(state.skipped)))
+    if state is not None and state.resumed:
+        print("Resumed {} notebooks from the last run".format(len(state.resumed)))
+    if failure is not None:
+        raise Exception("{} failed: {}".format(*failure)) from failure[1]
+    return results
+
+# Cross-project scheduling
+# -------------------------------------------------------------------------
+# orchestrator_runProjects() shares max_parallel notebook slots between several
+# projects, handing them out by priority, staleness and expected run time.
+class OrchestratorSlots:
+    """A pool of notebook slots, handed out lowest priority key first."""
+    def __init__(self, size):
+        self.size = size
+        self._in_use = 0
+        self._waiting = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def slot(self, key=()):
+        # the counter keeps equal keys first come, first served
+        entry = (key, next(self._order))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while self._waiting[0] != entry or self._in_use >= self.size:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._in_use += 1
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify_all()
+
+def _days_stale(state):
+    last_run = state.last_run
+    if last_run is None or last_run["status"] != "succeeded" or not last_run.get("finished"):
+        return float("inf")
+    return (datetime.now() - datetime.fromisoformat(str(last_run["finished"]))).days
+
+def orchestrator_runProjects(CONNECTION_STRING, file_system_config, file_path_config, projects, max_parallel=8, run_notebook=None, resume=False, dry_run=False):
+    """
+    Run projects' notebooks on a shared pool of max_parallel slots, see above.
+    Returns {project name: OrchestratorState}, or with dry_run=True the
+    estimates of every project's run in one DataFrame.
+    """
+    # reuses the notebook graph checks for unknown projects and cycles
+    graph = orchestrator_buildGraph([{'databricks_notebook': project['name'], 'depends_on': project.get('depends_on', [])} for project in projects])
+    plans = []
+    for project in projects:
+        config_path = project.get('file_path_config', file_path_config)
+        config_JSON = datalake_loadConfig(CONNECTION_STRING, file_system_config, config_path, project['file_name_config'], refresh=True).json()
+        section = project.get('section', 'project')
+        state = orchestrator_loadState(CONNECTION_STRING, config_JSON, project['name'], section, project.get('incremental', True))
+        expected = _expected_seconds(state)
+        notebooks = config_JSON['pipeline'][section]['databricks']
+        key = (project.get('priority', 2), -_days_stale(state), sum(expected.get(item['databricks_notebook'], 0) for item in notebooks))
+        plans.append({"project": project, "config_JSON": config_JSON, "state": state, "expected": expected, "notebooks": notebooks, "key": key})
+    # upstream projects first, otherwise in key order
+    order = sorted(range(len(plans)), key=lambda index: plans[index]["key"])
+    submitted = []
+    while order:
+        index = next(index for index in order if graph[index] <= set(submitted))
+        order.remove(index)
+        submitted.append(index)
+    for index in submitted:
+        priority, stale, seconds = plans[index]["key"]
+        stale = "no successful last run" if stale == float("-inf") else "last run {:.0f} days ago".format(-stale)
+        print("{}: priority {}, {}, about {:.0f}s".format(plans[index]["project"]['name'], priority, stale, seconds))
+    if dry_run:
+        estimates = []
+        for index in submitted:
+            print(plans[index]["project"]['name'])
+            estimate = orchestrator_estimateRun(plans[index]["notebooks"], plans[index]["state"], max_parallel, resume)
+            estimate.insert(0, "project", plans[index]["project"]['name'])
+            estimates.append(estimate)
+        return pd.concat(estimates, ignore_index=True) if estimates else pd.DataFrame()
+
+    slots = OrchestratorSlots(max_parallel)
+    def run(plan, upstream):
+        failed = [name for name, future in upstream if future.exception() is not None]
+        if failed:
+            raise Exception("not run because {} failed".format(", ".join(failed)))
+        project = plan["project"]
+        prefetched = []
+        if project.get('prefetch', False):
+            with slots.slot(plan["key"]):
+                prefetched = orchestrator_prefetchInputs(CONNECTION_STRING, plan["config_JSON"], state=plan["state"], resume=resume)
+        try:
+            return orchestrator_runNotebooks(
+                plan["notebooks"],
+                timeout_seconds=project.get('timeout_seconds', 1000),
+                max_parallel=max_parallel,
+                run_notebook=run_notebook,
+                state=plan["state"],
+                resume=resume,
+                slots=slots,
+                slot_priority=lambda item: plan["key"] + (-plan["expected"].get(item['databricks_notebook'], 0),),
+            )
+        finally:
+            datalake_clearPrefetched(plan["config_JSON"]['pipeline']['adl_file_system'], prefetched)
+
+    futures = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(plans) or 1) as executor:
+        for index in submitted:
+            upstream = [(plans[dependency]["project"]['name'], futures[dependency]) for dependency in graph[index]]
+            futures[index] = executor.submit(run, plans[index], upstream)
+    failures = []
+    for index in submitted:
+        error = futures[index].exception()
+        if error is not None:
+            print("{} failed: {}".format(plans[index]["project"]['name'], error))
+            failures.append((plans[index]["project"]['name'], error))
+    if failures:
+        raise Exception("{} failed".format(", ".join(name for name, error in failures))) from failures[0][1]
+    return {plan["project"]['name']: plan["state"] for plan in plans}
@@ -0,0 +1,132 @@
+# Databricks notebook source
+#!/usr/bin python3
+
+# -------------------------------------------------------------------------
+# Copyright (c) 2021 NHS England and NHS Improvement. All rights reserved.
+# Licensed under the MIT License. See license.txt in the project root for
+# license information.
+# -------------------------------------------------------------------------
+
+"""
+FILE:           dbrks_pipeline_config.py
+DESCRIPTION:
+                Loading and validating pipeline config files
+USAGE:
+                Run by dbrks_helper_functions; notebooks %run that instead
+CONTRIBUTORS:   Craig Shenton, Mattia Ficarelli
+CONTACT:        data@nhsx.nhs.uk
+CREATED:        18 Oct. 2022
+VERSION:        0.0.1
+"""
+
+
+# COMMAND ----------
+
+# Imports
+# -------------------------------------------------------------------------
+# Python:
+import json
+import threading
+import collections
+
+# COMMAND ----------
+
+# Pipeline config
+# -------------------------------------------------------------------------
+# datalake_loadConfig() caches each parsed config per process; notebook entries
+# are looked up by name, e.g. pipeline_config.notebook("dbrks_...").sink_path
+class PipelineConfigError(ValueError):
+    """Raised when a pipeline config is missing required fields."""
+
+NotebookConfig = collections.namedtuple(
+    "NotebookConfig", ["name", "databricks_notebook", "sink_path", "sink_file", "depends_on", "timeout_seconds", "values"]
+)
+
+def _config_name(notebook):
+    # config paths are workspace paths without the .py the repo files have
+    name = _notebook_name(notebook)
+    return name[:-3] if name.endswith(".py") else name
+
+def _notebook_config(entry, where):
+    if not isinstance(entry, dict) or not isinstance(entry.get('databricks_notebook'), str):
+        raise PipelineConfigError("{}: every entry needs a 'databricks_notebook' path".format(where))
+    depends_on = entry.get('depends_on', [])
+    if isinstance(depends_on, str):
+        depends_on = [depends_on]
+    if not isinstance(depends_on, list) or not all(isinstance(dependency, str) for dependency in depends_on):
+        raise PipelineConfigError("{}: 'depends_on' must be a notebook name or a list of them".format(where))
+    timeout_seconds = entry.get('timeout_seconds')
+    if timeout_seconds is not None and not isinstance(timeout_seconds, int):
+        raise PipelineConfigError("{}: 'timeout_seconds' must be an integer".format(where))
+    return NotebookConfig(
+        _config_name(entry['databricks_notebook']),
+        entry['databricks_notebook'],
+        entry.get('sink_path'),
+        entry.get('sink_file'),
+        tuple(depends_on),
+        timeout_seconds,
+        entry,
+    )
+
+class PipelineSection:
+    def __init__(self, name, values, where):
+        self.name = name
+        self.values = values
+        self.notebooks = tuple(
+            _notebook_config(entry, "{} {}[{}]".format(where, name, index)) for index, entry in enumerate(values.get('databricks', []))
+        )
+        self._by_name = {notebook.name: notebook for notebook in self.notebooks}
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def notebook(self, name):
+        return self._by_name[_config_name(name)]
+
+class PipelineConfig:
+    def __init__(self, config_JSON, where="config"):
+        pipeline = config_JSON.get('pipeline') if isinstance(config_JSON, dict) else None
+        if not isinstance(pipeline, dict):
+            raise PipelineConfigError("{}: missing 'pipeline'".format(where))
+        self.file_system = pipeline.get('adl_file_system')
+        self.sections = {
+            name: PipelineSection(name, values, where) for name, values in pipeline.items()
+            if isinstance(values, dict) and isinstance(values.get('databricks'), list)
+        }
+        self._json = json.dumps(config_JSON)
+
+    @property
+    def project(self):
+        return self.sections['project']
+
+    def notebook(self, name):
+        """The entry for a notebook name or path in any section."""
+        for section in self.sections.values():
+            try:
+                return section.notebook(name)
+            except KeyError:
+                pass
+        names = sorted(notebook.name for section in self.sections.values() for notebook in section.notebooks)
+        raise KeyError("{} is not in the config; it has {}".format(_config_name(name), ", ".join(names)))
+
+    def json(self):
+        # a fresh copy, so a notebook changing its config_JSON cannot affect others
+        return json.loads(self._json)
+
+if getattr(_dbrks_state, "configs", None) is None:
+    _dbrks_state.configs = {}
+    _dbrks_state.configs_lock = threading.Lock()
+
+def datalake_loadConfig(CONNECTION_STRING, file_system, file_path, file_name, refresh=False):
+    key = (file_system, _normalize_path(file_path + "/" + file_name))
+    with _dbrks_state.configs_lock:
+        config = _dbrks_state.configs.get(key)
+    if config is None or refresh:
+        config_JSON = json.loads(datalake_download(CONNECTION_STRING, file_system, file_path, file_name))
+        config = PipelineConfig(config_JSON, file_name)
+        with _dbrks_state.configs_lock:
+            _dbrks_state.configs[key] = config
+    return config
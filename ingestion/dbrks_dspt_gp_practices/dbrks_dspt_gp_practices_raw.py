@@ -22,9 +22,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.* xlrd openpyxl python-dateutil
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -40,12 +38,9 @@ import json
 # 3rd party:
 import pandas as pd
 import numpy as np
-import requests
 from pathlib import Path
 from urllib import request as urlreq
-from bs4 import BeautifulSoup
 from azure.storage.filedatalake import DataLakeServiceClient
-from dateutil.relativedelta import relativedelta
 
 # Connect to Azure datalake
 # -------------------------------------------------------------------------
@@ -63,8 +58,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_dspt_gp_practices_historical_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -97,29 +92,17 @@ df_processed = process_dspt_dataframe(new_dataframe, new_source_file, year)
 
 # COMMAND ----------
 
-# Pull historical dataset
+# Open the historical dataset's append store
 # -----------------------------------------------------------------------
-latestFolder_historical = datalake_latestFolder(CONNECTION_STRING, file_system, historical_source_path)
-historical_dataset = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder_historical, historical_source_file)
-historical_dataframe = pd.read_parquet(io.BytesIO(historical_dataset), engine="pyarrow")
+# Column types of the historical dataset, enforced on append
+schema = {"Code": "string", "Snapshot_Date": "date:%d/%m/%Y"}
+store = datalake_appendStore(CONNECTION_STRING, file_system, sink_path, sink_file, period_column="DSPT_Edition", schema=schema)
 
 # Append new data to historical data
 # -----------------------------------------------------------------------
-dspt_editions_in_historical = historical_dataframe["DSPT_Edition"].unique().tolist()
 dspt_editions_in_new = df_processed["DSPT_Edition"].unique().tolist()[0]
-if dspt_editions_in_new in dspt_editions_in_historical:
+if store.contains(dspt_editions_in_new):
   print('Data already exists in historical data')
 else:
-  historical_dataframe = historical_dataframe.append(df_processed)
-  historical_dataframe = historical_dataframe.sort_values(by=['Snapshot_Date'])
-  historical_dataframe = historical_dataframe.reset_index(drop=True)
-  historical_dataframe = historical_dataframe.astype(str)
-
-# COMMAND ----------
-
-#Upload hsitorical appended data to datalake
-# -----------------------------------------------------------------------
-current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
-file_contents = io.BytesIO()
-historical_dataframe.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file)
+  # Upload the new data as its own partition of the historical dataset
+  store.append(df_processed.sort_values(by=['Snapshot_Date']))
@@ -22,9 +22,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -40,10 +38,8 @@ import json
 # 3rd party:
 import pandas as pd
 import numpy as np
-import requests
 from pathlib import Path
 from urllib import request as urlreq
-from bs4 import BeautifulSoup
 from azure.storage.filedatalake import DataLakeServiceClient
 
 # Connect to Azure datalake
@@ -62,8 +58,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_duec_eddi_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -83,35 +79,22 @@ sink_file = config_JSON['pipeline']['raw']['appended_file']
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, new_source_path)
 eddi_file_name_list = datalake_listContents(CONNECTION_STRING, file_system, new_source_path+latestFolder)
 allnew_dataframe = pd.DataFrame()
-for new_source_file in eddi_file_name_list:
-  new_dataset = datalake_download(CONNECTION_STRING, file_system, new_source_path+latestFolder, new_source_file)
+for new_source_file, new_dataset in datalake_download_many(CONNECTION_STRING, file_system, new_source_path+latestFolder, eddi_file_name_list, ordered=True):
   new_dataframe = pd.read_csv(io.BytesIO(new_dataset))
   new_dataframe['Date and time of extract dd-MM-yyyy HH:mm:ss'] = pd.to_datetime(new_dataframe['Date and time of extract dd-MM-yyyy HH:mm:ss'], format='%d-%m-%Y %H:%M:%S')
   allnew_dataframe = allnew_dataframe.append(new_dataframe).reset_index(drop=True)
 
 # COMMAND ----------
 
-# Pull historical dataset
+# Open the historical dataset's append store
 # -----------------------------------------------------------------------
-latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, historical_source_path)
-historical_dataset = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder, historical_source_file)
-historical_dataframe = pd.read_parquet(io.BytesIO(historical_dataset), engine="pyarrow")
+store = datalake_appendStore(CONNECTION_STRING, file_system, sink_path, sink_file, period_column="Date and time of extract dd-MM-yyyy HH:mm:ss")
 
 # Append new data to historical data
 # -----------------------------------------------------------------------
 date_from_new_dataframe = allnew_dataframe['Date and time of extract dd-MM-yyyy HH:mm:ss'].values.max()
-dates_in_historical = list(historical_dataframe['Date and time of extract dd-MM-yyyy HH:mm:ss'].unique())
-if date_from_new_dataframe in dates_in_historical:
+if store.contains(date_from_new_dataframe):
   print("data already exists")
 else:
-  historical_dataframe = historical_dataframe.append(allnew_dataframe)
-  historical_dataframe = historical_dataframe.sort_values(by=['Date and time of extract dd-MM-yyyy HH:mm:ss'])
-  historical_dataframe = historical_dataframe.reset_index(drop=True)
-
-# COMMAND ----------
-
-# Upload hsitorical appended data to datalake
-current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
-file_contents = io.BytesIO()
-historical_dataframe.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file)
+  # Upload the new data as its own partition of the historical dataset
+  store.append(allnew_dataframe.sort_values(by=['Date and time of extract dd-MM-yyyy HH:mm:ss']))
@@ -23,9 +23,7 @@ VERSION:        0.0.2
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -42,7 +40,6 @@ import json
 # 3rd party:
 import pandas as pd
 import numpy as np
-import requests
 from pathlib import Path
 from urllib import request as urlreq
 from bs4 import BeautifulSoup
@@ -64,8 +61,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_gp_eps_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -110,24 +107,14 @@ datalake_upload(file_contents, CONNECTION_STRING, file_system, new_source_path+c
 
 # COMMAND ----------
 
-#Pull historical dataset
-latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, historical_source_path)
-historical_dataset = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder, historical_source_file)
-historical_dataframe = pd.read_parquet(io.BytesIO(historical_dataset), engine="pyarrow")
+# Open the historical dataset's append store
+# -----------------------------------------------------------------------
+store = datalake_appendStore(CONNECTION_STRING, file_system, sink_path, sink_file, period_column="Date")
 
 # Append new data to historical data
 # -----------------------------------------------------------------------
-if eps_df_snapshot['Date'].max() not in historical_dataframe.values:
-  historical_dataframe = historical_dataframe.append(eps_df_snapshot)
-  historical_dataframe = historical_dataframe.reset_index(drop=True)
-  historical_dataframe.index.name = "Unique ID"
-else:
+if store.contains(eps_df_snapshot['Date'].max()):
   print("data already exists")
-
-
-# COMMAND ----------
-
-# Upload processed data to datalake
-file_contents = io.BytesIO()
-historical_dataframe.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file)
+else:
+  # Upload the new data as its own partition of the historical dataset
+  store.append(eps_df_snapshot)
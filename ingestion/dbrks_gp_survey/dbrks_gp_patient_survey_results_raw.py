@@ -23,9 +23,7 @@ VERSION:        0.0.2
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install pandas pathlib azure-storage-file-datalake numpy pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -60,8 +58,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_gp_patient_survey_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -110,26 +108,25 @@ new_dataframe["Collection end date"] = "2021-03-01" #----------- Change values y
 
 # COMMAND ----------
 
-# Pull historical dataset
+# Check the historical dataset for this collection
+# -------------------------------------------------------------------------
+# Answered from the parquet footer's statistics where possible, so a run for
+# a collection already ingested does not download the history
 latestFolder_historical = datalake_latestFolder(CONNECTION_STRING, file_system, historical_source_path)
-historical_dataset = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder_historical, historical_source_file)
-historical_dataframe = pd.read_parquet(io.BytesIO(historical_dataset), engine="pyarrow")
+data_exists = datalake_containsValue(CONNECTION_STRING, file_system, historical_source_path+latestFolder_historical, historical_source_file, "Date", date)
 
 # COMMAND ----------
 
-# Append new data to historical data
+# Append new data to historical data and upload it to the datalake
 # -------------------------------------------------------------------------
-if date not in historical_dataframe["Date"].values:
+if data_exists:
+  print("data already exists")
+else:
+  historical_dataset = datalake_open(CONNECTION_STRING, file_system, historical_source_path+latestFolder_historical, historical_source_file)
+  historical_dataframe = pd.read_parquet(historical_dataset, engine="pyarrow")
   historical_dataframe = historical_dataframe.append(new_dataframe)
   historical_dataframe = historical_dataframe.reset_index(drop=True)
   historical_dataframe.index.name = "Unique ID"
-else:
-  print("data already exists")
-
-# COMMAND ----------
-
-# Upload processed data to datalake
-current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
-file_contents = io.BytesIO()
-historical_dataframe.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file)
+  current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
+  with datalake_openWriter(CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file) as file_contents:
+    historical_dataframe.to_parquet(file_contents, engine="pyarrow")
@@ -23,9 +23,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# ------------------------------------------------------------------------------------
-%pip install pandas pathlib azure-storage-file-datalake numpy pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -60,8 +58,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_nhs_app_device_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -88,28 +86,16 @@ for new_source_file in file_name_list:
 
 # COMMAND ----------
 
-#Pull historical dataset
-latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, historical_source_path)
-historical_dataset = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder, historical_source_file)
-historical_dataframe = pd.read_parquet(io.BytesIO(historical_dataset), engine="pyarrow")
-historical_dataframe['Date'] = pd.to_datetime(historical_dataframe['Date']).dt.strftime("%Y-%m-%d")
+# Open the historical dataset's append store
+# Column types of the historical dataset, enforced on append
+schema = {"Date": "date"}
+store = datalake_appendStore(CONNECTION_STRING, file_system, sink_path, sink_file, period_column="Date", schema=schema)
 
 # Append new data to historical data
 # -----------------------------------------------------------------------
-dates_in_historical = historical_dataframe["Date"].unique().tolist()
 dates_in_new = new_dataframe["Date"].unique().tolist()[0]
-if dates_in_new in dates_in_historical:
+if store.contains(dates_in_new):
   print('Data already exists in historical data')
 else:
-  historical_dataframe = historical_dataframe.append(new_dataframe)
-  historical_dataframe = historical_dataframe.sort_values(by=['Date'])
-  historical_dataframe = historical_dataframe.reset_index(drop=True)
-  historical_dataframe = historical_dataframe.astype(str)
-
-# COMMAND ----------
-
-# Upload processed data to datalake
-current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
-file_contents = io.BytesIO()
-historical_dataframe.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file)
+  # Upload the new data as its own partition of the historical dataset
+  store.append(new_dataframe.sort_values(by=['Date']))
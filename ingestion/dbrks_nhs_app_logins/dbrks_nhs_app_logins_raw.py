@@ -22,9 +22,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -40,10 +38,8 @@ import json
 # 3rd party:
 import pandas as pd
 import numpy as np
-import requests
 from pathlib import Path
 from urllib import request as urlreq
-from bs4 import BeautifulSoup
 from azure.storage.filedatalake import DataLakeServiceClient
 
 # Connect to Azure datalake
@@ -62,8 +58,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_nhs_app_logins_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -90,28 +86,13 @@ new_dataframe['_time'] = pd.to_datetime(new_dataframe['_time']).dt.strftime('%Y-
 
 # COMMAND ----------
 
-# Pull historical dataset
+# Open the historical dataset's append store
 # -----------------------------------------------------------------------
-latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, historical_source_path)
-historical_dataset = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder, historical_source_file)
-historical_dataframe = pd.read_parquet(io.BytesIO(historical_dataset), engine="pyarrow")
+# Column types of the historical dataset, enforced on append
+schema = {"_time": "date", "Accounts": "int64", "Total Logins": "int64"}
+store = datalake_appendStore(CONNECTION_STRING, file_system, sink_path, sink_file, period_column="_time", schema=schema)
 
 # Combine new data with historic data
 # -----------------------------------
-new_dates = list(new_dataframe['_time'])
-historical_dates = list(historical_dataframe['_time'])
-for date in new_dates:
-  if date in historical_dates:
-    historical_dataframe.loc[historical_dataframe["_time"] == date, "Accounts"] = new_dataframe.loc[new_dataframe["_time"] == date, 'Accounts'].tolist()[0]
-    historical_dataframe.loc[historical_dataframe["_time"] == date, "Total Logins"] = new_dataframe.loc[new_dataframe["_time"] == date, 'Total Logins'].tolist()[0]
-  else:
-    historical_dataframe = historical_dataframe.append(new_dataframe[new_dataframe['_time'] == date])
-    historical_dataframe = historical_dataframe.reset_index(drop = True)
-
-# COMMAND ----------
-
-# Upload hsitorical appended data to datalake
-current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
-file_contents = io.BytesIO()
-historical_dataframe.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file)
+# Dates already held take the new Accounts and Total Logins, new dates are added
+store.upsert(new_dataframe, keys=["_time"], values=["Accounts", "Total Logins"])
@@ -21,9 +21,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.* geopandas shapely
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -42,16 +40,9 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 from azure.storage.filedatalake import DataLakeServiceClient
-import requests
 import urllib
 from urllib.request import urlopen
 from urllib import request as urlreq
-from bs4 import BeautifulSoup
-import geojson
-import geopandas as gpd
-from shapely.geometry import Point, Polygon, shape
-from shapely import wkb, wkt
-import shapely.speedups
 shapely.speedups.enable()
 # Connect to Azure datalake
 # -------------------------------------------------------------------------
@@ -69,8 +60,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/reference_tables/"
 file_name_config = "config_shapefiles.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -80,12 +71,12 @@ config_JSON = json.loads(io.BytesIO(config_JSON).read())
 file_system = config_JSON['pipeline']['adl_file_system']
 ods_source_path = config_JSON['pipeline']['raw']["source_path"]
 ods_source_file = config_JSON['pipeline']['raw']["source_file"]
-shapefile_sink_path = config_JSON['pipeline']['raw']['databricks'][2]["shapefile_sink_path"]
-shapefile_sink_file = config_JSON['pipeline']['raw']['databricks'][2]["shapefile_sink_file"]
-code_maping_sink_path = config_JSON['pipeline']['raw']['databricks'][2]["code_maping_sink_path"]
-code_maping_sink_file = config_JSON['pipeline']['raw']['databricks'][2]["code_maping_sink_file"]
-markdown_sink_path = config_JSON['pipeline']['raw']['databricks'][2]["markdown_sink_path"]
-markdown_sink_file = config_JSON['pipeline']['raw']['databricks'][2]["markdown_sink_file"]
+shapefile_sink_path = pipeline_config.notebook("dbrks_reference_shapefile_region_boundaries_snapshot_raw").values["shapefile_sink_path"]
+shapefile_sink_file = pipeline_config.notebook("dbrks_reference_shapefile_region_boundaries_snapshot_raw").values["shapefile_sink_file"]
+code_maping_sink_path = pipeline_config.notebook("dbrks_reference_shapefile_region_boundaries_snapshot_raw").values["code_maping_sink_path"]
+code_maping_sink_file = pipeline_config.notebook("dbrks_reference_shapefile_region_boundaries_snapshot_raw").values["code_maping_sink_file"]
+markdown_sink_path = pipeline_config.notebook("dbrks_reference_shapefile_region_boundaries_snapshot_raw").values["markdown_sink_path"]
+markdown_sink_file = pipeline_config.notebook("dbrks_reference_shapefile_region_boundaries_snapshot_raw").values["markdown_sink_file"]
 
 # COMMAND ----------
 
@@ -140,8 +131,7 @@ mapped_region_geojson_df.index.name = "Unique ID"
 #Ingest ODS Code table, filtered for CCGs, and generate a difference markdown file from the 
 
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, ods_source_path)
-ods_codes_table = datalake_download(CONNECTION_STRING, file_system, ods_source_path+latestFolder, ods_source_file)
-ods_df = pd.read_parquet(io.BytesIO(ods_codes_table), engine="pyarrow")
+ods_df = datalake_read_parquet(CONNECTION_STRING, file_system, ods_source_path+latestFolder, ods_source_file)
 ods_df_1 = ods_df[ods_df['ODS_API_Role_Name']=='NHS ENGLAND (REGION)']
 ods_df_2= ods_df_1[['Code','Name','Open_Date', 'Close_Date']]
 ods_df_2.rename(columns={'Code':'ODS NHS region code', 'Name': 'NHS region name (ODS API Database)', 'Open_Date': 'Open date', 'Close_Date': 'Close date'}, inplace=True)
@@ -22,9 +22,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.* 
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -40,10 +38,8 @@ import json
 # 3rd party:
 import pandas as pd
 import numpy as np
-import requests
 from pathlib import Path
 from urllib import request as urlreq
-from bs4 import BeautifulSoup
 from azure.storage.filedatalake import DataLakeServiceClient
 
 # Connect to Azure datalake
@@ -62,8 +58,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/reference_tables/"
 file_name_config = "config_registered_gp_practices.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -109,27 +105,15 @@ new_dataframe = new_dataframe.reset_index(drop = True)
 
 # COMMAND ----------
 
-# Pull historical dataset
+# Open the historical dataset's append store
 # -----------------------------------------------------------------------
-latestFolder_historical = datalake_latestFolder(CONNECTION_STRING, file_system, historical_source_path)
-historical_dataset = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder_historical, historical_source_file)
-historical_dataframe = pd.read_parquet(io.BytesIO(historical_dataset), engine="pyarrow")
+store = datalake_appendStore(CONNECTION_STRING, file_system, sink_path, sink_file, period_column="FY")
 
 # Append new data to historical data
 # -----------------------------------------------------------------------
-fy_editions_in_historical = historical_dataframe["FY"].unique().tolist()
 fy_edition_in_new = new_dataframe["FY"].unique().tolist()[0]
-if fy_edition_in_new in fy_editions_in_historical:
+if store.contains(fy_edition_in_new):
   print('New data already exists in historical data')
 else:
-  historical_dataframe = historical_dataframe.append(new_dataframe)
-  historical_dataframe = historical_dataframe.sort_values(by=['FY'])
-  historical_dataframe = historical_dataframe.reset_index(drop=True)
-
-# COMMAND ----------
-
-# Upload hsitorical appended data to datalake
-current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
-file_contents = io.BytesIO()
-historical_dataframe.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file)
+  # Upload the new data as its own partition of the historical dataset
+  store.append(new_dataframe)
@@ -23,9 +23,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake  beautifulsoup4 numpy urllib3 lxml dateparser regex openpyxl pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -42,8 +40,8 @@ import regex as re
 # 3rd party:
 import pandas as pd
 import numpy as np
-import openpyxl
 from pathlib import Path
+from openpyxl import load_workbook
 from azure.storage.filedatalake import DataLakeServiceClient
 
 
@@ -63,8 +61,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_shared_care_record_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -83,25 +81,11 @@ latestFolder
 # COMMAND ----------
 
 # Get list of all files in latest folder
-def datalake_listDirectory(CONNECTION_STRING, file_system, source_path):
-    try:
-        service_client = DataLakeServiceClient.from_connection_string(CONNECTION_STRING)
-        file_system_client = service_client.get_file_system_client(file_system=file_system)
-        paths = file_system_client.get_paths(path=source_path)
-        directory = []
-        for path in paths:
-            path.name = path.name.replace(source_path, '')
-            directory.append(path.name)
-    except Exception as e:
-        print(e)
-    return directory, paths
-  
-directory, paths = datalake_listDirectory(CONNECTION_STRING, file_system, source_path+latestFolder)
+directory = datalake_listContents(CONNECTION_STRING, file_system, source_path+latestFolder)
 directory
 
 # COMMAND ----------
 
-from openpyxl import load_workbook
 
 
 def get_sheetnames_xlsx(filepath):
@@ -115,8 +99,7 @@ pcn_df = pd.DataFrame()
 other_df = pd.DataFrame()
 
 #loop through each submitted file in the landing area
-for filename in directory:
-    file = datalake_download(CONNECTION_STRING, file_system, source_path + latestFolder, filename)
+for filename, file in datalake_download_many(CONNECTION_STRING, file_system, source_path + latestFolder, directory, ordered=True):
     
     #Read current file inot an iobytes object, read that object and get list of sheet names
     sheets = get_sheetnames_xlsx(io.BytesIO(file))
@@ -326,17 +309,14 @@ latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, historical_
 file_name_list = datalake_listContents(CONNECTION_STRING, file_system, historical_source_path+latestFolder)
 for file in file_name_list:
   if 'stp' in file:
-    stp_df_historic = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder, file)
-    stp_df_historic = pd.read_parquet(io.BytesIO(stp_df_historic), engine="pyarrow")
+    stp_df_historic = datalake_read_parquet(CONNECTION_STRING, file_system, historical_source_path+latestFolder, file)
     stp_df_historic['For Month'] = pd.to_datetime(stp_df_historic['For Month'])
     stp_df_historic['Date completed'] = pd.to_datetime(stp_df_historic['Date completed'],errors='coerce')
   if 'pcn' in file:
-    pcn_df_historic = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder, file)
-    pcn_df_historic = pd.read_parquet(io.BytesIO(pcn_df_historic), engine="pyarrow")
+    pcn_df_historic = datalake_read_parquet(CONNECTION_STRING, file_system, historical_source_path+latestFolder, file)
     pcn_df_historic['For Month'] = pd.to_datetime(pcn_df_historic['For Month'])
   if 'trust' in file:
-    trust_df_historic = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder, file)
-    trust_df_historic = pd.read_parquet(io.BytesIO(trust_df_historic), engine="pyarrow")
+    trust_df_historic = datalake_read_parquet(CONNECTION_STRING, file_system, historical_source_path+latestFolder, file)
     trust_df_historic['For Month'] = pd.to_datetime(trust_df_historic['For Month'])
     
 
@@ -384,15 +364,12 @@ else:
 
 # Upload processed data to datalake
 current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
-file_contents = io.BytesIO()
-#pcn
-pcn_df_historic.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, "shcr_partners_pcn_data_month_count.parquet")
-# #stp
-file_contents = io.BytesIO()
-stp_df_historic.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, "shcr_partners_stp_data_month_count.parquet")
-# #trust
-file_contents = io.BytesIO()
-trust_df_historic.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, "shcr_partners_trust_data_month_count.parquet")
+files = []
+for df_historic, sink_file in [(pcn_df_historic, "shcr_partners_pcn_data_month_count.parquet"),
+                               (stp_df_historic, "shcr_partners_stp_data_month_count.parquet"),
+                               (trust_df_historic, "shcr_partners_trust_data_month_count.parquet")]:
+  file_contents = io.BytesIO()
+  df_historic.to_parquet(file_contents, engine="pyarrow")
+  files.append((file_contents, sink_file))
+for sink_file, status in datalake_upload_many(files, CONNECTION_STRING, file_system, sink_path+current_date_path):
+  print(sink_file, status)
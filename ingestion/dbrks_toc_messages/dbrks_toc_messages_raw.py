@@ -22,9 +22,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -40,10 +38,8 @@ import json
 # 3rd party:
 import pandas as pd
 import numpy as np
-import requests
 from pathlib import Path
 from urllib import request as urlreq
-from bs4 import BeautifulSoup
 from azure.storage.filedatalake import DataLakeServiceClient
 
 # Connect to Azure datalake
@@ -62,8 +58,8 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_toc_messages_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
+config_JSON = pipeline_config.json()
 
 # COMMAND ----------
 
@@ -83,33 +79,21 @@ sink_file = config_JSON['pipeline']['raw']['appended_file']
 # -------------------------
 latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, new_source_path)
 toc_messages_file_name_list = datalake_listContents(CONNECTION_STRING, file_system, new_source_path+latestFolder)
-for new_source_file in toc_messages_file_name_list:
-  new_dataset = datalake_download(CONNECTION_STRING, file_system, new_source_path+latestFolder, new_source_file)
+for new_source_file, new_dataset in datalake_download_many(CONNECTION_STRING, file_system, new_source_path+latestFolder, toc_messages_file_name_list, ordered=True):
   new_dataframe = pd.read_csv(io.BytesIO(new_dataset))
 
 # COMMAND ----------
 
-# Pull historical dataset
+# Open the historical dataset's append store
 # -----------------------------------------------------------------------
-latestFolder = datalake_latestFolder(CONNECTION_STRING, file_system, historical_source_path)
-historical_dataset = datalake_download(CONNECTION_STRING, file_system, historical_source_path+latestFolder, historical_source_file)
-historical_dataframe = pd.read_parquet(io.BytesIO(historical_dataset), engine="pyarrow")
+store = datalake_appendStore(CONNECTION_STRING, file_system, sink_path, sink_file, period_column="_time")
 
 # Append new data to historical data
 # -----------------------------------------------------------------------
-date_from_new_dataframe = pd.to_datetime(new_dataframe['_time']).values.max()
-if date_from_new_dataframe != pd.to_datetime(historical_dataframe['_time']).values.max():
-  historical_dataframe = historical_dataframe.append(new_dataframe)
-  historical_dataframe['_time'] = pd.to_datetime(historical_dataframe['_time'])
-  historical_dataframe = historical_dataframe.sort_values(by=['_time'])
-  historical_dataframe = historical_dataframe.reset_index(drop=True)
-else:
+new_dataframe['_time'] = pd.to_datetime(new_dataframe['_time'])
+date_from_new_dataframe = new_dataframe['_time'].values.max()
+if store.contains(date_from_new_dataframe):
   print("data already exists")
-
-# COMMAND ----------
-
-# Upload hsitorical appended data to datalake
-current_date_path = datetime.now().strftime('%Y-%m-%d') + '/'
-file_contents = io.BytesIO()
-historical_dataframe.to_parquet(file_contents, engine="pyarrow")
-datalake_upload(file_contents, CONNECTION_STRING, file_system, sink_path+current_date_path, sink_file)
+else:
+  # Upload the new data as its own partition of the historical dataset
+  store.append(new_dataframe.sort_values(by=['_time']))
@@ -21,9 +21,7 @@ VERSION:        0.0.1
 
 # COMMAND ----------
 
-# Install libs
-# -------------------------------------------------------------------------
-%pip install geojson==2.5.* tabulate requests pandas pathlib azure-storage-file-datalake beautifulsoup4 numpy urllib3 lxml regex pyarrow==5.0.*
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
 
 # COMMAND ----------
 
@@ -57,16 +55,27 @@ CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRI
 file_path_config = "/config/pipelines/nhsx-au-analytics/"
 file_name_config = "config_gp_it_standards_dbrks.json"
 file_system_config = "nhsxdatalakesagen2fsprod"
-config_JSON = datalake_download(CONNECTION_STRING, file_system_config, file_path_config, file_name_config)
-config_JSON = json.loads(io.BytesIO(config_JSON).read())
+pipeline_config = datalake_loadConfig(CONNECTION_STRING, file_system_config, file_path_config, file_name_config, refresh=True)
+config_JSON = pipeline_config.json()
+
+# COMMAND ----------
+
+#Set the dry_run parameter to True to estimate the run from listing metadata and past runs without running anything
+dbutils.widgets.text("dry_run", "False")
+dry_run = dbutils.widgets.get("dry_run") == "True"
+
+#Set the resume parameter to True to re-run only the notebooks that did not succeed in the last run, and anything downstream of them
+dbutils.widgets.text("resume", "False")
+resume = dbutils.widgets.get("resume") == "True"
+
+#Run metric notebooks in parallel, following any depends_on entries in the config
+state = orchestrator_loadState(CONNECTION_STRING, config_JSON, "dbrks_gp_it_orchestrator", incremental=False)
+if dry_run:
+    display(orchestrator_estimateRun(config_JSON['pipeline']['project']['databricks'], state, resume=resume))
+    dbutils.notebook.exit("dry run")
+orchestrator_runNotebooks(config_JSON['pipeline']['project']['databricks'], timeout_seconds=1000, state=state, resume=resume)
 
 # COMMAND ----------
 
-#Squentially run metric notebooks
-for index, item in enumerate(config_JSON['pipeline']['project']['databricks']): # get index of objects in JSON array
-  try:
-    notebook = config_JSON['pipeline']['project']['databricks'][index]['databricks_notebook']
-    dbutils.notebook.run(notebook, 1000) # is 1000 sec for timeout
-  except Exception as e:
-    print(e)
-    raise Exception()
+#Flag notebooks whose run time or memory grew against their previous runs
+orchestrator_telemetryReport(state)
@@ -0,0 +1,99 @@
+# Databricks notebook source
+#!/usr/bin python3
+
+# -------------------------------------------------------------------------
+# Copyright (c) 2022 NHS England and NHS Improvement. All rights reserved.
+# Licensed under the MIT License. See license.txt in the project root for
+# license information.
+# -------------------------------------------------------------------------
+
+"""
+FILE:           dbrks_master_orchestrator.py
+DESCRIPTION:
+                Orchestrator databricks notebook which runs the notebooks of every NHSX Analytics unit project on one cluster,
+                sharing its notebook slots between projects by priority, data staleness and expected run time
+USAGE:
+                ...
+CONTRIBUTORS:   Mattia Ficarelli and Craig Shenton
+CONTACT:        data@nhsx.nhs.uk
+CREATED:        18 Oct. 2022
+VERSION:        0.0.1
+"""
+
+# COMMAND ----------
+
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_bootstrap
+
+# COMMAND ----------
+
+# Imports
+# -------------------------------------------------------------------------
+# Python:
+import os
+import io
+import tempfile
+from datetime import datetime
+import json
+
+# 3rd party:
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from azure.storage.filedatalake import DataLakeServiceClient
+
+# Connect to Azure datalake
+# -------------------------------------------------------------------------
+# !env from databricks secrets
+CONNECTION_STRING = dbutils.secrets.get(scope="datalakefs", key="CONNECTION_STRING")
+
+# COMMAND ----------
+
+# MAGIC %run /Repos/prod/au-azure-databricks/functions/dbrks_helper_functions
+
+# COMMAND ----------
+
+#Projects run by this orchestrator, with the settings of their own orchestrators
+#priority 1 runs first; the names keep each project's run ledger, fingerprints and telemetry
+file_path_config = "/config/pipelines/nhsx-au-analytics/"
+file_system_config = "nhsxdatalakesagen2fsprod"
+projects = [
+    {"name": "dbrks_national_digital_channels_orchestrator", "file_name_config": "config_national_digital_channels_dbrks.json", "priority": 1, "timeout_seconds": 3000, "prefetch": True},
+    {"name": "dbrks_nhs_app_orchestrator", "file_name_config": "config_nhs_app_dbrks.json", "priority": 1, "prefetch": True},
+    {"name": "dbrks_nhs_app_logins_orchestrator", "file_name_config": "config_nhs_app_logins_dbrks.json", "priority": 1, "incremental": False},
+    {"name": "dbrks_pomi_orchestrator", "file_name_config": "config_pomi_dbrks.json", "priority": 1, "prefetch": True},
+    {"name": "dbrks_gp_eps_orchestrator", "file_name_config": "config_gp_eps_dbrks.json", "incremental": False},
+    {"name": "dbrks_gp_it_orchestrator", "file_name_config": "config_gp_it_standards_dbrks.json", "incremental": False},
+    {"name": "dbrks_online_consultations_orchestrator", "file_name_config": "config_online_consult_dbrks.json", "incremental": False},
+    {"name": "dbrks_toc_messages_orchestrator", "file_name_config": "config_toc_messages_dbrks.json", "prefetch": True},
+    {"name": "dbrks_dspt_nhs_orchestrator", "file_name_config": "config_dspt_nhs_dbrks.json", "incremental": False},
+    {"name": "dbrks_dspt_gp_practices_orchestrator", "file_name_config": "config_dspt_gp_practices_historical_dbrks.json", "priority": 3, "incremental": False},
+    {"name": "dbrks_dspt_gp_practices_snapshot_orchestrator", "file_name_config": "config_dspt_gp_practices_snapshot_dbrks.json", "incremental": False},
+    {"name": "dbrks_gp_survey_orchestrator", "file_name_config": "config_gp_patient_survey_dbrks.json", "priority": 3, "incremental": False},
+    {"name": "dbrks_reference_shapefile_orchestrator", "file_path_config": "/config/pipelines/reference_tables/", "file_name_config": "config_shapefiles.json",
+     "section": "raw", "priority": 3, "incremental": False},
+    {"name": "dbrks_reference_shapefile_processing_orchestrator", "file_path_config": "/config/pipelines/reference_tables/", "file_name_config": "config_shapefiles.json",
+     "section": "project_databricks", "priority": 3, "incremental": False, "depends_on": ["dbrks_reference_shapefile_orchestrator"]},
+]
+
+# COMMAND ----------
+
+#Set the dry_run parameter to True to estimate every project's run from listing metadata and past runs without running anything
+dbutils.widgets.text("dry_run", "False")
+dry_run = dbutils.widgets.get("dry_run") == "True"
+
+#Set the resume parameter to True to re-run only the notebooks that did not succeed in each project's last run, and anything downstream of them
+dbutils.widgets.text("resume", "False")
+resume = dbutils.widgets.get("resume") == "True"
+
+#Run every project's notebooks on one shared pool of notebook slots
+if dry_run:
+    display(orchestrator_runProjects(CONNECTION_STRING, file_system_config, file_path_config, projects, max_parallel=8, resume=resume, dry_run=True))
+    dbutils.notebook.exit("dry run")
+states = orchestrator_runProjects(CONNECTION_STRING, file_system_config, file_path_config, projects, max_parallel=8, resume=resume)
+
+# COMMAND ----------
+
+#Flag notebooks whose run time or memory grew against their previous runs
+for name, state in states.items():
+    print(name)
+    orchestrator_telemetryReport(state)
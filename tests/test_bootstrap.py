@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+from conftest import REPO_ROOT
+
+
+@pytest.fixture
+def bootstrap(monkeypatch, tmp_path):
+    # the notebook's cells up to its last one, which would check the real requirements
+    with open(os.path.join(REPO_ROOT, "functions", "dbrks_bootstrap.py")) as f:
+        source = f.read().split("# Bootstrap\n")[0]
+    namespace = {"__name__": "dbrks_bootstrap"}
+    exec(compile(source, "dbrks_bootstrap.py", "exec"), namespace)
+    namespace["_bootstrap_dir"] = lambda: str(tmp_path / "bootstrap")
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    return namespace
+
+
+def write_package(directory, name, version):
+    os.makedirs(os.path.join(directory, name), exist_ok=True)
+    with open(os.path.join(directory, name, "__init__.py"), "w") as f:
+        f.write("VERSION = '{}'\n".format(version))
+    info = os.path.join(directory, "{}-{}.dist-info".format(name, version))
+    os.makedirs(info, exist_ok=True)
+    with open(os.path.join(info, "METADATA"), "w") as f:
+        f.write("Metadata-Version: 2.1\nName: {}\nVersion: {}\n".format(name, version))
+
+
+@pytest.fixture
+def pip(bootstrap, monkeypatch):
+    calls = []
+
+    def check_call(command):
+        calls.append(command)
+        target = command[command.index("--target") + 1] if "--target" in command else None
+        for requirement in command[command.index("--quiet") + 1:]:
+            if requirement.startswith("--") or requirement == target:
+                continue
+            name, version = requirement.partition("==")[::2]
+            write_package(target, name, version.replace("*", "0"))
+    monkeypatch.setattr(bootstrap["subprocess"], "check_call", check_call)
+    return calls
+
+
+def test_pinned_version_is_installed_once_per_cluster(bootstrap, pip, tmp_path, monkeypatch):
+    write_package(str(tmp_path / "site"), "dbrks_pinned", "1.0.0")
+    monkeypatch.syspath_prepend(str(tmp_path / "site"))
+    monkeypatch.delitem(sys.modules, "dbrks_pinned", raising=False)
+
+    bootstrap["bootstrap_environment"](["dbrks_pinned==2.0.*"])
+    assert len(pip) == 1 and "--target" in pip[0]
+    import dbrks_pinned
+    assert dbrks_pinned.VERSION == "2.0.0"
+
+    # a later notebook on the same cluster only puts the directory on sys.path
+    monkeypatch.setattr(sys, "path", [path for path in sys.path if "bootstrap" not in path])
+    bootstrap["bootstrap_environment"](["dbrks_pinned==2.0.*"])
+    assert len(pip) == 1
+    assert bootstrap["_installed_version"]("dbrks_pinned==2.0.*") == "2.0.0"
+    monkeypatch.delitem(sys.modules, "dbrks_pinned")
+
+
+def test_pinned_module_imported_before_the_bootstrap_raises(bootstrap, pip, tmp_path, monkeypatch):
+    write_package(str(tmp_path / "site"), "dbrks_early", "1.0.0")
+    monkeypatch.syspath_prepend(str(tmp_path / "site"))
+    import dbrks_early
+    try:
+        with pytest.raises(ImportError, match="restartPython"):
+            bootstrap["bootstrap_environment"](["dbrks_early==2.0.*"])
+    finally:
+        del sys.modules["dbrks_early"]
+
+
+def test_missing_requirements_are_installed(bootstrap, monkeypatch):
+    calls = []
+    monkeypatch.setattr(bootstrap["subprocess"], "check_call", calls.append)
+    bootstrap["bootstrap_environment"](["dbrks-not-installed", "pytest"])
+    assert calls[0][-1:] == ["dbrks-not-installed"]
+    assert "--target" not in calls[0]
+
+
+def test_lazy_module_imports_on_first_use(bootstrap):
+    json = bootstrap["LazyModule"]("json")
+    assert json.dumps([1]) == "[1]"
+    assert "dumps" in json.__dict__
@@ -0,0 +1,38 @@
+import io
+
+import pandas as pd
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def test_gather_returns_results_in_order(helpers, datalake):
+    parquet = io.BytesIO()
+    pd.DataFrame({"value": [1, 2]}).to_parquet(parquet, engine="pyarrow", index=False)
+    helpers["datalake_upload"](parquet, CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/", "data.parquet")
+    helpers["datalake_upload"](io.StringIO("a\n1\n"), CONNECTION_STRING, FILE_SYSTEM, "proc/reference/2022-05-01/", "data.csv")
+
+    folder, reference_folder = helpers["datalake_gather"](
+        helpers["adatalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/"),
+        helpers["adatalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "proc/reference/"),
+    )
+    df, data = helpers["datalake_gather"](
+        helpers["adatalake_read_parquet"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/" + folder, "data.parquet"),
+        helpers["adatalake_download"](CONNECTION_STRING, FILE_SYSTEM, "proc/reference/" + reference_folder, "data.csv"),
+    )
+    assert (folder, reference_folder) == ("2022-06-01/", "2022-05-01/")
+    assert list(df["value"]) == [1, 2]
+    assert data == b"a\n1\n"
+
+
+def test_async_upload_updates_the_latest_folder(helpers, datalake):
+    helpers["datalake_gather"](
+        helpers["adatalake_upload"](io.StringIO("a\n1\n"), CONNECTION_STRING, FILE_SYSTEM, "proc/async/2022-06-01/", "data.csv"))
+    assert helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "proc/async/") == "2022-06-01/"
+    listed, = helpers["datalake_gather"](helpers["adatalake_listContents"](CONNECTION_STRING, FILE_SYSTEM, "proc/async/"))
+    assert listed == helpers["datalake_listContents"](CONNECTION_STRING, FILE_SYSTEM, "proc/async/")
+
+
+def test_gather_raises_the_first_failure(helpers, datalake):
+    with pytest.raises(FileNotFoundError):
+        helpers["datalake_gather"](helpers["adatalake_download"](CONNECTION_STRING, FILE_SYSTEM, "proc/missing", "data.csv"))
@@ -0,0 +1,77 @@
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+@pytest.fixture(params=["memory", "local"])
+def backend(request, helpers, datalake, tmp_path):
+    if request.param == "memory":
+        return datalake
+    return helpers["datalake_setBackend"](helpers["LocalDatalakeBackend"](str(tmp_path)))
+
+
+def test_upload_download_and_properties(backend):
+    etag = backend.upload(CONNECTION_STRING, FILE_SYSTEM, "/proc/project/data.csv", b"a\n1\n")
+    data, downloaded_etag = backend.download(CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.csv")
+    properties = backend.properties(CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.csv")
+    assert data == b"a\n1\n"
+    assert downloaded_etag == etag == properties.etag
+    assert properties.size == 4
+
+
+def test_missing_files_raise_file_not_found(backend):
+    with pytest.raises(FileNotFoundError):
+        backend.download(CONNECTION_STRING, FILE_SYSTEM, "missing.csv")
+    with pytest.raises(FileNotFoundError):
+        backend.properties(CONNECTION_STRING, FILE_SYSTEM, "missing.csv")
+    with pytest.raises(FileNotFoundError):
+        backend.list_paths(CONNECTION_STRING, FILE_SYSTEM, "missing")
+
+
+def test_download_is_skipped_when_unchanged(backend):
+    etag = backend.upload(CONNECTION_STRING, FILE_SYSTEM, "data.csv", b"a\n1\n")
+    assert backend.download(CONNECTION_STRING, FILE_SYSTEM, "data.csv", if_none_match=etag) == (None, etag)
+
+
+def test_conditional_uploads(helpers, backend):
+    etag = backend.upload(CONNECTION_STRING, FILE_SYSTEM, "data.csv", b"1", if_missing=True)
+    with pytest.raises(helpers["DatalakeConditionFailed"]):
+        backend.upload(CONNECTION_STRING, FILE_SYSTEM, "data.csv", b"2", if_missing=True)
+    new_etag = backend.upload(CONNECTION_STRING, FILE_SYSTEM, "data.csv", b"3", etag=etag)
+    with pytest.raises(helpers["DatalakeConditionFailed"]):
+        backend.upload(CONNECTION_STRING, FILE_SYSTEM, "data.csv", b"4", etag=etag)
+    assert backend.download(CONNECTION_STRING, FILE_SYSTEM, "data.csv") == (b"3", new_etag)
+
+
+def test_read_into(backend):
+    etag = backend.upload(CONNECTION_STRING, FILE_SYSTEM, "data.bin", bytes(range(10)))
+    view = memoryview(bytearray(4))
+    assert backend.read_into(CONNECTION_STRING, FILE_SYSTEM, "data.bin", 8, view, etag=etag) == 2
+    assert bytes(view[:2]) == bytes([8, 9])
+
+
+def test_staged_upload_commits_blocks_in_any_order(backend):
+    upload = backend.start_upload(CONNECTION_STRING, FILE_SYSTEM, "data.bin")
+    backend.append_block(upload, 3, b"def")
+    backend.append_block(upload, 0, b"abc")
+    with pytest.raises(FileNotFoundError):
+        backend.properties(CONNECTION_STRING, FILE_SYSTEM, "data.bin")
+    backend.commit_upload(upload, 6)
+    assert backend.download(CONNECTION_STRING, FILE_SYSTEM, "data.bin")[0] == b"abcdef"
+
+
+def test_list_paths(backend):
+    backend.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/a/2022-06-01/data.csv", b"1")
+    backend.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/a/2022-07-01/data.csv", b"2")
+    assert backend.list_paths(CONNECTION_STRING, FILE_SYSTEM, "proc/a", recursive=False) == [
+        ("proc/a/2022-06-01", True), ("proc/a/2022-07-01", True)]
+    assert ("proc/a/2022-07-01/data.csv", False) in backend.list_paths(CONNECTION_STRING, FILE_SYSTEM, "proc")
+
+
+def test_backend_from_environment(helpers, monkeypatch, tmp_path):
+    monkeypatch.setenv("DATALAKE_BACKEND", "local")
+    monkeypatch.setenv("DATALAKE_LOCAL_ROOT", str(tmp_path))
+    assert helpers["_backend_from_environment"]().name == "local"
+    monkeypatch.setenv("DATALAKE_BACKEND", "s3")
+    with pytest.raises(ValueError):
+        helpers["_backend_from_environment"]()
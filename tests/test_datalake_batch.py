@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def upload_files(datalake, count):
+    names = ["{}.csv".format(index) for index in range(count)]
+    for name in names:
+        datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/" + name, name.encode("utf-8"))
+    return names
+
+
+def test_download_many_in_input_order(helpers, datalake):
+    names = upload_files(datalake, 20)
+    results = list(helpers["datalake_download_many"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", names, max_workers=4, ordered=True))
+    assert results == [(name, name.encode("utf-8")) for name in names]
+
+
+def test_download_many_keeps_a_bounded_window(helpers, datalake):
+    names = upload_files(datalake, 20)
+    pulled = []
+
+    def source_files():
+        for name in names:
+            pulled.append(name)
+            yield name
+
+    results = helpers["datalake_download_many"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", source_files(), max_workers=3, ordered=True)
+    assert next(results) == ("0.csv", b"0.csv")
+    # at most 2 x max_workers downloads are in flight ahead of the caller
+    assert len(pulled) <= 7
+    assert len(list(results)) == 19
+
+
+def test_download_many_raises_the_first_failure(helpers, datalake):
+    names = upload_files(datalake, 3) + ["missing.csv"]
+    with pytest.raises(FileNotFoundError):
+        list(helpers["datalake_download_many"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", names, max_workers=2))
+
+
+def test_upload_many(helpers, datalake):
+    files = [(io.StringIO("a\n{}\n".format(index)), "{}.csv".format(index)) for index in range(10)]
+    results = list(helpers["datalake_upload_many"](files, CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/", ordered=True))
+    assert results == [("{}.csv".format(index), "200 OK") for index in range(10)]
+    assert datalake.download(CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/9.csv")[0] == b"a\n9\n"
+    assert helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/") == "2022-06-01/"
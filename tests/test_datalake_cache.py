@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+@pytest.fixture
+def cache(helpers, datalake, tmp_path):
+    return helpers["datalake_setCache"](helpers["DatalakeBlobCache"](str(tmp_path / "cache"), max_bytes=10))
+
+
+def download(helpers, source_file):
+    return helpers["datalake_download"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", source_file)
+
+
+def cache_status(helpers):
+    log = helpers["datalake_ioLog"]()
+    return log.loc[log["op"] == "download", "cache"].tolist()
+
+
+def test_unchanged_blob_is_served_from_the_cache(helpers, datalake, cache):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/a.csv", b"a\n1\n")
+    assert download(helpers, "a.csv") == b"a\n1\n"
+    assert download(helpers, "a.csv") == b"a\n1\n"
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/a.csv", b"a\n2\n")
+    assert download(helpers, "a.csv") == b"a\n2\n"
+    assert cache_status(helpers) == ["miss", "hit", "miss"]
+    assert len(cache.entries()) == 1
+
+
+def test_lookup_only_returns_current_copies(helpers, datalake, cache):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/a.csv", b"a\n1\n")
+    assert cache.lookup(CONNECTION_STRING, datalake, FILE_SYSTEM, "proc/project/a.csv") is None
+    download(helpers, "a.csv")
+    cached_path = cache.lookup(CONNECTION_STRING, datalake, FILE_SYSTEM, "proc/project/a.csv")
+    with open(cached_path, "rb") as f:
+        assert f.read() == b"a\n1\n"
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/a.csv", b"a\n2\n")
+    assert cache.lookup(CONNECTION_STRING, datalake, FILE_SYSTEM, "proc/project/a.csv") is None
+
+
+def test_least_recently_used_blobs_are_evicted(helpers, datalake, cache):
+    for last_used, name in [(1000, "a.csv"), (2000, "b.csv")]:
+        datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/" + name, b"1234")
+        download(helpers, name)
+        cached_path = cache.lookup(CONNECTION_STRING, datalake, FILE_SYSTEM, "proc/project/" + name)
+        os.utime(cached_path, (last_used, last_used))
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/c.csv", b"1234")
+    download(helpers, "c.csv")
+
+    assert sum(size for mtime, size, file_path in cache.entries()) <= 10
+    assert download(helpers, "b.csv") == b"1234"
+    assert download(helpers, "a.csv") == b"1234"
+    assert cache_status(helpers)[-2:] == ["hit", "miss"]
+
+
+def test_blobs_larger_than_the_cache_are_not_kept(helpers, datalake, cache):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/big.csv", b"x" * 11)
+    assert download(helpers, "big.csv") == b"x" * 11
+    assert cache.entries() == []
+
+
+def test_evicted_copy_is_downloaded_again(helpers, datalake, cache):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/a.csv", b"a\n1\n")
+    download(helpers, "a.csv")
+    cache.clear()
+    assert download(helpers, "a.csv") == b"a\n1\n"
+    assert cache_status(helpers) == ["miss", "miss"]
@@ -0,0 +1,82 @@
+import io
+
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def latest_manifest(datalake, prefix):
+    data, etag = datalake.download(CONNECTION_STRING, FILE_SYSTEM, prefix + "/_LATEST")
+    return data.decode("utf-8")
+
+
+def test_upload_to_dated_folder_updates_manifest(helpers, datalake):
+    helpers["datalake_upload"](io.StringIO("a,b\n1,2\n"), CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/", "data.csv")
+    assert latest_manifest(datalake, "proc/project") == "2022-06-01"
+    assert helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/") == "2022-06-01/"
+
+
+def test_older_folder_does_not_move_manifest_back(helpers, datalake):
+    assert helpers["datalake_updateLatest"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01") == "2022-06-01/"
+    assert helpers["datalake_updateLatest"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-05-01") == "2022-06-01/"
+    assert latest_manifest(datalake, "proc/project") == "2022-06-01"
+
+
+def test_undated_folder_leaves_manifest_alone(helpers, datalake):
+    assert helpers["datalake_updateLatest"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/config") is None
+    assert not datalake.list_paths(CONNECTION_STRING, FILE_SYSTEM, "")
+
+
+def test_latest_folder_trusts_the_manifest(helpers, datalake):
+    helpers["datalake_updateLatest"](CONNECTION_STRING, FILE_SYSTEM, "raw/project/2022-06-01")
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "raw/project/2022-07-01/data.csv", b"a\n1\n")
+    assert helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "raw/project/") == "2022-06-01/"
+    assert latest_manifest(datalake, "raw/project") == "2022-06-01"
+
+
+def test_latest_folder_lists_without_a_valid_manifest(helpers, datalake):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "raw/project/2022-06-01/data.csv", b"a\n1\n")
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "raw/project/2022-07-01/data.csv", b"a\n1\n")
+    assert helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "raw/project/") == "2022-07-01/"
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "raw/project/_LATEST", b"garbage")
+    assert helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "raw/project/") == "2022-07-01/"
+    assert latest_manifest(datalake, "raw/project") == "garbage"
+
+
+def test_latest_folder_raises_when_there_is_none(helpers, datalake):
+    with pytest.raises(FileNotFoundError):
+        helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "raw/missing/")
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "raw/project/config/data.csv", b"a\n1\n")
+    with pytest.raises(FileNotFoundError):
+        helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "raw/project/")
+
+
+def test_racing_update_is_not_overwritten(helpers, datalake):
+    helpers["datalake_updateLatest"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01")
+    manifest_etag = datalake.properties(CONNECTION_STRING, FILE_SYSTEM, "proc/project/_LATEST").etag
+    download = datalake.download
+
+    def racing_download(CONNECTION_STRING, file_system, path, if_none_match=None):
+        result = download(CONNECTION_STRING, file_system, path, if_none_match)
+        if path.endswith("_LATEST") and result[1] == manifest_etag:
+            # another process moves the manifest on between our read and write
+            datalake.upload(CONNECTION_STRING, file_system, path, b"2022-09-01")
+        return result
+
+    datalake.download = racing_download
+    assert helpers["datalake_updateLatest"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-08-01") == "2022-09-01/"
+    assert latest_manifest(datalake, "proc/project") == "2022-09-01"
+
+
+def test_first_manifest_is_only_created_once(helpers, datalake):
+    upload = datalake.upload
+
+    def racing_upload(CONNECTION_STRING, file_system, path, data, etag=None, if_missing=False):
+        if if_missing and path.endswith("_LATEST"):
+            datalake.upload = upload
+            upload(CONNECTION_STRING, file_system, path, b"2022-09-01")
+        return upload(CONNECTION_STRING, file_system, path, data, etag, if_missing)
+
+    datalake.upload = racing_upload
+    assert helpers["datalake_updateLatest"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-08-01") == "2022-09-01/"
+    assert latest_manifest(datalake, "proc/project") == "2022-09-01"
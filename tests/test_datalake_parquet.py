@@ -0,0 +1,71 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def upload_parquet(datalake, path, df, row_group_size=None):
+    file_contents = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), file_contents, row_group_size=row_group_size)
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, path, file_contents.getvalue())
+    return file_contents.getbuffer().nbytes
+
+
+def filesystem(helpers):
+    return pafs.PyFileSystem(helpers["DatalakeFileSystemHandler"](CONNECTION_STRING, FILE_SYSTEM))
+
+
+def test_read_fetches_only_selected_columns_and_row_groups(helpers, datalake):
+    df = pd.DataFrame({"Field": ["a", "b", "c", "d"] * 25000, "Value": range(100000), "Notes": [str(i * 7919) for i in range(100000)]})
+    df = df.sort_values("Field", ignore_index=True)
+    size = upload_parquet(datalake, "proc/project/data.parquet", df, row_group_size=25000)
+
+    result = helpers["datalake_read_parquet"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", "data.parquet", columns=["Value"], filters=[("Field", "==", "b")])
+    assert list(result["Value"]) == list(df.loc[df["Field"] == "b", "Value"])
+    log = helpers["datalake_ioLog"]()
+    read = log.loc[log["op"] == "read_parquet"].iloc[-1]
+    assert read["rows"] == 25000
+    assert read["bytes"] < size / 4
+
+
+def test_statistics_come_from_the_footer(helpers, datalake):
+    upload_parquet(datalake, "proc/project/data.parquet", pd.DataFrame({"Date": ["2022-01-01", "2022-03-01", "2022-02-01"]}), row_group_size=2)
+    statistics = helpers["datalake_parquetStatistics"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", "data.parquet")
+    assert statistics["Date"] == {"min": "2022-01-01", "max": "2022-03-01", "null_count": 0, "rows": 3}
+    assert helpers["datalake_containsValue"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", "data.parquet", "Date", "2022-02-01")
+    assert not helpers["datalake_containsValue"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", "data.parquet", "Date", "2022-04-01")
+
+
+def test_handler_lists_directories_for_datasets(helpers, datalake):
+    upload_parquet(datalake, "proc/project/2022-06-01/a.parquet", pd.DataFrame({"value": [1, 2]}))
+    upload_parquet(datalake, "proc/project/2022-06-01/b.parquet", pd.DataFrame({"value": [3]}))
+    fs = filesystem(helpers)
+
+    infos = fs.get_file_info(pafs.FileSelector("proc/project", recursive=True))
+    assert sorted((info.path, info.type) for info in infos) == [
+        ("proc/project/2022-06-01", pafs.FileType.Directory),
+        ("proc/project/2022-06-01/a.parquet", pafs.FileType.File),
+        ("proc/project/2022-06-01/b.parquet", pafs.FileType.File),
+    ]
+    assert fs.get_file_info("proc/project/2022-06-01").type == pafs.FileType.Directory
+    assert fs.get_file_info("proc/missing").type == pafs.FileType.NotFound
+    assert fs.get_file_info(pafs.FileSelector("proc/missing", allow_not_found=True)) == []
+
+    table = ds.dataset("proc/project/2022-06-01", filesystem=fs, format="parquet").to_table()
+    assert sorted(table.column("value").to_pylist()) == [1, 2, 3]
+
+
+def test_handler_is_read_only(helpers, datalake):
+    upload_parquet(datalake, "proc/project/data.parquet", pd.DataFrame({"value": [1]}))
+    fs = filesystem(helpers)
+    with pytest.raises(PermissionError, match="read-only"):
+        fs.delete_file("proc/project/data.parquet")
+    with pytest.raises(PermissionError, match="read-only"):
+        fs.open_output_stream("proc/project/other.parquet")
+    assert datalake.properties(CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.parquet").size > 0
@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def test_open_reads_ranges_and_seeks(helpers, datalake):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.bin", bytes(range(100)))
+    f = helpers["datalake_open"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", "data.bin", buffer_size=16)
+    assert f.read(4) == bytes([0, 1, 2, 3])
+    f.seek(-2, 2)
+    assert f.read() == bytes([98, 99])
+    f.seek(50)
+    assert f.read(3) == bytes([50, 51, 52])
+
+
+def test_readinto_fills_the_callers_buffer(helpers, datalake):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.bin", bytes(range(10)))
+    reader = helpers["DatalakeFileReader"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.bin")
+    buffer = bytearray(8)
+    assert reader.readinto(buffer) == 8
+    assert reader.readinto(buffer) == 2
+    assert bytes(buffer[:2]) == bytes([8, 9])
+    assert reader.readinto(buffer) == 0
+
+
+def test_file_replaced_mid_read_raises(helpers, datalake):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.bin", b"first version")
+    reader = helpers["DatalakeFileReader"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.bin")
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.bin", b"second version")
+    with pytest.raises(helpers["DatalakeConditionFailed"]):
+        reader.read(5)
+
+
+def test_pandas_reads_csv_and_parquet_from_it(helpers, datalake):
+    datalake.upload(CONNECTION_STRING, FILE_SYSTEM, "proc/project/data.csv", b"a,b\n1,2\n3,4\n")
+    df = pd.read_csv(helpers["datalake_open"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", "data.csv"))
+    assert df.to_dict("list") == {"a": [1, 3], "b": [2, 4]}
+    log = helpers["datalake_ioLog"]()
+    assert log.loc[log["op"] == "open", "bytes"].tolist() == [12]
+
+
+def test_missing_file_raises(helpers, datalake):
+    with pytest.raises(FileNotFoundError):
+        helpers["datalake_open"](CONNECTION_STRING, FILE_SYSTEM, "proc/project", "missing.csv")
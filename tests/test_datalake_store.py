@@ -0,0 +1,115 @@
+import io
+import json
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def open_store(helpers, schema=None):
+    return helpers["datalake_appendStore"](CONNECTION_STRING, FILE_SYSTEM, "raw/project/historical/", "history.parquet", "Date", schema)
+
+
+def month(date, *logins):
+    return pd.DataFrame({"Date": [date] * len(logins), "OdsCode": ["A{}".format(i) for i in range(len(logins))], "Logins": list(logins)})
+
+
+def published(helpers, datalake):
+    # what readers of the dated folder get, through the manifest published there
+    sink_path = "raw/project/historical/" + datetime.now().strftime("%Y-%m-%d")
+    df = helpers["datalake_read_parquet"](CONNECTION_STRING, FILE_SYSTEM, sink_path, "history.parquet")
+    manifest, etag = datalake.download(CONNECTION_STRING, FILE_SYSTEM, sink_path + "/history.parquet.manifest.json")
+    return df, json.loads(manifest)
+
+
+def written_bytes(helpers):
+    log = helpers["datalake_ioLog"]()
+    return log.loc[log["op"] == "upload", "bytes"].sum()
+
+
+def test_append_commits_a_partition_and_publishes(helpers, datalake):
+    store = open_store(helpers)
+    store.append(month("2022-01-01", 1, 2))
+    store.append(month("2022-02-01", 3))
+
+    df, manifest = published(helpers, datalake)
+    assert list(df["Logins"]) == [1, 2, 3]
+    assert manifest["version"] == 1
+    assert store.contains("2022-02-01") and not store.contains("2022-03-01")
+    assert list(store.read(version=0)["Logins"]) == [1, 2]
+    assert list(open_store(helpers).read()["Logins"]) == [1, 2, 3]
+
+
+def test_append_only_writes_the_new_rows(helpers, datalake):
+    store = open_store(helpers)
+    store.append(pd.concat([month("2022-0{}-01".format(m), *range(5000)) for m in range(1, 7)]))
+    helpers["datalake_ioReset"]()
+    store.append(month("2022-07-01", 1))
+
+    assert written_bytes(helpers) < 10000
+    sink_path = "raw/project/historical/" + datetime.now().strftime("%Y-%m-%d")
+    assert [name for name, is_directory in datalake.list_paths(CONNECTION_STRING, FILE_SYSTEM, sink_path)] == [sink_path + "/history.parquet.manifest.json"]
+    with pytest.raises(FileNotFoundError, match="append store"):
+        helpers["datalake_download"](CONNECTION_STRING, FILE_SYSTEM, sink_path, "history.parquet")
+
+
+def test_contains_value_answers_from_the_manifest(helpers, datalake):
+    open_store(helpers).append(month("2022-01-01", 1))
+    sink_path = "raw/project/historical/" + datetime.now().strftime("%Y-%m-%d")
+    assert helpers["datalake_containsValue"](CONNECTION_STRING, FILE_SYSTEM, sink_path, "history.parquet", "Date", "2022-01-01")
+    assert not helpers["datalake_containsValue"](CONNECTION_STRING, FILE_SYSTEM, sink_path, "history.parquet", "Date", "2022-02-01")
+    assert helpers["datalake_containsValue"](CONNECTION_STRING, FILE_SYSTEM, sink_path, "history.parquet", "OdsCode", "A0")
+
+
+def test_schema_keeps_native_types(helpers, datalake):
+    store = open_store(helpers, {"Date": "date", "OdsCode": "category", "Logins": "int64"})
+    store.append(month("2022-01-01", 1, 2))
+
+    df = open_store(helpers).read()
+    assert str(df["Logins"].dtype) == "Int64"
+    assert isinstance(df["OdsCode"].dtype, pd.CategoricalDtype)
+    assert store.periods() == ["2022-01-01"]
+
+
+def test_empty_append_fails(helpers, datalake):
+    with pytest.raises(ValueError):
+        open_store(helpers).append(month("2022-01-01"))
+
+
+def test_legacy_file_is_copied_by_the_first_append(helpers, datalake):
+    legacy = io.BytesIO()
+    month("2021-12-01", 7).astype(str).to_parquet(legacy, engine="pyarrow", index=False)
+    helpers["datalake_upload"](legacy, CONNECTION_STRING, FILE_SYSTEM, "raw/project/historical/2022-01-05/", "history.parquet")
+
+    store = open_store(helpers)
+    assert store.contains("2021-12-01")
+    store.append(month("2022-01-01", 1).astype(str))
+
+    paths = list(store.table.snapshot()["files"])
+    assert all(path.startswith("raw/project/historical/_partitions/history.parquet/") for path in paths)
+    assert any("/base/" in path for path in paths)
+    assert list(published(helpers, datalake)[0]["Logins"]) == ["7", "1"]
+
+
+def test_compaction_rewrites_new_partitions_as_one(helpers, datalake, monkeypatch):
+    monkeypatch.setitem(helpers, "STORE_COMPACT_PARTITIONS", 3)
+    store = open_store(helpers)
+    for date in ["2022-01-01", "2022-02-01", "2022-03-01"]:
+        store.append(month(date, 1))
+
+    files = list(store.table.snapshot()["files"].values())
+    assert len(files) == 1 and "/base/" in files[0]["path"]
+    assert files[0]["periods"] == ["2022-01-01", "2022-02-01", "2022-03-01"]
+    assert list(store.table.history()["operation"]) == ["append", "append", "append", "compact"]
+
+    for date in ["2022-04-01", "2022-05-01", "2022-06-01"]:
+        store.append(month(date, 1))
+    files = sorted(store.table.snapshot()["files"].values(), key=lambda entry: entry["periods"])
+    assert [entry["periods"][0] for entry in files] == ["2022-01-01", "2022-04-01"]
+    assert len(published(helpers, datalake)[0]) == 6
+
+    store.compact(full=True)
+    assert len(store.table.snapshot()["files"]) == 1
+    assert list(open_store(helpers).read()["Date"]) == ["2022-0{}-01".format(m) for m in range(1, 7)]
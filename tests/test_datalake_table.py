@@ -0,0 +1,77 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def write_file(helpers, path, df):
+    file_contents = io.BytesIO()
+    df.to_parquet(file_contents, engine="pyarrow", index=False)
+    sink_path, sink_file = path.rsplit("/", 1)
+    helpers["datalake_upload"](file_contents, CONNECTION_STRING, FILE_SYSTEM, sink_path, sink_file)
+    return {"path": path, "periods": sorted(df["period"].unique()), "rows": len(df)}
+
+
+def test_commits_are_versioned(helpers, datalake):
+    table = helpers["datalake_openTable"](CONNECTION_STRING, FILE_SYSTEM, "table")
+    assert table.snapshot() is None
+    first = write_file(helpers, "table/a.parquet", pd.DataFrame({"period": ["2022-01"], "value": [1]}))
+    second = write_file(helpers, "table/b.parquet", pd.DataFrame({"period": ["2022-02"], "value": [2]}))
+    assert table.commit(add=[first]) == 0
+    assert table.commit(add=[second]) == 1
+    assert table.commit(remove=["table/a.parquet"], operation="delete") == 2
+
+    assert list(table.snapshot()["files"]) == ["table/b.parquet"]
+    assert list(table.read(version=1)["value"]) == [1, 2]
+    assert list(table.history()["operation"]) == ["write", "write", "delete"]
+
+
+def test_as_of_reads_the_table_at_a_time(helpers, datalake):
+    table = helpers["datalake_openTable"](CONNECTION_STRING, FILE_SYSTEM, "table")
+    table.commit(add=[write_file(helpers, "table/a.parquet", pd.DataFrame({"period": ["2022-01"], "value": [1]}))])
+    between = datetime.now()
+    table.commit(add=[write_file(helpers, "table/b.parquet", pd.DataFrame({"period": ["2022-02"], "value": [2]}))])
+    assert list(table.read(as_of=between)["value"]) == [1]
+    assert table.snapshot(as_of=datetime(2000, 1, 1)) is None
+
+
+def test_removing_a_missing_file_fails(helpers, datalake):
+    table = helpers["datalake_openTable"](CONNECTION_STRING, FILE_SYSTEM, "table")
+    with pytest.raises(helpers["DatalakeConditionFailed"]):
+        table.commit(remove=["table/missing.parquet"])
+
+
+def test_checkpoints_replay_the_same_snapshot(helpers, datalake, monkeypatch):
+    monkeypatch.setitem(helpers, "TABLE_CHECKPOINT_INTERVAL", 2)
+    table = helpers["datalake_openTable"](CONNECTION_STRING, FILE_SYSTEM, "table")
+    for month in range(1, 6):
+        df = pd.DataFrame({"period": ["2022-0{}".format(month)], "value": [month]})
+        table.commit(add=[write_file(helpers, "table/{}.parquet".format(month), df)])
+
+    last_checkpoint, etag = datalake.download(CONNECTION_STRING, FILE_SYSTEM, "table/_log/_last_checkpoint")
+    assert last_checkpoint == b'{"version": 4}'
+    assert table.snapshot()["version"] == 4
+    assert sorted(table.snapshot(version=3)["files"]) == ["table/{}.parquet".format(month) for month in range(1, 5)]
+    assert list(table.read()["value"]) == [1, 2, 3, 4, 5]
+
+
+def test_racing_writers_both_commit(helpers, datalake):
+    table = helpers["datalake_openTable"](CONNECTION_STRING, FILE_SYSTEM, "table")
+    other = helpers["datalake_openTable"](CONNECTION_STRING, FILE_SYSTEM, "table")
+    first = write_file(helpers, "table/a.parquet", pd.DataFrame({"period": ["2022-01"], "value": [1]}))
+    second = write_file(helpers, "table/b.parquet", pd.DataFrame({"period": ["2022-02"], "value": [2]}))
+    upload = datalake.upload
+
+    def racing_upload(CONNECTION_STRING, file_system, path, data, etag=None, if_missing=False):
+        if if_missing:
+            # the other writer commits version 0 first
+            datalake.upload = upload
+            other.commit(add=[second])
+        return upload(CONNECTION_STRING, file_system, path, data, etag, if_missing)
+
+    datalake.upload = racing_upload
+    assert table.commit(add=[first]) == 1
+    assert sorted(table.snapshot()["files"]) == ["table/a.parquet", "table/b.parquet"]
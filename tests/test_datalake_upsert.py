@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def open_store(helpers, schema=None):
+    return helpers["datalake_appendStore"](CONNECTION_STRING, FILE_SYSTEM, "raw/project/historical/", "history.parquet", "Date", schema)
+
+
+def month(date, *logins):
+    return pd.DataFrame({"Date": [date] * len(logins), "OdsCode": ["A{}".format(i) for i in range(len(logins))], "Logins": list(logins)})
+
+
+def test_upsert_replaces_matching_rows(helpers, datalake):
+    store = open_store(helpers, {"Date": "date", "OdsCode": "string", "Logins": "int64"})
+    store.append(pd.concat([month("2022-01-01", 1, 2), month("2022-02-01", 3)]))
+    store.append(month("2022-03-01", 4))
+
+    update = pd.DataFrame({"Date": ["2022-02-01", "2022-02-01"], "OdsCode": ["A0", "A9"], "Logins": [30, 9]})
+    store.upsert(update, keys=["Date", "OdsCode"])
+
+    df = open_store(helpers).read().sort_values(["Date", "OdsCode"], ignore_index=True)
+    assert list(df["Logins"]) == [1, 2, 30, 9, 4]
+    commit = store.table.history().iloc[-1]
+    assert (commit["operation"], commit["files_removed"]) == ("upsert", 1)
+
+
+def test_upsert_needs_the_period_column(helpers, datalake):
+    with pytest.raises(ValueError):
+        open_store(helpers).upsert(month("2022-01-01", 1), keys=["OdsCode"])
+
+
+def test_upsert_frame(helpers):
+    existing = pd.DataFrame({"key": [1, 2], "value": ["a", "b"]})
+    new = pd.DataFrame({"key": [2, 3, 3], "value": ["B", "c", "C"]})
+    result = helpers["datalake_upsertFrame"](existing, new, ["key"])
+    assert result.to_dict("list") == {"key": [1, 2, 3], "value": ["a", "B", "C"]}
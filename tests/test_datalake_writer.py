@@ -0,0 +1,48 @@
+import gc
+
+import pandas as pd
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+def open_writer(helpers, block_size=4):
+    return helpers["datalake_openWriter"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/", "data.bin", block_size=block_size, max_concurrency=2)
+
+
+def test_blocks_are_committed_on_close(helpers, datalake):
+    with open_writer(helpers) as writer:
+        writer.write(b"0123456789")
+        with pytest.raises(FileNotFoundError):
+            datalake.properties(CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/data.bin")
+    data, etag = datalake.download(CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/data.bin")
+    assert data == b"0123456789" and writer.etag == etag
+    assert helpers["datalake_latestFolder"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/") == "2022-06-01/"
+    log = helpers["datalake_ioLog"]()
+    assert log.loc[log["op"] == "upload", "bytes"].tolist() == [10]
+
+
+def test_dataframe_writers_stream_into_it(helpers, datalake):
+    df = pd.DataFrame({"value": range(1000)})
+    with open_writer(helpers, block_size=1024) as writer:
+        df.to_parquet(writer, engine="pyarrow", index=False)
+    result = helpers["datalake_read_parquet"](CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/", "data.bin")
+    assert result.equals(df)
+
+
+def test_exception_in_with_block_discards_the_file(helpers, datalake):
+    with pytest.raises(RuntimeError):
+        with open_writer(helpers) as writer:
+            writer.write(b"0123456789")
+            raise RuntimeError("failed half way")
+    with pytest.raises(FileNotFoundError):
+        datalake.properties(CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/data.bin")
+
+
+def test_dropped_writer_discards_the_file(helpers, datalake):
+    writer = open_writer(helpers)
+    writer.write(b"0123456789")
+    del writer
+    gc.collect()
+    with pytest.raises(FileNotFoundError):
+        datalake.properties(CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/data.bin")
@@ -0,0 +1,201 @@
+import io
+import threading
+
+import pandas as pd
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+
+class FakeRunner:
+    """Stands in for dbutils.notebook.run, recording what ran and failing on request."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.started = []
+        self.finished = []
+        self._lock = threading.Lock()
+
+    def __call__(self, notebook, timeout_seconds):
+        with self._lock:
+            self.started.append((notebook, list(self.finished)))
+        if notebook in self.fail:
+            raise RuntimeError("{} broke".format(notebook))
+        with self._lock:
+            self.finished.append(notebook)
+        return notebook + " done"
+
+    def ran(self):
+        return sorted(notebook for notebook, finished in self.started)
+
+
+def project_config(notebooks, **project):
+    return {"pipeline": {"adl_file_system": FILE_SYSTEM, "project": dict(project, databricks=notebooks)}}
+
+
+def test_notebooks_wait_for_their_dependencies(helpers, datalake):
+    notebooks = [
+        {"databricks_notebook": "/nb/a"},
+        {"databricks_notebook": "/nb/b", "depends_on": ["a"]},
+        {"databricks_notebook": "/nb/c", "depends_on": ["/nb/a", "b"]},
+        {"databricks_notebook": "/nb/d"},
+    ]
+    runner = FakeRunner()
+    results = helpers["orchestrator_runNotebooks"](notebooks, run_notebook=runner, max_parallel=2)
+
+    assert results == {notebook: notebook + " done" for notebook in ["/nb/a", "/nb/b", "/nb/c", "/nb/d"]}
+    started = dict(runner.started)
+    assert "/nb/a" in started["/nb/b"]
+    assert {"/nb/a", "/nb/b"} <= set(started["/nb/c"])
+
+
+def test_failure_stops_downstream_notebooks(helpers, datalake):
+    notebooks = [
+        {"databricks_notebook": "/nb/a"},
+        {"databricks_notebook": "/nb/b", "depends_on": ["a"]},
+        {"databricks_notebook": "/nb/c", "depends_on": ["b"]},
+    ]
+    runner = FakeRunner(fail=["/nb/b"])
+    with pytest.raises(Exception, match="/nb/b failed"):
+        helpers["orchestrator_runNotebooks"](notebooks, run_notebook=runner)
+    assert runner.ran() == ["/nb/a", "/nb/b"]
+
+
+def test_cycles_are_rejected(helpers):
+    notebooks = [
+        {"databricks_notebook": "/nb/a", "depends_on": ["b"]},
+        {"databricks_notebook": "/nb/b", "depends_on": ["a"]},
+    ]
+    with pytest.raises(ValueError):
+        helpers["orchestrator_buildGraph"](notebooks)
+
+
+def test_resume_reruns_only_what_did_not_succeed(helpers, datalake):
+    notebooks = [
+        {"databricks_notebook": "/nb/a"},
+        {"databricks_notebook": "/nb/b", "depends_on": ["a"]},
+        {"databricks_notebook": "/nb/c", "depends_on": ["b"]},
+        {"databricks_notebook": "/nb/d"},
+    ]
+    config = project_config(notebooks)
+    state = helpers["orchestrator_loadState"](CONNECTION_STRING, config, "test")
+    with pytest.raises(Exception):
+        helpers["orchestrator_runNotebooks"](notebooks, run_notebook=FakeRunner(fail=["/nb/b"]), state=state, max_parallel=1)
+    assert state.last_run["status"] == "failed"
+
+    state = helpers["orchestrator_loadState"](CONNECTION_STRING, config, "test")
+    runner = FakeRunner()
+    helpers["orchestrator_runNotebooks"](notebooks, run_notebook=runner, state=state, resume=True)
+    assert runner.ran() == ["/nb/b", "/nb/c"]
+    assert sorted(state.resumed) == ["/nb/a", "/nb/d"]
+    assert state.last_run["status"] == "succeeded"
+
+    runner = FakeRunner()
+    helpers["orchestrator_runNotebooks"](notebooks, run_notebook=runner, state=helpers["orchestrator_loadState"](CONNECTION_STRING, config, "test"), resume=True)
+    assert runner.ran() == ["/nb/a", "/nb/b", "/nb/c", "/nb/d"]
+
+
+def test_unchanged_notebooks_are_skipped(helpers, datalake, tmp_path):
+    notebook = str(tmp_path / "metric")
+    with open(notebook + ".py", "w") as f:
+        f.write("df = datalake_download(CONNECTION_STRING, file_system, "
+                "config_JSON['pipeline']['project']['source_path'] + latest_folder, config_JSON['pipeline']['project']['source_file'])\n")
+    notebooks = [{"databricks_notebook": notebook}, {"databricks_notebook": "/nb/downstream", "depends_on": ["metric"]}]
+    config = project_config(notebooks, source_path="proc/project/", source_file="data.csv")
+
+    def upload(contents):
+        helpers["datalake_upload"](io.StringIO(contents), CONNECTION_STRING, FILE_SYSTEM, "proc/project/2022-06-01/", "data.csv")
+
+    def run():
+        state = helpers["orchestrator_loadState"](CONNECTION_STRING, config, "test")
+        runner = FakeRunner()
+        helpers["orchestrator_runNotebooks"](notebooks, run_notebook=runner, state=state)
+        return runner.ran(), state.skipped
+
+    upload("a\n1\n")
+    assert run() == (sorted([notebook, "/nb/downstream"]), [])
+    assert run() == (["/nb/downstream"], [notebook])
+    upload("a\n2\n")
+    assert run() == (sorted([notebook, "/nb/downstream"]), [])
+
+
+def test_dbutils_runs_record_io_from_storage_metadata(helpers, datalake, tmp_path):
+    notebook = str(tmp_path / "metric")
+    with open(notebook + ".py", "w") as f:
+        f.write("df = datalake_read_parquet(CONNECTION_STRING, file_system, "
+                "config_JSON['pipeline']['project']['source_path'] + latest_folder, config_JSON['pipeline']['project']['source_file'])\n")
+    item = {"databricks_notebook": notebook, "sink_path": "proc/metric/", "sink_file": "metric.parquet"}
+    config = project_config([item], source_path="proc/project/", source_file="data.parquet")
+
+    def upload_parquet(df, sink_path, sink_file):
+        file_contents = io.BytesIO()
+        df.to_parquet(file_contents, engine="pyarrow", index=False)
+        helpers["datalake_upload"](file_contents, CONNECTION_STRING, FILE_SYSTEM, sink_path, sink_file)
+        return file_contents.getbuffer().nbytes
+
+    bytes_read = upload_parquet(pd.DataFrame({"value": [1, 2, 3]}), "proc/project/2022-06-01/", "data.parquet")
+    written = []
+
+    def runner(notebook, timeout_seconds):
+        # the notebook runs in another process and leaves only its output behind
+        written.append(upload_parquet(pd.DataFrame({"value": [6]}), "proc/metric/2022-06-01/", "metric.parquet"))
+
+    state = helpers["orchestrator_loadState"](CONNECTION_STRING, config, "test")
+    helpers["orchestrator_runNotebooks"]([item], run_notebook=runner, state=state)
+    telemetry = state.telemetry_history().iloc[-1]
+    assert (telemetry["rows_in"], telemetry["bytes_read"]) == (3, bytes_read)
+    assert (telemetry["rows_out"], telemetry["bytes_written"]) == (1, written[0])
+    assert telemetry["peak_memory_delta_bytes"] >= 0
+    assert telemetry["concurrent_notebooks"] == 0
+    assert not telemetry["in_process"]
+
+
+def test_every_run_records_memory(helpers, datalake):
+    notebooks = [{"databricks_notebook": "/nb/a"}, {"databricks_notebook": "/nb/b"}]
+    barrier = threading.Barrier(2)
+
+    def runner(notebook, timeout_seconds):
+        barrier.wait(timeout=5)
+
+    state = helpers["orchestrator_loadState"](CONNECTION_STRING, project_config(notebooks), "test")
+    helpers["orchestrator_runNotebooks"](notebooks, run_notebook=runner, state=state, max_parallel=2)
+    telemetry = state.telemetry_history()
+    assert telemetry["peak_memory_delta_bytes"].notna().all()
+    assert list(telemetry["concurrent_notebooks"]) == [1, 1]
+
+
+def test_report_flags_memory_growth(helpers, datalake, monkeypatch):
+    state = helpers["orchestrator_loadState"](CONNECTION_STRING, project_config([]), "test")
+    history = pd.DataFrame({
+        "notebook": ["/nb/a"] * 4,
+        "status": ["succeeded"] * 4,
+        "started": pd.date_range("2022-06-01", periods=4),
+        "seconds": [10.0, 10.0, 10.0, 10.0],
+        "peak_memory_delta_bytes": [100, 100, 100, 400],
+        "concurrent_notebooks": [0, 0, 0, 0],
+    })
+    monkeypatch.setattr(state, "telemetry_history", lambda: history)
+    report = helpers["orchestrator_telemetryReport"](state)
+    assert report.loc[0, "peak_memory_delta_bytes_ratio"] == 4
+    assert report.loc[0, "regression"]
+
+
+def test_in_process_timeout_cancels_later_writes(helpers, datalake, tmp_path, monkeypatch):
+    notebook = str(tmp_path / "slow")
+    with open(notebook + ".py", "w") as f:
+        f.write("started.set()\n"
+                "release.wait(5)\n"
+                "try:\n"
+                "    datalake_upload(io.StringIO('a\\n1\\n'), CONNECTION_STRING, 'test', 'proc/slow/2022-06-01/', 'data.csv')\n"
+                "finally:\n"
+                "    finished.set()\n")
+    started, release, finished = threading.Event(), threading.Event(), threading.Event()
+    run = helpers["notebook_load"](notebook, dict(helpers, io=io, CONNECTION_STRING=CONNECTION_STRING))
+    monkeypatch.setitem(helpers, "notebook_load", lambda notebook: lambda: run(started=started, release=release, finished=finished))
+    with pytest.raises(TimeoutError, match="cancelled"):
+        helpers["notebook_runInProcess"](notebook, timeout_seconds=0.2)
+    assert started.is_set()
+    release.set()
+    assert finished.wait(5)
+    with pytest.raises(FileNotFoundError):
+        datalake.properties(CONNECTION_STRING, FILE_SYSTEM, "proc/slow/2022-06-01/data.csv")
@@ -0,0 +1,67 @@
+import io
+import json
+
+import pytest
+
+from conftest import CONNECTION_STRING, FILE_SYSTEM
+
+CONFIG = {
+    "pipeline": {
+        "adl_file_system": FILE_SYSTEM,
+        "project": {
+            "source_path": "proc/project/",
+            "databricks": [
+                {"databricks_notebook": "/Repos/prod/analytics/dbrks_metric_a", "sink_path": "proc/a/", "sink_file": "a.csv"},
+                {"databricks_notebook": "/Repos/prod/analytics/dbrks_metric_b.py", "depends_on": "dbrks_metric_a", "timeout_seconds": 60},
+            ],
+        },
+        "staging": {"databricks": [{"databricks_notebook": "/Repos/prod/staging/dbrks_stage"}]},
+    }
+}
+
+
+def upload_config(helpers, config, file_name):
+    helpers["datalake_upload"](io.StringIO(json.dumps(config)), CONNECTION_STRING, FILE_SYSTEM, "config/pipelines/", file_name)
+
+
+def test_notebook_entries_are_looked_up_by_name(helpers, datalake):
+    config = helpers["PipelineConfig"](CONFIG)
+    metric_a = config.project.notebook("dbrks_metric_a")
+    assert (metric_a.sink_path, metric_a.sink_file) == ("proc/a/", "a.csv")
+    metric_b = config.notebook("/Repos/prod/analytics/dbrks_metric_b")
+    assert (metric_b.depends_on, metric_b.timeout_seconds) == (("dbrks_metric_a",), 60)
+    assert config.notebook("dbrks_stage").databricks_notebook == "/Repos/prod/staging/dbrks_stage"
+    assert config.project["source_path"] == "proc/project/"
+    with pytest.raises(KeyError, match="dbrks_metric_a, dbrks_metric_b, dbrks_stage"):
+        config.notebook("dbrks_missing")
+
+
+@pytest.mark.parametrize("pipeline, message", [
+    ({}, "missing 'pipeline'"),
+    ({"pipeline": {"project": {"databricks": [{"sink_path": "proc/"}]}}}, "databricks_notebook"),
+    ({"pipeline": {"project": {"databricks": [{"databricks_notebook": "/nb/a", "depends_on": [1]}]}}}, "depends_on"),
+    ({"pipeline": {"project": {"databricks": [{"databricks_notebook": "/nb/a", "timeout_seconds": "60"}]}}}, "timeout_seconds"),
+])
+def test_invalid_configs_are_rejected(helpers, pipeline, message):
+    with pytest.raises(helpers["PipelineConfigError"], match=message):
+        helpers["PipelineConfig"](pipeline)
+
+
+def test_configs_are_loaded_once_per_process(helpers, datalake):
+    upload_config(helpers, CONFIG, "config_cached_dbrks.json")
+    config = helpers["datalake_loadConfig"](CONNECTION_STRING, FILE_SYSTEM, "config/pipelines/", "config_cached_dbrks.json")
+    helpers["datalake_ioReset"]()
+    assert helpers["datalake_loadConfig"](CONNECTION_STRING, FILE_SYSTEM, "config/pipelines/", "config_cached_dbrks.json") is config
+    assert helpers["datalake_ioLog"]().empty
+
+    changed = dict(CONFIG, pipeline=dict(CONFIG["pipeline"], adl_file_system="other"))
+    upload_config(helpers, changed, "config_cached_dbrks.json")
+    refreshed = helpers["datalake_loadConfig"](CONNECTION_STRING, FILE_SYSTEM, "config/pipelines/", "config_cached_dbrks.json", refresh=True)
+    assert refreshed.file_system == "other"
+
+
+def test_json_returns_a_fresh_copy(helpers):
+    config = helpers["PipelineConfig"](CONFIG)
+    config_JSON = config.json()
+    config_JSON["pipeline"]["project"]["source_path"] = "changed/"
+    assert config.json()["pipeline"]["project"]["source_path"] == "proc/project/"